@@ -0,0 +1,478 @@
+# dev/bench.py
+# Benchmarks for the hot paths of eon
+#
+# Usage:
+#    python dev/bench.py                          # run and print
+#    python dev/bench.py -o results.json          # also save the results
+#    python dev/bench.py -b dev/baseline.json     # compare to a baseline
+#    python dev/bench.py -o dev/baseline.json     # store a new baseline
+#    python dev/bench.py -k contains -k months    # only matching benchmarks
+#    python dev/bench.py -a 2be4b03               # compare to an old eon
+#
+# Every benchmark reports its throughput (operations per second, where an
+# operation is one call, or one yielded value for generators), the median
+# and 95th percentile latency of a call, and the peak memory allocated by
+# one call. When comparing, a benchmark regresses if its median latency
+# grew by more than the threshold (20% by default) and by more than the
+# noise of either run (the gap between its median and 95th percentile),
+# and the exit status is 1 so that the suite can gate a build.
+#
+# Timings from different machines or Python versions are not comparable,
+# so baselines should be recorded on the machine that checks them. To
+# compare against an older eon directly, --against runs the same suite on
+# the eon/ of a git revision, side by side with the working tree. The peak
+# memory of the init.* benchmarks is that of building one DateRange.
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Where eon is imported from: the working tree, or an exported revision
+# when run by --against
+EON_PATH = os.environ.get('EON_BENCH_PATH',ROOT)
+sys.path.insert(0,EON_PATH)
+
+import eon
+from eon import DateRange
+
+_BENCHMARKS = []
+
+
+def benchmark(name,ops=1):
+    # DESCRIPTION:
+    #    Register a benchmark. The decorated function does any setup and
+    #    returns the zero-argument callable to be timed.
+    #
+    # PARAMS:
+    #    name: str
+    #    [ops=1]: int | None
+    #       Operations performed by one call of the timed callable, e.g.
+    #       the number of values a generator yields. None when setup
+    #       returns (callable, ops) instead, for counts that are costly to
+    #       find and should only be found if the benchmark runs.
+    def register(setup):
+        _BENCHMARKS.append((name,ops,setup))
+        return setup
+    return register
+
+
+#----------------------------------------------------------------
+#|                          Fixtures                            |
+#----------------------------------------------------------------
+
+D1,D2 = datetime.date(2001,3,4),datetime.date(2011,9,12)
+T1,T2 = datetime.datetime(2001,3,4,5,6,7),datetime.datetime(2011,9,12,1,2,3)
+DATES = DateRange(D1,D2)
+DATETIMES = DateRange(T1,T2)
+TD = datetime.timedelta(days=45,hours=3)
+
+
+def _drain(gen):
+    for _ in gen:
+        pass
+
+
+#----------------------------------------------------------------
+#|                        Construction                          |
+#----------------------------------------------------------------
+
+@benchmark('init.dates')
+def _():
+    return lambda: DateRange(D1,D2)
+
+
+@benchmark('init.datetimes')
+def _():
+    return lambda: DateRange(T1,T2)
+
+
+@benchmark('init.timedelta')
+def _():
+    return lambda: DateRange(T1,TD)
+
+
+@benchmark('init.unbounded')
+def _():
+    return lambda: DateRange(T1,None)
+
+
+@benchmark('bounds.start.dates')
+def _():
+    return DATES.start
+
+
+@benchmark('bounds.start.datetimes')
+def _():
+    return DATETIMES.start
+
+
+@benchmark('bounds.end.datetimes')
+def _():
+    return DATETIMES.end
+
+
+#----------------------------------------------------------------
+#|                   Containment and overlap                    |
+#----------------------------------------------------------------
+
+@benchmark('contains.date.hit')
+def _():
+    d = datetime.date(2005,1,1)
+    return lambda: d in DATES
+
+
+@benchmark('contains.date.miss')
+def _():
+    d = datetime.date(2015,1,1)
+    return lambda: d in DATES
+
+
+@benchmark('contains.datetime.hit')
+def _():
+    d = datetime.datetime(2005,1,1,12)
+    return lambda: d in DATETIMES
+
+
+@benchmark('contains.datetime.miss')
+def _():
+    d = datetime.datetime(2015,1,1,12)
+    return lambda: d in DATETIMES
+
+
+@benchmark('contains.daterange')
+def _():
+    dr = DateRange(datetime.datetime(2005,1,1),datetime.datetime(2006,1,1))
+    return lambda: dr in DATETIMES
+
+
+@benchmark('intersection.overlap')
+def _():
+    dr = DateRange(datetime.datetime(2005,1,1),datetime.datetime(2016,1,1))
+    return lambda: DATETIMES.intersection(dr)
+
+
+@benchmark('intersection.disjoint')
+def _():
+    dr = DateRange(datetime.datetime(2015,1,1),datetime.datetime(2016,1,1))
+    return lambda: DATETIMES.intersection(dr)
+
+
+#----------------------------------------------------------------
+#|                          Generators                          |
+#----------------------------------------------------------------
+# Each range is sized to yield a few thousand values
+
+_HOURS = DateRange(T1,T1 + datetime.timedelta(days=200))
+_YEARS = DateRange(datetime.datetime(10,1,1),datetime.datetime(9990,1,1))
+
+_GENERATORS = [
+    ('cycles',DATETIMES,
+        lambda dr: dr.cycles(datetime.timedelta(hours=30))),
+    ('hours',_HOURS,lambda dr: dr.hours()),
+    ('days',DATETIMES,lambda dr: dr.days()),
+    ('pentads',DATETIMES,lambda dr: dr.pentads()),
+    ('pentads.snap',DATETIMES,lambda dr: dr.pentads(snap=True)),
+    ('months',_YEARS,lambda dr: dr.months(n=5000)),
+    ('years',_YEARS,lambda dr: dr.years()),
+    ('rdays',DATETIMES,lambda dr: dr.rdays()),
+    ('rpentads',DATETIMES,lambda dr: dr.rpentads()),
+    ('rmonths',_YEARS,lambda dr: dr.rmonths(n=5000)),
+    ('ryears',_YEARS,lambda dr: dr.ryears()),
+]
+
+
+def _generator_benchmark(name,dr,make):
+    def setup():
+        return (lambda: _drain(make(dr))),sum(1 for _ in make(dr))
+    benchmark('generator.'+name,ops=None)(setup)
+
+
+for _args in _GENERATORS:
+    _generator_benchmark(*_args)
+
+
+#----------------------------------------------------------------
+#|                   Module-level helpers                       |
+#----------------------------------------------------------------
+
+@benchmark('helpers.date_to_dayofyear')
+def _():
+    return lambda: eon.date_to_dayofyear(D2)
+
+
+@benchmark('helpers.date_to_pentad')
+def _():
+    return lambda: eon.date_to_pentad(T2)
+
+
+@benchmark('helpers.pentad_to_date')
+def _():
+    return lambda: eon.pentad_to_date(2012,40)
+
+
+@benchmark('helpers.pentad_to_datetime')
+def _():
+    return lambda: eon.pentad_to_datetime(2012,80)
+
+
+@benchmark('helpers.pentad_to_daterange')
+def _():
+    return lambda: eon.pentad_to_daterange(2012,73)
+
+
+@benchmark('helpers.month_to_daterange')
+def _():
+    return lambda: eon.month_to_daterange(2012,12)
+
+
+@benchmark('helpers.bound_pentad')
+def _():
+    return lambda: eon.bound_pentad(-80,2012)
+
+
+#----------------------------------------------------------------
+#|                           Running                            |
+#----------------------------------------------------------------
+
+def _import_time(repeat):
+    # DESCRIPTION:
+    #    Time `import eon` in fresh interpreters, so nothing is cached.
+    #
+    # RETURNS:
+    #    list of float seconds
+    code = ('import time; t = time.perf_counter(); import eon; '+
+            'print(time.perf_counter() - t)')
+    env = dict(os.environ,PYTHONPATH=EON_PATH)
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable,'-c',code],env=env,check=True,
+                             stdout=subprocess.PIPE,universal_newlines=True)
+        times.append(float(out.stdout))
+    return times
+
+
+def _peak_memory(fn):
+    # Peak bytes allocated by a single call, after one untraced call so that
+    # caches filled on first use are not counted
+    fn()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _summarize(times,ops,peak):
+    # Per-call latencies -> the recorded statistics
+    times = sorted(times)
+    median = statistics.median(times)
+    return { 'ops': ops,
+             'throughput': ops/median if median > 0 else None,
+             'median': median,
+             'p95': times[min(len(times) - 1,int(0.95*len(times)))],
+             'min': times[0],
+             'peak_memory': peak }
+
+
+def run_benchmark(name,ops,setup,repeat=20,min_time=0.02):
+    # DESCRIPTION:
+    #    Time one benchmark.
+    #
+    # PARAMS:
+    #    name: str
+    #    ops: int | None
+    #    setup: callable returning the callable to time, or (callable, ops)
+    #       if ops is None
+    #    [repeat=20]: int
+    #       Number of samples. Each sample loops the callable enough times
+    #       to last about min_time seconds, and its mean is one latency.
+    #    [min_time=0.02]: float
+    #
+    # RETURNS:
+    #    dict of the statistics described at the top of this file
+    fn = setup()
+    if ops is None:
+        fn,ops = fn
+    timer = timeit.Timer(fn)
+    number,_ = timer.autorange()
+    number = max(1,int(number*min_time/0.2))
+    times = [t/number for t in timer.repeat(repeat=repeat,number=number)]
+    return _summarize(times,ops,_peak_memory(fn))
+
+
+def run(patterns=(),repeat=20):
+    # DESCRIPTION:
+    #    Run every benchmark whose name contains one of `patterns` (or all
+    #    of them), plus the import time unless it is filtered out.
+    #
+    # RETURNS:
+    #    dict of results ready to be written as JSON
+    def selected(name):
+        return not patterns or any(p in name for p in patterns)
+
+    results = {}
+    if selected('import'):
+        times = _import_time(max(5,repeat//2))
+        results['import'] = _summarize(times,1,None)
+    for name,ops,setup in _BENCHMARKS:
+        if selected(name):
+            try:
+                results[name] = run_benchmark(name,ops,setup,repeat=repeat)
+            except AttributeError:
+                # A feature this eon does not have (see --against)
+                continue
+
+    return { 'meta': { 'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'machine': platform.machine(),
+                       'platform': platform.platform(),
+                       'time': datetime.datetime.now(
+                           datetime.timezone.utc).isoformat() },
+             'results': results }
+
+
+def compare(current,baseline,threshold=0.2):
+    # DESCRIPTION:
+    #    Compare the median latency of each benchmark found in both runs.
+    #
+    # RETURNS:
+    #    (rows, regressions): rows are (name, baseline time, current time,
+    #    ratio) and regressions are the names whose ratio exceeds
+    #    1 + threshold and whose slowdown also exceeds the noise floor
+    #
+    # NOTES:
+    #    The noise floor is the larger gap between median and 95th
+    #    percentile of the two runs, so a benchmark whose samples scatter
+    #    widely on a busy machine needs a larger slowdown to be flagged.
+    rows = []
+    regressions = []
+    for name,result in sorted(current['results'].items()):
+        old = baseline['results'].get(name)
+        if old is None or not old['median']:
+            continue
+        ratio = result['median']/old['median']
+        rows.append((name,old['median'],result['median'],ratio))
+        noise = max(old['p95'] - old['median'],
+                    result['p95'] - result['median'])
+        if ratio > 1 + threshold and (
+           result['median'] - old['median'] > noise):
+            regressions.append(name)
+    return rows,regressions
+
+
+def run_revision(rev,patterns=(),repeat=20):
+    # DESCRIPTION:
+    #    Run the suite against eon as of a git revision, in a fresh
+    #    interpreter, with its eon/ exported into a temporary directory.
+    #    Benchmarks of features that revision lacks are left out.
+    #
+    # RETURNS:
+    #    dict of results, as run()
+    archive = subprocess.run(['git','-C',ROOT,'archive',rev,'eon'],
+                             check=True,stdout=subprocess.PIPE).stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tmp)
+        out = os.path.join(tmp,'results.json')
+        # Old revisions may not compile warning-free on this Python
+        cmd = [sys.executable,'-W','ignore::SyntaxWarning',
+               os.path.abspath(__file__),'-o',out,'-r',str(repeat)]
+        for p in patterns:
+            cmd += ['-k',p]
+        subprocess.run(cmd,env=dict(os.environ,EON_BENCH_PATH=tmp),
+                       check=True,stdout=subprocess.DEVNULL)
+        with open(out) as f:
+            return json.load(f)
+
+
+def _format_time(seconds):
+    for unit,scale in (('s',1),('ms',1e-3),('us',1e-6)):
+        if seconds >= scale:
+            return '%.3g %s' % (seconds/scale,unit)
+    return '%.3g ns' % (seconds/1e-9)
+
+
+def _format_bytes(n):
+    if n is None:
+        return '-'
+    for unit,scale in (('MiB',2**20),('KiB',2**10)):
+        if n >= scale:
+            return '%.3g %s' % (n/scale,unit)
+    return '%d B' % n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark eon.')
+    parser.add_argument('-o','--output',
+        help='write the results to this JSON file')
+    parser.add_argument('-b','--baseline',
+        help='compare against the results in this JSON file')
+    parser.add_argument('-t','--threshold',type=float,default=0.2,
+        help='allowed slowdown relative to the baseline [0.2]')
+    parser.add_argument('-a','--against',metavar='REV',
+        help='also run the suite on eon as of this git revision and '+
+             'show the two side by side')
+    parser.add_argument('-k',dest='patterns',action='append',default=[],
+        help='only run benchmarks whose name contains this (repeatable)')
+    parser.add_argument('-r','--repeat',type=int,default=20,
+        help='samples per benchmark [20]')
+    args = parser.parse_args(argv)
+
+    current = run(args.patterns,repeat=args.repeat)
+
+    print('%-34s %12s %12s %12s %10s' % ('benchmark','ops/s','median','p95',
+                                          'peak mem'))
+    for name,r in current['results'].items():
+        print('%-34s %12.4g %12s %12s %10s' % (name,r['throughput'],
+            _format_time(r['median']),_format_time(r['p95']),
+            _format_bytes(r['peak_memory'])))
+
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump(current,f,indent=2,sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows,regressions = compare(current,baseline,args.threshold)
+        print()
+        print('%-34s %12s %12s %8s' % ('benchmark','baseline','current',
+                                        'ratio'))
+        for name,old,new,ratio in rows:
+            flag = '  <-- slower' if name in regressions else ''
+            print('%-34s %12s %12s %8.2f%s' % (name,_format_time(old),
+                _format_time(new),ratio,flag))
+        if regressions:
+            print('\n'+str(len(regressions))+' regression(s) beyond '+
+                  str(int(args.threshold*100))+'%')
+            return 1
+
+    if args.against:
+        old = run_revision(args.against,args.patterns,args.repeat)
+        print()
+        print('%-34s %12s %12s %8s %10s %10s' % ('benchmark',
+            args.against[:12],'current','speedup','old mem','mem'))
+        for name,r in current['results'].items():
+            o = old['results'].get(name)
+            if o is None:
+                continue
+            print('%-34s %12s %12s %8.2f %10s %10s' % (name,
+                _format_time(o['median']),_format_time(r['median']),
+                o['median']/r['median'],_format_bytes(o['peak_memory']),
+                _format_bytes(r['peak_memory'])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,20 +6,94 @@ sys.dont_write_bytecode = True
 __author__ = "Michael Vijay Saha"
 
 import datetime
+import itertools
+import warnings
+
+# Bounds are stored internally as integer ticks rather than date objects:
+#    datetime.date     -> proleptic Gregorian ordinal (date.toordinal())
+#    datetime.datetime -> microseconds since the start of ordinal day 0, so
+#                         that ticks // _DAY_TICKS == toordinal()
+# An unbounded side is stored as None.
+_EPOCH = datetime.datetime(1,1,1)
+_TICK = datetime.timedelta(microseconds=1)
+_DAY_TICKS = 86400000000
+_RESOLUTION = { datetime.date: datetime.timedelta(days=1),
+                datetime.datetime: datetime.timedelta(microseconds=1) }
+_NEG_INF = float('-inf')
+_POS_INF = float('inf')
+# Range of valid ticks for each date class, matching date[time].min/max
+_MIN_TICKS = { datetime.date: 1, datetime.datetime: _DAY_TICKS }
+_MAX_TICKS = { datetime.date: datetime.date.max.toordinal(),
+               datetime.datetime: (datetime.date.max.toordinal()+1)*
+                                  _DAY_TICKS - 1 }
+
+
+def _is_a(d,dateclass):
+    # Whether d is a dateclass, subclasses included, without taking a
+    # datetime for a date
+    return isinstance(d,dateclass) and (dateclass is datetime.datetime or
+                                        not isinstance(d,datetime.datetime))
+
+
+def _naive(d):
+    # DESCRIPTION:
+    #    Take an aware datetime as naive UTC, with a DeprecationWarning.
+    #
+    # NOTES:
+    #    DateRange used to hold aware datetimes as given. Since bounds became
+    #    ticks they are converted to UTC instead, so comparisons between
+    #    zones still agree, but the values read back are naive. This will
+    #    become a TypeError; eon.tz.ZonedDateRange handles zones properly.
+    warnings.warn('Aware datetimes in a DateRange are deprecated and are '+
+        'taken as naive UTC; use eon.tz.ZonedDateRange instead',
+        DeprecationWarning,stacklevel=3)
+    offset = d.utcoffset()
+    d = d.replace(tzinfo=None)
+    return d if offset is None else d - offset
+
+
+def _to_ticks(d,dateclass):
+    # Convert a date[time] to integer ticks of `dateclass`.
+    #
+    # RAISES:
+    #    TypeError: if d is not of type dateclass (or a subclass of it)
+    if type(d) is not dateclass and not _is_a(d,dateclass):
+        raise TypeError('Cannot compare '+str(type(d))+' to '+str(dateclass))
+    if dateclass is datetime.datetime:
+        try:
+            x = d - _EPOCH
+        except TypeError:
+            # Aware (deprecated)
+            x = _naive(d) - _EPOCH
+        return ((x.days+1)*86400 + x.seconds)*1000000 + x.microseconds
+    return d.toordinal()
+
+
+def _from_ticks(t,dateclass):
+    # Inverse of _to_ticks. None (unbounded) passes through unchanged.
+    if t is None:
+        return None
+    if dateclass is datetime.datetime:
+        return _EPOCH + _TICK*(t-_DAY_TICKS)
+    return datetime.date.fromordinal(t)
+
 
 """A line segment (or ray, or line) on the arrow of time."""
 class DateRange:
-    
+
+    # _start and _end cache the bounds as date[time]s (None until needed)
+    __slots__ = ('_lo','_hi','_dateclass','_start','_end')
+
     def __init__(self,date1,date2=None):
         """Build a DateRange object.
-        
+
         Args:
             date1: datetime.date[time] | None | DateRange
                One time bound (not necesarily the first one chronologically)
                or a DateRange object (in which case date2 is not needed).
-        
+
             date2: [None] | datetime.date[time] | None | datetime.timedelta
-               Another time bound or a time period. If `date1` is a 
+               Another time bound or a time period. If `date1` is a
                `datetime.date[time]`, then a `datetime.timedelta` is also valid,
                in which case `end` will be computed.
 
@@ -28,97 +102,237 @@ class DateRange:
             If both `date1` and `date2` are dates, they must have identical
             types. `date1` and `date2` will be reordered so that , so `date1`
             does not necessarily need to be before date2. `None` is used to indicate
-            unbounded values. 
-            
+            unbounded values.
+
             If 'date2' is a timedelta it can be negative.
-        
+
+            Bounds are held as integer ticks (day ordinals for dates,
+            microseconds for datetimes) in `__slots__`, so a DateRange carries
+            no instance `__dict__`. The bounds are also kept as
+            date[time]s once known, so that start(), end() and `in` do not
+            convert them again.
+
+            Aware datetimes are deprecated. They are converted to naive UTC
+            with a DeprecationWarning, and will raise a TypeError in a
+            future release; use `eon.tz.ZonedDateRange` for time zones.
+
         Raises:
             TypeError: if date1 is not a `datetime.date[time]` or `DateRange`.
             TypeError: if date2 is not a `datetime.timedelta` or `type(date1)`.
             ValueError: if `date2` is not `None` when `date1` is a `DateRange`.
-            
+
         Examples:
             >>>import datetime
             >>>DateRange(datetime.datetime(2012,1,1),datetime.datetime(2012,1,3))
-            
+
         """
-        
-        self._start = None # Set these so that we can use validate()
-        self._end = None
-        
+
         # Construction by DateRange (a special case)
-        if isinstance(date1,type(self)):
+        if isinstance(date1,DateRange):
             if date2 is not None:
                 raise ValueError('If date1 is a DateRange then date2 must'+
                     'be left empty')
-            else:
-                self._start = date1.start()
-                self._end =   date1.end()
-
-        else:
-            if self._validate(date1):
-                self._start = date1
-            else:
-                raise TypeError('date1 must be None or datetime.date(time)')
-
-            if self._validate(date2):
-                self._end = date2
+            self._lo = date1._lo
+            self._hi = date1._hi
+            self._dateclass = date1._dateclass
+            self._start = date1._start
+            self._end = date1._end
+            return
 
-            elif isinstance(date2,datetime.timedelta):
-                self._end = self._start + date2
+        if date1 is not None and not isinstance(date1,datetime.date):
+            raise TypeError('date1 must be None or datetime.date(time)')
 
-            else:
-                raise TypeError('date2 must be None, '+str(type(self._start))+
-                    'or datetime.timedelta, not '+str(type(date2)))
-
-        # If both bounds are finite order them chronologically
-        if (self._end is not None and
-            self._start is not None and
-            self._start>self._end):
+        if isinstance(date2,datetime.timedelta) and date1 is not None:
+            date2 = date1 + date2
 
-            self._end,self._start=self._start,self._end
+        elif not (date2 is None or
+                  (date1 is None and isinstance(date2,datetime.date)) or
+                  type(date2) is type(date1)):
+            raise TypeError('date2 must be None, '+str(type(date1))+
+                'or datetime.timedelta, not '+str(type(date2)))
 
         # Remember the type of date that we are storing
-        if self._start is not None:
-            self._dateclass = type(self._start)
+        if date1 is not None:
+            dateclass = type(date1)
+        elif date2 is not None:
+            dateclass = type(date2)
+        else:
+            dateclass = None
 
-        elif self._end is not None:
-            self._dateclass = type(self._end)
+        if dateclass is not None and dateclass not in _RESOLUTION:
+            raise TypeError()
 
+        # Inlined _to_ticks(): both bounds are of exactly dateclass here
+        if dateclass is datetime.datetime:
+            try:
+                x1 = None if date1 is None else date1 - _EPOCH
+                x2 = None if date2 is None else date2 - _EPOCH
+            except TypeError:
+                # Aware (deprecated)
+                if date1 is not None and date1.tzinfo is not None:
+                    date1 = _naive(date1)
+                if date2 is not None and date2.tzinfo is not None:
+                    date2 = _naive(date2)
+                x1 = None if date1 is None else date1 - _EPOCH
+                x2 = None if date2 is None else date2 - _EPOCH
+            lo = None if x1 is None else (
+                ((x1.days+1)*86400 + x1.seconds)*1000000 + x1.microseconds)
+            hi = None if x2 is None else (
+                ((x2.days+1)*86400 + x2.seconds)*1000000 + x2.microseconds)
         else:
-            self._dateclass = None
+            lo = None if date1 is None else date1.toordinal()
+            hi = None if date2 is None else date2.toordinal()
 
-        if self._dateclass is not None:
+        # If both bounds are finite order them chronologically
+        if lo is not None and hi is not None and lo > hi:
+            lo,hi = hi,lo
+            date1,date2 = date2,date1
+
+        self._lo = lo
+        self._hi = hi
+        self._dateclass = dateclass
+        self._start = date1
+        self._end = date2
+
+
+    @classmethod
+    def _fromticks(cls,lo,hi,dateclass):
+        # Build a DateRange straight from ordered integer ticks, skipping
+        # all of the validation in __init__.
+        dr = cls.__new__(cls)
+        dr._lo = lo
+        dr._hi = hi
+        dr._dateclass = dateclass
+        dr._start = dr._end = None
+        return dr
+
+
+    @classmethod
+    def trusted(cls,start,end):
+        # DESCRIPTION:
+        #    Build a DateRange from bounds that are already known to be
+        #    valid, skipping the checks and reordering of DateRange(). Use
+        #    it where bounds come from another DateRange or a trusted
+        #    source, e.g. in a tight loop.
+        #
+        # PARAMS:
+        #    start: datetime.date[time] | None
+        #    end: datetime.date[time] | None
+        #       Of exactly the same type, with start <= end. Nothing is
+        #       checked: other values give a broken DateRange.
+        #
+        # RETURNS:
+        #    DateRange
+        dr = cls.__new__(cls)
+        d = end if start is None else start
+        if d is None:
+            dr._lo = dr._hi = dr._dateclass = dr._start = dr._end = None
+            return dr
+
+        dateclass = type(d)
+        dr._start = start
+        dr._end = end
+        if dateclass is datetime.datetime:
+            if start is not None:
+                x = start - _EPOCH
+                start = ((x.days+1)*86400 + x.seconds)*1000000 + (
+                         x.microseconds)
+            if end is not None:
+                x = end - _EPOCH
+                end = ((x.days+1)*86400 + x.seconds)*1000000 + x.microseconds
+        else:
+            if start is not None:
+                start = start.toordinal()
+            if end is not None:
+                end = end.toordinal()
 
-            if self._dateclass is datetime.date:
-                self._resolution = datetime.timedelta(days=1)
+        dr._lo = start
+        dr._hi = end
+        dr._dateclass = dateclass
+        return dr
 
-            elif self._dateclass is datetime.datetime:
-                self._resolution = datetime.timedelta(microseconds=1)
 
-            else:
-                raise TypeError()
+    @classmethod
+    def frompairs(cls,starts,ends):
+        # DESCRIPTION:
+        #    Build many DateRanges at once from paired bounds.
+        #
+        # PARAMS:
+        #    starts: iterable of datetime.date[time] | None |
+        #            numpy.datetime64 array
+        #    ends: iterable of datetime.date[time] | None |
+        #          numpy.datetime64 array
+        #       One bound of each range each, as date1 and date2 of
+        #       DateRange(). Each pair is reordered chronologically. Arrays
+        #       are converted with eon.array.DateRangeArray, NaT being
+        #       unbounded.
+        #
+        # RETURNS:
+        #    list of DateRange
+        #
+        # NOTES:
+        #    The date class is found once, from the first bound, and every
+        #    other bound only has its type compared to it, so this is much
+        #    cheaper than calling DateRange() for each pair.
+        #
+        # RAISES:
+        #    TypeError: if the bounds are not all dates or all datetimes
+        #    ValueError: if starts and ends have different lengths
+        if type(starts).__module__ == 'numpy' or (
+           type(ends).__module__ == 'numpy'):
+            from eon.array import DateRangeArray
+            return DateRangeArray(starts,ends).toranges()
+
+        starts = list(starts)
+        ends = list(ends)
+        if len(starts) != len(ends):
+            raise ValueError('Got '+str(len(starts))+' starts and '+
+                str(len(ends))+' ends')
+
+        dateclass = None
+        for d in starts + ends:
+            if d is not None:
+                dateclass = type(d)
+                break
+        if dateclass is not None and dateclass not in _RESOLUTION:
+            raise TypeError('Bounds must be datetime.date(time), not '+
+                str(dateclass))
+
+        fromticks = cls._fromticks
+        out = []
+        for d1,d2 in zip(starts,ends):
+            lo = None if d1 is None else _to_ticks(d1,dateclass)
+            hi = None if d2 is None else _to_ticks(d2,dateclass)
+            if lo is not None and hi is not None and lo > hi:
+                lo,hi = hi,lo
+            out.append(fromticks(lo,hi,
+                                 None if lo is None and hi is None else
+                                 dateclass))
+        return out
+
+
+    @property
+    def _resolution(self):
+        # Smallest representable step for the stored date class
+        return _RESOLUTION.get(self._dateclass)
 
 
     def _validate(self,d):
         """ Ensure that a date is the same type as existing type.
-        
+
         [RETURNS]
             bool describing whether the input variable is of proper type
-            
+
         [RAISES]
             Nothing
         """
         if d is None:
             return True
 
-        if self._start is None:
-            if self._end is None: # If both are None
-                return isinstance(d,datetime.date)
-            else:
-                return isinstance(d,type(self._end))
+        if self._dateclass is None:
+            return isinstance(d,datetime.date)
         else:
-            return isinstance(d,type(self._start))
+            return isinstance(d,self._dateclass)
 
 
     def _cast(self,d):
@@ -157,13 +371,13 @@ class DateRange:
 
     def start(self,setdate=False):
         """Get or set the earliest bound for DateRange
-        
+
         [PARAMETERS]
             [setdate]: datetime.date[time] | None
-        
+
         RETURNS:
             [datetime.date[time]] if set is not specified (getter mode)
-        
+
         RAISES:
             TypeError: if setdate does not match type(end)
             ValueError: if setdate > end
@@ -172,73 +386,79 @@ class DateRange:
             setdate = self._cast(setdate)
 
             if setdate is None:
-                self._start = None
+                self._lo = None
 
-                if self.end() is None:
-                    self._nobounds = True
+            elif self._lo is None and self._hi is None:
+                raise TypeError('Can only set start to None or '+
+                    str(type(None))+', not '+str(type(setdate)))
 
-            elif isinstance(setdate,type(self.end())):
-                if setdate > self.end():
+            else:
+                t = _to_ticks(setdate,self._dateclass)
+                if self._hi is not None and t > self._hi:
                     raise ValueError('Cannot set start to be before end: '+
                         str(setdate))
 
-                self._start = setdate
-
-            elif self.end() is None and isinstance(setdate,type(self.start())):
-                self._start = setdate
-
-            else:
-                raise TypeError('Can only set start to None or '+
-                    str(type(self._end))+', not '+str(type(setdate)))
+                self._lo = t
 
+            self._start = None
             return self
 
-        else:
-            return self._start
+        # The bound is converted from ticks once, then kept
+        d = self._start
+        if d is None and self._lo is not None:
+            d = self._start = _from_ticks(self._lo,self._dateclass)
+        return d
 
 
     def end(self,setdate=False):
         """Get or set the latest bound for DateRange.
-        
+
         [PARAMS]
             [setdate]: datetime.date[time] | other
-        
+
         [RETURNS]
             [datetime.date[time]] if setdate is not specified (getter mode)
-        
+
         [RAISES]
             TypeError: if setdate does not match type(start)
             ValueError: if setdate < start
         """
-        
+
         if setdate is not False:
             setdate = self._cast(setdate)
 
             if setdate is None:
-                self._end = None
+                self._hi = None
 
-                if self.start() is None:
-                    self._nobounds = True
+            elif self._lo is None and self._hi is None:
+                raise TypeError('Can only set start to None or '+
+                    str(type(None))+', not '+str(type(setdate)))
 
-            elif isinstance(setdate,type(self.start())):
-                if setdate < self.start():
+            else:
+                t = _to_ticks(setdate,self._dateclass)
+                if self._lo is not None and t < self._lo:
                     raise ValueError('Cannot set start to be before end: '+
                         str(setdate))
 
-                self._end = setdate
-            
-            elif ( self.start() is None and
-                   isinstance(setdate,type(self.end())) ):
-                self._end = setdate
-
-            else:
-                raise TypeError('Can only set start to None or '+
-                    str(type(self._start))+', not '+str(type(setdate)))
+                self._hi = t
 
+            self._end = None
             return self
 
-        else:
-            return self._end
+        d = self._end
+        if d is None and self._hi is not None:
+            d = self._end = _from_ticks(self._hi,self._dateclass)
+        return d
+
+
+    def _ticks(self,other):
+        # DESCRIPTION:
+        #    Convert a date[time] into the integer ticks used by this
+        #    DateRange's bounds.
+        #
+        # RAISES:
+        #    TypeError: if other is not comparable to start or end
+        return _to_ticks(other,self._dateclass)
 
 
     def __contains__(self,other):
@@ -259,25 +479,53 @@ class DateRange:
         # RAISES:
         #    TypeError: if d in not comparable to start or end
 
+        lo = self._lo
+        hi = self._hi
+
+        # This is the hottest path in the module
+        cls = type(other)
+        if cls is self._dateclass:
+            # Comparing with the cached bounds is cheaper than working out
+            # the ticks of other
+            start = self._start
+            if start is None and lo is not None:
+                start = self._start = _from_ticks(lo,cls)
+            end = self._end
+            if end is None and hi is not None:
+                end = self._end = _from_ticks(hi,cls)
+            try:
+                return ((start is None or start <= other) and
+                        (end is None or other <= end))
+            except TypeError:
+                # Aware (deprecated)
+                t = _to_ticks(other,cls)
+                return (lo is None or lo <= t) and (hi is None or t <= hi)
+
         if other is self:
             return True
 
-        elif other is None:
-            if self.start() is None or self.end() is None:
-                return True
-            else:
-                return False
+        if other is None:
+            return lo is None or hi is None
 
-        if self.start() is None: # No lower bound
-            if self.end() is None:
-                return True
-            else:
-                return self.end() >= other
-        else:                   # Finite lower bound
-            if self.end() is None:
-                return self.start() <= other
-            else:
-                return self.start() <= other and self.end() >= other
+        if lo is None and hi is None:
+            return True
+
+        if isinstance(other,DateRange):
+            if other._dateclass is not self._dateclass:
+                raise TypeError('Cannot compare '+str(other._dateclass)+
+                    ' to '+str(self._dateclass))
+            olo = other._lo
+            ohi = other._hi
+            return ( (lo is None or (olo is not None and lo <= olo)) and
+                     (hi is None or (ohi is not None and ohi <= hi)) )
+
+        if _is_a(other,self._dateclass):
+            # Subclasses such as pandas.Timestamp take the slow path
+            t = _to_ticks(other,self._dateclass)
+            return (lo is None or lo <= t) and (hi is None or t <= hi)
+
+        raise TypeError('Cannot compare '+str(cls)+' to '+
+            str(self._dateclass))
 
 
 
@@ -296,6 +544,49 @@ class DateRange:
         return self.__contains__(date)
 
 
+    def contains_many(self,values):
+        # DESCRIPTION:
+        #    Check many values against this DateRange in one vectorized
+        #    pass. Requires numpy.
+        #
+        # PARAMS:
+        #    values: numpy.datetime64 array | iterable of datetime.date[time]
+        #       A datetime64 array with a unit of days holds dates; any other
+        #       unit holds datetimes. NaT and None are treated like None in
+        #       __contains__.
+        #
+        # RETURNS:
+        #    numpy bool array with the shape of values
+        #
+        # RAISES:
+        #    TypeError: if values are not comparable to start or end
+        import numpy as np
+        from eon.array import _asraw,_NAT
+
+        if not isinstance(values,np.ndarray):
+            values = list(values)
+
+        lo = self._lo
+        hi = self._hi
+
+        if lo is None and hi is None:
+            return np.ones(np.shape(values),dtype=bool)
+
+        # Compare against the bounds moved into the values' raw units rather
+        # than moving every value onto ticks. NaT is int64 min, so it always
+        # falls below a finite start and never above a finite end.
+        raw,offset = _asraw(values,self._dateclass)
+        if lo is None:
+            return raw <= hi - offset
+
+        mask = raw >= lo - offset
+        if hi is None:
+            mask |= raw == _NAT
+        else:
+            mask &= raw <= hi - offset
+        return mask
+
+
     def intersection(self,other):
         # DESCRIPTION:
         #    Find the intersection of this DateRange with another DateRange.
@@ -316,27 +607,35 @@ class DateRange:
         if other is self:
             return other
 
-        if isinstance(other,type(self)):
+        if isinstance(other,DateRange):
+
+            if self._dateclass is None:
+                dateclass = other._dateclass
+            elif ( other._dateclass is None or
+                   other._dateclass is self._dateclass ):
+                dateclass = self._dateclass
+            else:
+                raise TypeError('Cannot intersect '+str(self._dateclass)+
+                    ' with '+str(other._dateclass))
 
-            if other._start is None and self.start is None:
-                start = None
-            elif other._start is None:
-                start = self._start
-            elif self._start is None:
-                start = other._start
+            if other._lo is None:
+                lo = self._lo
+            elif self._lo is None:
+                lo = other._lo
             else:
-                start = max(other._start,self._start)
-
-            if other._end is None and self.start is None:
-                end = None
-            elif other._end is None:
-                end = self._end
-            elif self._end is None:
-                end = other._end
+                lo = max(other._lo,self._lo)
+
+            if other._hi is None:
+                hi = self._hi
+            elif self._hi is None:
+                hi = other._hi
             else:
-                end = min(other._end,self._end)
+                hi = min(other._hi,self._hi)
+
+            if lo is not None and hi is not None and lo > hi:
+                return None
 
-            return DateRange(start,end)
+            return DateRange._fromticks(lo,hi,dateclass)
 
 
     def span(self):
@@ -355,8 +654,10 @@ class DateRange:
         # RAISES:
         #    Nothing
 
-        if self.end() is not None and self.start() is not None:
-            return (self.end() - self.start()) + self._resolution
+        if self._hi is not None and self._lo is not None:
+            if self._dateclass is datetime.datetime:
+                return _TICK*(self._hi - self._lo + 1)
+            return datetime.timedelta(self._hi - self._lo + 1)
         else:
             return None
 
@@ -365,11 +666,27 @@ class DateRange:
     #----------------------------------------------------------------
 
     def __lt__(self,date):
-        return date > self.end()
+        # Entirely before date (or before the start of a DateRange)
+        if isinstance(date,DateRange):
+            if date._dateclass is not self._dateclass:
+                raise TypeError('Cannot compare '+str(date._dateclass)+
+                    ' to '+str(self._dateclass))
+            t = date._lo
+        else:
+            t = self._ticks(date)
+        return self._hi is not None and t is not None and t > self._hi
 
 
     def __gt__(self,date):
-        return date < self.start()
+        # Entirely after date (or after the end of a DateRange)
+        if isinstance(date,DateRange):
+            if date._dateclass is not self._dateclass:
+                raise TypeError('Cannot compare '+str(date._dateclass)+
+                    ' to '+str(self._dateclass))
+            t = date._hi
+        else:
+            t = self._ticks(date)
+        return self._lo is not None and t is not None and t < self._lo
 
 
     def __ge__(self,date):
@@ -381,12 +698,14 @@ class DateRange:
 
 
     def __str__(self):
-        if self._start and self._end:
-            return 'DateRange('+str(self._start)+' to '+str(self._end)+')'
-        elif self._start:
-            return  'DateRange(Beginning on '+str(self._start)+')'
-        elif self._end:
-            return  'DateRange(Ending on '+str(self._end)+')'
+        start = self.start()
+        end = self.end()
+        if start is not None and end is not None:
+            return 'DateRange('+str(start)+' to '+str(end)+')'
+        elif start is not None:
+            return  'DateRange(Beginning on '+str(start)+')'
+        elif end is not None:
+            return  'DateRange(Ending on '+str(end)+')'
         else:
             return 'DateRange(All Dates)'
 
@@ -394,6 +713,11 @@ class DateRange:
         return self.__str__()
 
 
+    def __reduce__(self):
+        # Pickle as the three ticks rather than a dict of slots
+        return type(self)._fromticks,(self._lo,self._hi,self._dateclass)
+
+
     def __add__(self,td):
         # Slide by a timedelta
         return self.slide(td)
@@ -407,41 +731,131 @@ class DateRange:
     #|                            Methods                           |
     #----------------------------------------------------------------
 
+    def _shift(self,t,td):
+        # DESCRIPTION:
+        #    Move ticks by a timedelta, the way date[time] + timedelta
+        #    would (dates ignore any part of td shorter than a day).
+        #
+        # RAISES:
+        #    TypeError: if t is unbounded or td is not a timedelta
+        #    OverflowError: if the result is out of the date class' range
+        if t is None:
+            raise TypeError('Cannot move an unbounded bound')
+        if not isinstance(td,datetime.timedelta):
+            raise TypeError('Expected a datetime.timedelta, not '+
+                str(type(td)))
+        if self._dateclass is datetime.datetime:
+            t += (td.days*86400 + td.seconds)*1000000 + td.microseconds
+        else:
+            t += td.days
+        if not _MIN_TICKS[self._dateclass] <= t <= (
+               _MAX_TICKS[self._dateclass]):
+            raise OverflowError('date value out of range')
+        return t
+
+
+    def _rebound(self,lo,hi,dateclass):
+        # A new DateRange from ticks, reordered chronologically
+        if lo is not None and hi is not None and lo > hi:
+            lo,hi = hi,lo
+        return DateRange._fromticks(lo,hi,dateclass)
+
+
     def startat(self,d):
         if type(d) is datetime.timedelta:
-            return DateRange(self.start()+d,self.end())
+            return self._rebound(self._shift(self._lo,d),self._hi,
+                                 self._dateclass)
         else:
             d = self._cast(d)
-            return DateRange(d,self.end())
+            if d is None:
+                return self._rebound(None,self._hi,self._dateclass)
+            dateclass = self._dateclass or type(d)
+            return self._rebound(_to_ticks(d,dateclass),self._hi,dateclass)
 
     def endat(self,d):
         if type(d) is datetime.timedelta:
-            return DateRange(self.start(),self.end()+d)
+            return self._rebound(self._lo,self._shift(self._hi,d),
+                                 self._dateclass)
         else:
             d = self._cast(d)
-            return DateRange(self.start(),d)
-    
+            if d is None:
+                return self._rebound(self._lo,None,self._dateclass)
+            dateclass = self._dateclass or type(d)
+            return self._rebound(self._lo,_to_ticks(d,dateclass),dateclass)
+
 
     def slide(self,td):
+        # Shift both bounds by a timedelta, working on the ticks directly
+        if self._dateclass is None:
+            if not isinstance(td,datetime.timedelta):
+                raise TypeError('Expected a datetime.timedelta, not '+
+                    str(type(td)))
+            return DateRange._fromticks(None,None,None)
 
-        if self.start() is None:
-            new_start = None
-        else:
-            new_start = self.start() + td
+        lo = None if self._lo is None else self._shift(self._lo,td)
+        hi = None if self._hi is None else self._shift(self._hi,td)
+        return DateRange._fromticks(lo,hi,self._dateclass)
 
-        if self.end() is None:
-            new_end = None
-        else:
-            new_end = self.end() + td
 
-        return DateRange(new_start,new_end)
+    def freeze(self):
+        # DESCRIPTION:
+        #    Get an immutable, hashable copy of this DateRange.
+        #
+        # RETURNS:
+        #    FrozenDateRange with the same bounds (self if already frozen)
+        if type(self) is FrozenDateRange:
+            return self
+        return FrozenDateRange._fromticks(self._lo,self._hi,self._dateclass)
 
 
     #----------------------------------------------------------------
     #|        Generators for cycles inside of the DateRange         |
     #----------------------------------------------------------------
 
-    def cycles(self,dt,n=0):
+    def _cycle(self,unit,n=0,snap=False,reverse=False,step=None,
+               array=False):
+        # DESCRIPTION:
+        #    Closed-form version of a cycle generator (see eon.cycles). The
+        #    values are computed from the calendar rather than by stepping
+        #    and are exactly those the generator would yield for the same n,
+        #    snap and reverse.
+        #
+        # RETURNS:
+        #    eon.cycles.Cycle, a lazy sequence supporting len(), indexing,
+        #    slicing, index() and `in`, or if array is True a numpy
+        #    datetime64 array ('D' for dates, 'us' for datetimes).
+        #
+        # RAISES:
+        #    ValueError: if the cycle starts at an unbounded bound
+        #    ValueError: if array is True and the cycle runs toward an
+        #                unbounded bound without a limit n
+        from eon.cycles import Cycle
+        cycle = Cycle(self,unit,n=n,snap=snap,reverse=reverse,step=step)
+        if array is True:
+            return cycle.toarray()
+        return cycle
+
+
+    def cycles(self,dt,n=0,array=False,lazy=False):
+        # DESCRIPTION:
+        #    Generate date[time]s every `dt` from start() (or from end() if
+        #    dt is negative).
+        #
+        # PARAMS:
+        #    [array=False]: bool
+        #       If True, return the whole cycle at once as a numpy datetime64
+        #       array (see _cycle) instead of a generator.
+        #
+        #    [lazy=False]: bool
+        #       If True, return a lazy sequence with len(), indexing and
+        #       slicing (see _cycle) instead of a generator.
+
+        if array is True or lazy is True:
+            return self._cycle('cycles',n=n,step=dt,array=array)
+        return self._cycles(dt,n)
+
+
+    def _cycles(self,dt,n=0):
         if dt > datetime.timedelta(0):
             if self.start() is None:
                 raise ValueError("timedelta indicates starting at infinite"+
@@ -458,13 +872,33 @@ class DateRange:
             raise ValueError("timedelta cannot be 0.")
 
         counter = 0
-        while d in self and (n is 0 or n>counter):
+        while d in self and (n == 0 or n>counter):
             yield d
             d += dt
             counter += 1
 
 
-    def hours(self,n=0,snap=False,reverse=False):
+    def hours(self,n=0,snap=False,reverse=False,array=False,lazy=False):
+        # DESCRIPTION:
+        #    Generate date[time]s one hour apart, starting at start() (or
+        #    end() if reverse is True). snap has no effect.
+        #
+        # PARAMS:
+        #    [array=False]: bool
+        #       If True, return the whole cycle at once as a numpy datetime64
+        #       array (see _cycle) instead of a generator.
+        #
+        #    [lazy=False]: bool
+        #       If True, return a lazy sequence with len(), indexing and
+        #       slicing (see _cycle) instead of a generator.
+
+        if array is True or lazy is True:
+            return self._cycle('hours',n=n,snap=snap,reverse=reverse,
+                               array=array)
+        return self._hours(n=n,snap=snap,reverse=reverse)
+
+
+    def _hours(self,n=0,snap=False,reverse=False):
         if reverse:
             if self.end() is None:
                 raise Exception("Cannot start at infinity.")
@@ -472,20 +906,40 @@ class DateRange:
             d = self.end()
             end = self.start()
         else:
-            if self.end() is None:
+            if self.start() is None:
                 raise Exception("Cannot start at infinity.")
             dtime = datetime.timedelta(hours=1)
             d = self.start()
             end = self.end()
 
         counter = 0
-        while d in self and (n is 0 or n>counter):
+        while d in self and (n == 0 or n>counter):
             yield d
             d += dtime
             counter += 1
 
 
-    def days(self,n=0,snap=False,reverse=False):
+    def days(self,n=0,snap=False,reverse=False,array=False,lazy=False):
+        # DESCRIPTION:
+        #    Generate date[time]s one day apart, starting at start() (or
+        #    end() if reverse is True). If snap is True, only midnights.
+        #
+        # PARAMS:
+        #    [array=False]: bool
+        #       If True, return the whole cycle at once as a numpy datetime64
+        #       array (see _cycle) instead of a generator.
+        #
+        #    [lazy=False]: bool
+        #       If True, return a lazy sequence with len(), indexing and
+        #       slicing (see _cycle) instead of a generator.
+
+        if array is True or lazy is True:
+            return self._cycle('days',n=n,snap=snap,reverse=reverse,
+                               array=array)
+        return self._days(n=n,snap=snap,reverse=reverse)
+
+
+    def _days(self,n=0,snap=False,reverse=False):
         if reverse:
             if self.end() is None:
                 raise Exception("Cannot start at infinity.")
@@ -513,7 +967,7 @@ class DateRange:
         d = dsnap + d_offset
 
         counter = 0
-        while d in self and (n is 0 or n>counter):
+        while d in self and (n == 0 or n>counter):
             yield d
             # Must break out dsnap rather than taking the containing pentad
             # of d on each iteration, because it is possible to start this
@@ -525,15 +979,65 @@ class DateRange:
             counter += 1
 
 
-    def rdays(self,n=0,snap=False,reverse=False,full=False):
+    def rdays(self,n=0,snap=False,reverse=False,full=False,bounds=False,
+              out=None):
+        # DESCRIPTION:
+        #    Generate DateRanges one day long. See rpentads() for the
+        #    arguments.
+        if n != 0:
+            n+=1
+        return self._rcycle('days',n=n,snap=snap,reverse=reverse,full=full,
+                            bounds=bounds,out=out)
+
+
+    def busdays(self,calendar=None,n=0,snap=False,reverse=False,
+                array=False):
+        # DESCRIPTION:
+        #    Generate the values of days() that fall on business days.
+        #
+        # PARAMS:
+        #    [calendar=None]: eon.busdays.BusinessCalendar
+        #       The weekmask and holidays to follow. By default Monday to
+        #       Friday, with no holidays.
+        #    [n=0]: int
+        #       Maximum number of business days; 0 means no limit.
+        #    [snap=False]: bool
+        #    [reverse=False]: bool
+        #       As for days().
+        #    [array=False]: bool
+        #       If True, return them at once as a numpy datetime64 array.
+        #
+        # NOTES:
+        #    Each business day is found from a running count of business
+        #    days kept by the calendar, so non-business days are skipped
+        #    without being visited.
+        #    calendar.count(self) gives the number of business days without
+        #    generating them.
+        #
+        # RAISES:
+        #    ValueError: if we try starting the generator at an unbounded date
+        from eon.busdays import WEEKDAYS
+        if calendar is None:
+            calendar = WEEKDAYS
+        return calendar.busdays(self,n=n,snap=snap,reverse=reverse,
+                                array=array)
+
+
+    def rbusdays(self,calendar=None,n=0,snap=False,reverse=False,
+                 full=False,bounds=False,out=None):
         # DESCRIPTION:
-        if n is not 0:
+        #    Generate DateRanges from each business day to the next, as
+        #    rcycle(busdays()) would. Non-business days belong to the range
+        #    of the business day before them (after them if reverse).
+        if n != 0:
             n+=1
-        gen = self.days(n=n,snap=snap,reverse=reverse)
-        return self.rcycle(gen,snap=snap,reverse=reverse,full=full)
+        return self.rcycle(self.busdays(calendar,n=n,snap=snap,
+                                        reverse=reverse),
+                           snap=snap,reverse=reverse,full=full,
+                           bounds=bounds,out=out)
 
 
-    def pentads(self,n=0,snap=False,reverse=False):
+    def pentads(self,n=0,snap=False,reverse=False,array=False,lazy=False):
         # DESCRIPTION:
         #    Generate date(time)s representing the beginning of pentads in
         #    this DateRange
@@ -546,6 +1050,14 @@ class DateRange:
         #       If reverse is True, then date[time]s are generated in reverse
         #       chronological order.
         #
+        #    [array=False]: bool
+        #       If True, return the whole cycle at once as a numpy datetime64
+        #       array (see _cycle) instead of a generator.
+        #
+        #    [lazy=False]: bool
+        #       If True, return a lazy sequence with len(), indexing and
+        #       slicing (see _cycle) instead of a generator.
+        #
         # NOTES:
         #    A pentad is defined as a duration of time that breaks the year
         #    into exactly 73 portions, with all but the last portion required
@@ -577,6 +1089,13 @@ class DateRange:
         #    ValueError(): if self.start() is None and reverse is False
         #    ValueError(): if self.end() is None and reverse is True
 
+        if array is True or lazy is True:
+            return self._cycle('pentads',n=n,snap=snap,reverse=reverse,
+                               array=array)
+        return self._pentads(n=n,snap=snap,reverse=reverse)
+
+
+    def _pentads(self,n=0,snap=False,reverse=False):
         if reverse:
             if self.end() is None:
                 raise ValueError('Cannot start at infinity.')
@@ -604,7 +1123,7 @@ class DateRange:
         d = dsnap + d_offset
 
         counter = 0
-        while d in self and (n is 0 or n>counter):
+        while d in self and (n == 0 or n>counter):
             yield d
             # Must break out dsnap rather than taking the containing pentad
             # of d on each iteration, because it is possible to start this
@@ -614,10 +1133,11 @@ class DateRange:
             dy,p = bound_pentad( date_to_pentad(dsnap) + dpentad )
             dsnap = self._cast( pentad_to_datetime(dsnap.year+dy,p) )
             d = dsnap + d_offset
-            counter += 0
+            counter += 1
 
 
-    def rpentads(self,n=0,snap=False,reverse=False,full=False):
+    def rpentads(self,n=0,snap=False,reverse=False,full=False,
+                 bounds=False,out=None):
         # DESCRIPTION:
         #    Generate DateRanges within from this DateRange one pentad in
         #    duration and in chronological order.
@@ -635,6 +1155,20 @@ class DateRange:
         #       If set to True then partial DateRanges on either side will
         #       be skipped.
         #
+        #    [bounds=False]: bool
+        #       If set to True then (start, end) tuples of date[time]s are
+        #       generated instead of DateRanges, with None for an unbounded
+        #       side.
+        #
+        #    [out=None]: (numpy.ndarray, numpy.ndarray)
+        #       Preallocated datetime64 arrays ('D' for dates, 'us' for
+        #       datetimes) of one length. If given, the starts and ends are
+        #       written into them (NaT for an unbounded side) and the
+        #       generator yields the number of rows written each time they
+        #       fill up, and for the rows left at the end. Read the arrays
+        #       before resuming, as they are overwritten. No DateRange or
+        #       date[time] is built.
+        #
         # RETURNS:
         #    generator that yields DateRanges that cover exactly a pentad.
         #    A pentad is defined
@@ -646,13 +1180,35 @@ class DateRange:
         # RAISES:
         #    ValueError: if we try starting the generator at an unbounded date
         #    StopIteration: once we have cycled throughall possible DateRanges
-        if n is not 0:
+        if n != 0:
             n+=1
-        gen = self.pentads(reverse=reverse,snap=snap)
-        return self.rcycle(gen,reverse=reverse,snap=snap,full=full)
+        return self._rcycle('pentads',n=n,snap=snap,reverse=reverse,
+                            full=full,bounds=bounds,out=out)
+
+
+    def months(self,n=0,snap=False,reverse=False,array=False,lazy=False):
+        # DESCRIPTION:
+        #    Generate date[time]s one calendar month apart, starting at
+        #    start() (or end() if reverse is True). Each value keeps the
+        #    offset of the starting bound from the first of its month; if
+        #    snap is True, only firsts of the month are generated.
+        #
+        # PARAMS:
+        #    [array=False]: bool
+        #       If True, return the whole cycle at once as a numpy datetime64
+        #       array (see _cycle) instead of a generator.
+        #
+        #    [lazy=False]: bool
+        #       If True, return a lazy sequence with len(), indexing and
+        #       slicing (see _cycle) instead of a generator.
 
+        if array is True or lazy is True:
+            return self._cycle('months',n=n,snap=snap,reverse=reverse,
+                               array=array)
+        return self._months(n=n,snap=snap,reverse=reverse)
 
-    def months(self,n=0,snap=False,reverse=False):
+
+    def _months(self,n=0,snap=False,reverse=False):
 
         if reverse:
             if self.end() is None:
@@ -681,28 +1237,50 @@ class DateRange:
         d = dsnap + d_offset
 
         counter = 0
-        while d in self and (n is 0 or n>counter):
+        while d in self and (n == 0 or n>counter):
             yield d
             # Must break out dsnap rather than taking the containing pentad
             # of d on each iteration, because it is possible to start this
             # generator with a d_offset of greater than five (last pentad)
             # of a leap year, in which case taking the pentad of a normal
             # date plus a 6-day d_offset may lead to a missed cycle.
-            dy,m = bound_month(d.month+dmonth)
-            dsnap = self._cast(datetime.datetime(d.year+dy,m,1))
+            dy,m = bound_month(dsnap.month+dmonth)
+            dsnap = self._cast(datetime.datetime(dsnap.year+dy,m,1))
             d = dsnap + d_offset
             counter += 1
 
 
 
-    def rmonths(self,n=0,snap=False,reverse=False,full=False):
-        if n is not 0:
+    def rmonths(self,n=0,snap=False,reverse=False,full=False,bounds=False,
+                out=None):
+        if n != 0:
             n+=1
-        gen = self.months(n=n,snap=snap,reverse=reverse)
-        return self.rcycle(gen,snap=snap,reverse=reverse,full=full)
+        return self._rcycle('months',n=n,snap=snap,reverse=reverse,full=full,
+                            bounds=bounds,out=out)
 
 
-    def years(self,n=0,reverse=False,snap=False):
+    def years(self,n=0,reverse=False,snap=False,array=False,lazy=False):
+        # DESCRIPTION:
+        #    Generate date[time]s one calendar year apart, starting at
+        #    start() (or end() if reverse is True). If snap is True, only
+        #    the first of January is generated.
+        #
+        # PARAMS:
+        #    [array=False]: bool
+        #       If True, return the whole cycle at once as a numpy datetime64
+        #       array (see _cycle) instead of a generator.
+        #
+        #    [lazy=False]: bool
+        #       If True, return a lazy sequence with len(), indexing and
+        #       slicing (see _cycle) instead of a generator.
+
+        if array is True or lazy is True:
+            return self._cycle('years',n=n,snap=snap,reverse=reverse,
+                               array=array)
+        return self._years(n=n,reverse=reverse,snap=snap)
+
+
+    def _years(self,n=0,reverse=False,snap=False):
 
         if reverse:
             if self.end() is None:
@@ -726,7 +1304,7 @@ class DateRange:
             d_offset = d - self._cast(datetime.datetime(d.year,month,day))
 
         counter = 0
-        while d in self and (n is 0 or n>counter):
+        while d in self and (n == 0 or n>counter):
             yield d
 
             if snap is True:
@@ -737,14 +1315,65 @@ class DateRange:
             counter += 1
 
 
-    def ryears(self,n=0,snap=False,reverse=False,full=False):
-        if n is not 0:
+    def ryears(self,n=0,snap=False,reverse=False,full=False,bounds=False,
+               out=None):
+        if n != 0:
             n+=1
-        gen = self.years(n=n,snap=snap,reverse=reverse)
-        return self.rcycle(gen,snap=snap,reverse=reverse,full=full)
+        return self._rcycle('years',n=n,snap=snap,reverse=reverse,full=full,
+                            bounds=bounds,out=out)
+
+
+    def _rcycle(self,unit,n=0,snap=False,reverse=False,full=False,
+                bounds=False,out=None):
+        # DESCRIPTION:
+        #    rcycle() over one of the built-in cycle generators, with the
+        #    bounds of each DateRange computed from the calendar as ticks
+        #    (see eon.cycles) and no date objects built in between. Yields
+        #    exactly what rcycle(self.<unit>(...)) would. With `out`, whole
+        #    chunks of bounds are computed at once with numpy.
+        from eon.cycles import Cycle
+        if not (full is False or full is True):
+            raise ValueError('full must be True or False.')
+        elif not (reverse is False or reverse is True):
+            raise ValueError('reverse must be True or False.')
+        if not (snap is False or snap is True):
+            raise ValueError('span must be True or False.')
+
+        cycle = Cycle(self,unit,n=n,snap=snap,reverse=reverse)
+        if out is not None:
+            from eon.array import _fillbounds
+            yield from _fillbounds(cycle._boundsarrays(len(out[0]),full),out,
+                                   self._dateclass)
+        else:
+            yield from self._emit(cycle._bounds(full),bounds)
 
 
-    def rcycle(self,gen,snap=False,reverse=False,full=False):
+    def _emit(self,pairs,bounds=False):
+        # DESCRIPTION:
+        #    Turn the (lo, hi) ticks of a range cycle into DateRanges, or
+        #    (start, end) tuples if bounds is True.
+        dateclass = self._dateclass
+        if bounds is True:
+            # Inlined _from_ticks()
+            if dateclass is datetime.datetime:
+                for lo,hi in pairs:
+                    yield (None if lo is None else
+                           _EPOCH + _TICK*(lo-_DAY_TICKS),
+                           None if hi is None else
+                           _EPOCH + _TICK*(hi-_DAY_TICKS))
+            else:
+                fromordinal = datetime.date.fromordinal
+                for lo,hi in pairs:
+                    yield (None if lo is None else fromordinal(lo),
+                           None if hi is None else fromordinal(hi))
+        else:
+            fromticks = DateRange._fromticks
+            for lo,hi in pairs:
+                yield fromticks(lo,hi,dateclass)
+
+
+    def rcycle(self,gen,snap=False,reverse=False,full=False,bounds=False,
+               out=None):
         # DESCRIPTION:
         #    Generate DateRanges from using date[time] generator
         #
@@ -757,6 +1386,11 @@ class DateRange:
         #    [snap=False]: bool
         #    [reverse=False]: bool
         #    [full=False]: bool
+        #    [bounds=False]: bool
+        #    [out=None]: (numpy.ndarray, numpy.ndarray)
+        #       Output modes, as for rpentads(): (start, end) tuples instead
+        #       of DateRanges, or chunks of bounds written into preallocated
+        #       datetime64 arrays.
         #
         # RETURNS:
         #    A generator that produces DateRanges inside of the bounds of the
@@ -765,7 +1399,8 @@ class DateRange:
         # RAISES:
         #    ValueError: if we call bools with something other than True or False
         # NOTES:
-        #
+        #    The bounds are worked out as integer ticks, so only the values of
+        #    gen are converted and nothing is built per range until output.
 
         if not (full is False or full is True):
             raise ValueError('full must be True or False.')
@@ -774,45 +1409,82 @@ class DateRange:
         if not (snap is False or snap is True):
             raise ValueError('span must be True or False.')
 
+        pairs = self._rcycleticks(gen,reverse,full)
+        if out is not None:
+            import numpy as np
+            from eon.array import (_UNBOUNDED_LO, _UNBOUNDED_HI,
+                                   _fillbounds)
+
+            def chunks(size=len(out[0])):
+                # Batches of pairs as int64 arrays, with sentinels for None
+                batch = list(itertools.islice(pairs,size))
+                while batch:
+                    lo,hi = zip(*batch)
+                    yield (np.array([_UNBOUNDED_LO if t is None else t
+                                     for t in lo],np.int64),
+                           np.array([_UNBOUNDED_HI if t is None else t
+                                     for t in hi],np.int64))
+                    batch = list(itertools.islice(pairs,size))
+
+            yield from _fillbounds(chunks(),out,self._dateclass)
+        else:
+            yield from self._emit(pairs,bounds)
+
+
+    def _rcycleticks(self,gen,reverse,full):
+        # DESCRIPTION:
+        #    The (lo, hi) ticks of the DateRanges of rcycle(), tested against
+        #    the bounds of this DateRange as integers.
+        dateclass = self._dateclass
+        lo,hi = self._lo,self._hi
+        values = (_to_ticks(d,dateclass) for d in gen)
+
+        def inside(t):
+            # `t in self`, with None (an unbounded bound) always inside
+            return t is None or ((lo is None or lo <= t) and
+                                 (hi is None or t <= hi))
+
+        def make(t1,t2):
+            if t1 is not None and t2 is not None and t1 > t2:
+                return t2,t1
+            return t1,t2
+
         if reverse is True:
-            resolution_modifier = self._resolution
-            natural_start = self.end()
-            natural_end = self.start()
+            resolution_modifier = 1
+            natural_start = hi
+            natural_end = lo
 
         elif reverse is False:
-            resolution_modifier = -self._resolution
-            natural_start = self.start()
-            natural_end = self.end()
+            resolution_modifier = -1
+            natural_start = lo
+            natural_end = hi
 
         # If we can't generate a single date...
         try:
-            maybe_start = next(gen)
+            maybe_start = next(values)
 
         except StopIteration:
-            print('hai')
-            if full is True:
-                raise StopIteration
-            else:
-                yield DateRange(self.start(),self.end())
-                raise StopIteration
+            if full is False:
+                yield lo,hi
+            return
 
         # Handle cases where we can't generate a second date
         if full is True:
             try:
                 start = maybe_start
-                _start = next(gen)
+                _start = next(values)
             except StopIteration:
-                raise StopIteration
+                return
 
         else:
             if natural_start == maybe_start:
                 try:
                     start = natural_start
-                    _start = next(gen)
+                    _start = next(values)
 
                 except StopIteration:
-                    yield DateRange(start,natural_end)
-                    raise StopIteration
+                    yield make(start,natural_end)
+                    return
             else:
                 start = natural_start
                 _start = maybe_start
@@ -820,20 +1492,20 @@ class DateRange:
         end = _start + resolution_modifier
 
         # Bound the end in the case that we go over
-        if end not in self:
+        if not inside(end):
             if full is False:
-                yield DateRange(natural_start,natural_end)
+                yield make(natural_start,natural_end)
             else:
-                raise StopIteration
+                return
 
         # The big loop
         try:
-            while end in self:
+            while inside(end):
 
-                yield DateRange(start,end)
+                yield make(start,end)
 
                 start = _start
-                _start = next(gen)
+                _start = next(values)
                 end = _start + resolution_modifier
 
         except StopIteration:
@@ -841,24 +1513,267 @@ class DateRange:
             # to the stopping criterion (self._start if reverse or
             # self._end if not) At this point, end is NOT in the range, so we
             # know that this DateRange is not 'full'
-            
-            if full is False and start in self:
+
+            if full is False and inside(start):
                 # Start must be in self to prevent the edge case where the
                 # last iteration ended perfectly on a bound, in which case we
                 # do not want to yield any more values
                 if reverse is True :
-                    yield DateRange(start,self.start())
+                    yield make(lo,start)
 
                 else: # reverse is False
-                    yield DateRange(self.end(),start)
+                    yield make(start,hi)
+
+
+    def parallel_map(self,fn,unit='months',workers=None,snap=False,
+                     executor='process',ordered=True):
+        # DESCRIPTION:
+        #    Split the DateRange into chunks and call fn(chunk) on each of
+        #    them in parallel.
+        #
+        # PARAMS:
+        #    fn: callable DateRange -> object
+        #       Must be picklable (defined at module level) for processes.
+        #
+        #    [unit='months']: 'days' | 'pentads' | 'months' | 'years' |
+        #                     datetime.timedelta | int
+        #       Calendar units split the DateRange like rdays(), rpentads(),
+        #       rmonths() and ryears(), a timedelta every period from
+        #       start(), and an int n into n chunks of equal span.
+        #
+        #    [workers=None]: int
+        #       Pool size; by default the number of CPUs.
+        #
+        #    [snap=False]: bool
+        #       Align calendar chunks to calendar breaks.
+        #
+        #    [executor='process']: 'process' | 'thread' |
+        #                          concurrent.futures.Executor
+        #       Run on a new process or thread pool, which is shut down
+        #       afterwards, or on an existing executor.
+        #
+        #    [ordered=True]: bool
+        #       If True, results come back in chronological order, else as
+        #       soon as each one completes.
+        #
+        # RETURNS:
+        #    A generator of (chunk DateRange, fn(chunk)) tuples. The work is
+        #    submitted when iteration starts.
+        #
+        # NOTES:
+        #    Chunks are computed in closed form (see eon.cycles) and sent to
+        #    worker processes in batches, so few pickles are made however
+        #    many chunks there are.
+        #
+        # RAISES:
+        #    ValueError: if the DateRange is unbounded or unit is unknown
+        #    Any exception raised by fn, when its result is reached
+        from eon.parallel import parallel_map
+        return parallel_map(self,fn,unit=unit,workers=workers,snap=snap,
+                            executor=executor,ordered=ordered)
+
+
+    def decompose(self,units=('years','months','days','hours'),
+                  frozen=False):
+        # DESCRIPTION:
+        #    Split the DateRange into the fewest calendar-aligned pieces:
+        #    whole years in the middle, then whole months, days and hours
+        #    toward the edges, and whatever is left at either end. This is
+        #    what rmonths(snap=True) and the other snapped range cycles
+        #    would give, mixing units to keep the pieces few.
+        #
+        # PARAMS:
+        #    [units=('years','months','days','hours')]: sequence of
+        #                   'years' | 'months' | 'pentads' | 'days' | 'hours'
+        #       The units to use, coarsest first. Months and pentads do not
+        #       nest in each other, so only one of them can be used. 'hours'
+        #       is ignored for ranges of dates.
+        #
+        #    [frozen=False]: bool
+        #       If True, the pieces are interned FrozenDateRanges (the same
+        #       objects month_to_daterange(..., frozen=True) and
+        #       pentad_to_daterange(..., frozen=True) return), so they can
+        #       key rollup tables and caches directly.
+        #
+        # RETURNS:
+        #    list of (unit, DateRange) tuples in chronological order that
+        #    cover the DateRange exactly. unit is None for the pieces at
+        #    either end that are not a whole unit.
+        #
+        # NOTES:
+        #    A year of hours decomposes into 1 piece and any DateRange into
+        #    at most a few dozen, found by calendar arithmetic (see
+        #    eon.cycles._decompose) without stepping through the range.
+        #
+        # RAISES:
+        #    ValueError: if the DateRange is unbounded, or units are unknown
+        #                or not ordered from coarsest to finest
+        from eon.cycles import _RANKS, _decompose
+        if self._lo is None or self._hi is None:
+            raise ValueError('Cannot decompose an unbounded DateRange')
+        if isinstance(units,str):
+            units = (units,)
+        for unit in units:
+            if unit not in _RANKS:
+                raise ValueError('Unknown cycle unit: '+str(unit))
+        ranks = [_RANKS[unit] for unit in units]
+        if any(a >= b for a,b in zip(ranks,ranks[1:])):
+            raise ValueError('Units must run from coarsest to finest, with '+
+                'at most one of months and pentads')
+
+        dateclass = self._dateclass
+        if dateclass is datetime.date:
+            units = [unit for unit in units if unit != 'hours']
+
+        out = []
+        fromticks = DateRange._fromticks
+        for unit,i,lo,hi in _decompose(self._lo,self._hi,dateclass,units):
+            if frozen is not True:
+                dr = fromticks(lo,hi,dateclass)
+            elif dateclass is datetime.datetime and unit == 'months':
+                dr = month_to_daterange(i//12,i % 12 + 1,frozen=True)
+            elif dateclass is datetime.datetime and unit == 'pentads':
+                dr = pentad_to_daterange(i//73,i % 73 + 1,frozen=True)
+            else:
+                dr = intern_daterange(fromticks(lo,hi,dateclass))
+            out.append((unit,dr))
+        return out
+
+
+"""A DateRange that cannot be changed, usable as a dict key or set member."""
+class FrozenDateRange(DateRange):
+
+    __slots__ = ()
+
+    # FrozenDateRange(date1,date2) takes the same arguments as DateRange.
+    # Equality and hashing are by value: two FrozenDateRanges are equal if
+    # they have the same bounds and date class. Ordering between DateRanges
+    # is by start() and then end(), with unbounded starts first and
+    # unbounded ends last, so sorted() gives a total order. Comparing with a
+    # date[time] keeps the DateRange meaning ("entirely before/after").
+
+    def start(self,setdate=False):
+        if setdate is not False:
+            raise TypeError('Cannot set the start of a FrozenDateRange')
+        d = self._start
+        if d is None and self._lo is not None:
+            d = self._start = _from_ticks(self._lo,self._dateclass)
+        return d
+
+
+    def end(self,setdate=False):
+        if setdate is not False:
+            raise TypeError('Cannot set the end of a FrozenDateRange')
+        d = self._end
+        if d is None and self._hi is not None:
+            d = self._end = _from_ticks(self._hi,self._dateclass)
+        return d
+
+
+    def _key(self,other):
+        # DESCRIPTION:
+        #    Sort keys of self and another DateRange.
+        #
+        # RAISES:
+        #    TypeError: if the date classes differ
+        if ( other._dateclass is not self._dateclass and
+             other._dateclass is not None and self._dateclass is not None ):
+            raise TypeError('Cannot compare '+str(other._dateclass)+
+                ' to '+str(self._dateclass))
+        return ((_NEG_INF if self._lo is None else self._lo,
+                 _POS_INF if self._hi is None else self._hi),
+                (_NEG_INF if other._lo is None else other._lo,
+                 _POS_INF if other._hi is None else other._hi))
+
+    #----------------------------------------------------------------
+    #|                          Specials                            |
+    #----------------------------------------------------------------
+
+    def __eq__(self,other):
+        if type(other) is not FrozenDateRange:
+            return NotImplemented
+        return ( self._lo == other._lo and self._hi == other._hi and
+                 self._dateclass is other._dateclass )
+
+
+    def __ne__(self,other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+
+    def __hash__(self):
+        return hash((self._lo,self._hi,self._dateclass))
+
+
+    def __lt__(self,other):
+        if isinstance(other,DateRange):
+            a,b = self._key(other)
+            return a < b
+        return DateRange.__lt__(self,other)
+
+
+    def __gt__(self,other):
+        if isinstance(other,DateRange):
+            a,b = self._key(other)
+            return a > b
+        return DateRange.__gt__(self,other)
+
+
+    def __le__(self,other):
+        if isinstance(other,DateRange):
+            a,b = self._key(other)
+            return a <= b
+        return DateRange.__le__(self,other)
+
+
+    def __ge__(self,other):
+        if isinstance(other,DateRange):
+            a,b = self._key(other)
+            return a >= b
+        return DateRange.__ge__(self,other)
+
+
+    def __str__(self):
+        return 'Frozen'+DateRange.__str__(self)
+
+
+# Interned FrozenDateRanges: each value maps to its shared instance, and the
+# helper keys of month_to_daterange and pentad_to_daterange to theirs
+_INTERNED = {}
+_INTERNED_HELPERS = {}
+
+
+def intern_daterange(dr):
+    # DESCRIPTION:
+    #    Get the shared FrozenDateRange equal to a DateRange, like
+    #    sys.intern for strings. Interned ranges are never released until
+    #    clear_interned() is called.
+    #
+    # PARAMS:
+    #    dr: DateRange
+    #
+    # RETURNS:
+    #    FrozenDateRange, the same object for every DateRange with the same
+    #    bounds
+    dr = dr.freeze()
+    return _INTERNED.setdefault(dr,dr)
+
+
+def clear_interned():
+    # Release every interned FrozenDateRange
+    _INTERNED.clear()
+    _INTERNED_HELPERS.clear()
 
 
 def date_to_dayofyear(d):
     # Input a datetime.datetime object and return the interger day of year
     # Return value will be in the range [1,366]
-    if not isinstance(d,datetime.date) or isinstance(d,datetime.datetime):
+    # Counted from the ordinal of the last day of the previous year, so no
+    # intermediate date is built. See eon.array for arrays of dates.
+    if not isinstance(d,datetime.date):
         d = d.date()
-    return (d - datetime.date(d.year,1,1)).days + 1
+    y = d.year - 1
+    return d.toordinal() - 365*y - y//4 + y//100 - y//400
 
 
 def dayofyear_to_date(year,doy):
@@ -883,7 +1798,7 @@ def date_to_pentad(d):
     if doy == 366:
         doy = 365
 
-    return int((doy-1)/5.00) + 1
+    return (doy-1)//5 + 1
 
 
 def pentad_to_dayofyear(pentad):
@@ -903,8 +1818,18 @@ def pentad_to_datetime(year,pentad):
     return dayofyear_to_datetime(year+dy,pentad_to_dayofyear(pentad))
 
 
-def pentad_to_daterange(year,pentad):
+def pentad_to_daterange(year,pentad,frozen=False):
     # For a given year and pentad, generate a DateRange
+    # With frozen=True, the interned FrozenDateRange is returned instead,
+    # the same object on every call with the same year and pentad
+    if frozen is True:
+        key = ('pentad',year,pentad)
+        dr = _INTERNED_HELPERS.get(key)
+        if dr is None:
+            dr = intern_daterange(pentad_to_daterange(year,pentad))
+            _INTERNED_HELPERS[key] = dr
+        return dr
+
     dy,pentad = bound_pentad(pentad)
     year = year + dy # Roll year
     d1 = pentad_to_datetime(year,pentad)
@@ -915,14 +1840,14 @@ def pentad_to_daterange(year,pentad):
     else:
         d2 = d1 + datetime.timedelta(days=5,microseconds=-1)
 
-    return DateRange(d1,d2)
+    return DateRange.trusted(d1,d2)
 
 
 def bound_cyclic(i,period):
     if i >= 1 and i <= period:
         return(0,i)
     elif i > period:
-        return(int(i/period),i%period)
+        return((i-1)//period,(i-1)%period + 1)
     elif i < period:
         return (int((i-period)/period),period-(abs(i)%period))
 
@@ -943,8 +1868,18 @@ def bound_pentad(pentad,year=None):
         return dy,p
 
 
-def month_to_daterange(year,month):
+def month_to_daterange(year,month,frozen=False):
     # Construct a daterange object
+    # With frozen=True, the interned FrozenDateRange is returned instead,
+    # the same object on every call with the same year and month
+    if frozen is True:
+        key = ('month',year,month)
+        dr = _INTERNED_HELPERS.get(key)
+        if dr is None:
+            dr = intern_daterange(month_to_daterange(year,month))
+            _INTERNED_HELPERS[key] = dr
+        return dr
+
     d1 = datetime.datetime(year,month,1)
 
     dy,month = bound_month(month+1)
@@ -952,4 +1887,4 @@ def month_to_daterange(year,month):
     d2 = (datetime.datetime(year+dy,month,1) -
           datetime.timedelta(microseconds=1))
 
-    return DateRange(d1,d2)
+    return DateRange.trusted(d1,d2)
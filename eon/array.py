@@ -0,0 +1,764 @@
+# eon.array
+# Columnar, numpy-backed collections of DateRanges
+import datetime
+import operator
+
+import numpy as np
+
+from eon import DateRange, _DAY_TICKS, _MAX_TICKS, _MIN_TICKS
+from eon.cycles import _ordinal
+
+# Ticks (see eon.DateRange) are offset from numpy's 1970-01-01 epoch by the
+# ordinal of that day.
+_ORDINAL_1970 = datetime.date(1970,1,1).toordinal()
+_UNIT = { datetime.date: 'D', datetime.datetime: 'us' }
+_OFFSET = { datetime.date: _ORDINAL_1970,
+            datetime.datetime: _ORDINAL_1970*_DAY_TICKS }
+
+# Unbounded sides are stored as sentinels so that comparisons need no masking
+_UNBOUNDED_LO = np.iinfo(np.int64).min
+_UNBOUNDED_HI = np.iinfo(np.int64).max
+_NAT = np.datetime64('NaT').view(np.int64)
+
+
+def _dateclass_of(values):
+    # DESCRIPTION:
+    #    Find the date class of a scalar, sequence or datetime64 array.
+    #
+    # RETURNS:
+    #    datetime.date | datetime.datetime | None (all values are None/NaT)
+    #
+    # RAISES:
+    #    TypeError: if the values are not dates or do not share one type
+    if isinstance(values,(np.ndarray,np.datetime64)):
+        dtype = np.asarray(values).dtype
+        if dtype.kind != 'M':
+            raise TypeError('Expected a datetime64 array, not '+str(dtype))
+        if np.datetime_data(dtype)[0] == 'D':
+            return datetime.date
+        return datetime.datetime
+
+    if values is None or isinstance(values,datetime.date):
+        values = [values]
+
+    types = set(map(type,values))
+    types.discard(type(None))
+    if not types:
+        return None
+    if len(types) > 1 or not types <= {datetime.date,datetime.datetime}:
+        raise TypeError('Values must all be datetime.date or all be '+
+            'datetime.datetime, not '+str(types))
+    return types.pop()
+
+
+def _asraw(values,dateclass):
+    # DESCRIPTION:
+    #    Convert dates to a datetime64 array in the unit of `dateclass` and
+    #    view it as int64, without shifting it onto ticks.
+    #
+    # PARAMS:
+    #    values: datetime.date[time] | None | iterable of those |
+    #            numpy.datetime64 array
+    #    dateclass: datetime.date | datetime.datetime
+    #
+    # RETURNS:
+    #    (raw, offset): raw + offset are ticks. None/NaT are int64 min.
+    #
+    # RAISES:
+    #    TypeError: if values cannot be compared to `dateclass`, following
+    #               the same rules as DateRange.__contains__
+    if not isinstance(values,(np.ndarray,np.datetime64,datetime.date)):
+        if values is not None:
+            values = list(values)
+
+    other = _dateclass_of(values)
+    if other is not None and other is not dateclass:
+        raise TypeError('Cannot compare '+str(other)+' to '+str(dateclass))
+
+    if isinstance(values,list) and None not in values:
+        # numpy converts date objects one at a time and slowly, so build
+        # the ticks from their fields instead (offset 0).
+        return _fieldticks(values,dateclass),0
+
+    arr = np.asarray(values,dtype='datetime64['+_UNIT[dateclass]+']')
+    return arr.view(np.int64),_OFFSET[dateclass]
+
+
+def _fieldticks(values,dateclass):
+    # Ticks for a list of date[time]s built column by column
+    n = len(values)
+    ticks = np.fromiter(map(datetime.date.toordinal,values),np.int64,n)
+    if dateclass is datetime.date:
+        return ticks
+
+    def field(name):
+        return np.fromiter(map(operator.attrgetter(name),values),np.int64,n)
+
+    ticks *= 86400
+    ticks += field('hour')*3600 + field('minute')*60 + field('second')
+    ticks *= 1000000
+    ticks += field('microsecond')
+    return ticks
+
+
+def _asticks(values,dateclass):
+    # DESCRIPTION:
+    #    Convert dates to integer ticks of `dateclass`.
+    #
+    # RETURNS:
+    #    (ticks, unbounded) int64 and bool arrays with the shape of values.
+    #    Ticks are meaningless where unbounded (None/NaT) is True.
+    #
+    # RAISES:
+    #    TypeError: as _asraw
+    raw,offset = _asraw(values,dateclass)
+    return raw + offset,raw == _NAT
+
+
+def _castticks(values,dateclass):
+    # DESCRIPTION:
+    #    Like _asticks, but datetimes are truncated to dates when dateclass
+    #    is datetime.date, mirroring DateRange._cast.
+    if dateclass is datetime.date:
+        if isinstance(values,datetime.datetime):
+            values = values.date()
+        elif isinstance(values,(np.ndarray,np.datetime64)):
+            if _dateclass_of(values) is datetime.datetime:
+                values = np.asarray(values).astype('datetime64[D]')
+        elif values is not None and not isinstance(values,datetime.date):
+            values = [v.date() if isinstance(v,datetime.datetime) else v
+                      for v in values]
+    return _asticks(values,dateclass)
+
+
+def _tdticks(td,dateclass):
+    # DESCRIPTION:
+    #    Convert a datetime.timedelta or timedelta64 array into a tick delta.
+    #    Dates only move by whole days, as with `date + timedelta`.
+    us = np.asarray(td,dtype='timedelta64[us]').view(np.int64)
+    if dateclass is datetime.date:
+        return us//_DAY_TICKS
+    return us
+
+
+def _fillbounds(chunks,out,dateclass):
+    # DESCRIPTION:
+    #    Copy the bounds of a range cycle into preallocated arrays, one
+    #    arrayful at a time.
+    #
+    # PARAMS:
+    #    chunks: iterable of (lo, hi) int64 tick arrays
+    #       With the _UNBOUNDED_LO and _UNBOUNDED_HI sentinels on unbounded
+    #       sides, which are written as NaT.
+    #    out: (starts, ends)
+    #       Writable datetime64 arrays of one length, in days for dates and
+    #       microseconds for datetimes.
+    #
+    # RETURNS:
+    #    generator of int: the number of rows written each time the arrays
+    #    fill up, and once more for any rows left at the end. The arrays
+    #    are overwritten after each, so read them before resuming.
+    #
+    # RAISES:
+    #    TypeError: if the arrays are not datetime64 arrays of that unit
+    #    ValueError: if they differ in length or are empty
+    starts,ends = out
+    dtype = np.dtype('datetime64['+_UNIT[dateclass]+']')
+    for a in (starts,ends):
+        if not isinstance(a,np.ndarray) or a.dtype != dtype or a.ndim != 1:
+            raise TypeError('out must hold two 1-d '+str(dtype)+' arrays')
+    if len(starts) != len(ends) or len(starts) == 0:
+        raise ValueError('out must hold two arrays of the same, non-zero '+
+            'length')
+    starts = starts.view(np.int64)
+    ends = ends.view(np.int64)
+    size = len(starts)
+    offset = _OFFSET[dateclass]
+
+    filled = 0
+    for lo,hi in chunks:
+        i = 0
+        while i < len(lo):
+            m = min(size - filled,len(lo) - i)
+            rows = slice(filled,filled + m)
+            np.subtract(lo[i:i+m],offset,out=starts[rows])
+            np.subtract(hi[i:i+m],offset,out=ends[rows])
+            starts[rows][lo[i:i+m] == _UNBOUNDED_LO] = _NAT
+            ends[rows][hi[i:i+m] == _UNBOUNDED_HI] = _NAT
+            filled += m
+            i += m
+            if filled == size:
+                yield filled
+                filled = 0
+    if filled:
+        yield filled
+
+
+class DateRangeArray:
+    """A column of DateRanges backed by numpy arrays.
+
+    Bounds are kept as two int64 tick columns (the same ticks used inside
+    DateRange) with unbounded sides held as sentinels, so every method is a
+    handful of vectorized numpy operations rather than a Python loop.
+
+    Rows where the start is after the end are empty; they are produced by
+    `intersection` where a scalar DateRange would have returned None.
+    """
+
+    def __init__(self,starts,ends=None):
+        """Build a DateRangeArray from columns of bounds.
+
+        Args:
+            starts: numpy.datetime64 array | sequence of datetime.date[time]
+               One bound of each range. NaT or None is unbounded.
+
+            ends: numpy.datetime64 array | sequence of datetime.date[time] |
+                  datetime.timedelta | numpy.timedelta64 array
+               The other bound of each range, or a period from `starts`.
+
+        Notes:
+            As with DateRange, the two bounds of each row are reordered
+            chronologically and must share a date class. A datetime64 array
+            with a unit of days holds dates; any other unit holds datetimes.
+
+        Raises:
+            TypeError: if the bounds are not dates or have mismatched types.
+            ValueError: if `starts` and `ends` have different lengths.
+
+        Examples:
+            >>>import numpy as np
+            >>>DateRangeArray(np.array(['2012-01-01','2012-02-01'],'M8[D]'),
+            ...               np.timedelta64(10,'D'))
+        """
+        if not isinstance(starts,(np.ndarray,datetime.date)) and (
+           starts is not None):
+            starts = list(starts)
+
+        if ends is None:
+            ends = [None]*len(starts)
+        elif not isinstance(ends,(np.ndarray,datetime.date,datetime.timedelta,
+                                  np.timedelta64)):
+            ends = list(ends)
+
+        is_delta = (isinstance(ends,(datetime.timedelta,np.timedelta64)) or
+                    np.asarray(ends).dtype.kind == 'm')
+
+        dateclass = _dateclass_of(starts)
+        if dateclass is None and not is_delta:
+            dateclass = _dateclass_of(ends)
+
+        if dateclass is None:
+            if is_delta:
+                raise TypeError('Cannot add a timedelta to an unbounded '+
+                    'start')
+            lo = np.full(np.shape(starts),_UNBOUNDED_LO,dtype=np.int64)
+            hi = np.full(np.shape(starts),_UNBOUNDED_HI,dtype=np.int64)
+
+        else:
+            lo,lo_inf = _asticks(starts,dateclass)
+            if is_delta:
+                if lo_inf.any():
+                    raise TypeError('Cannot add a timedelta to an unbounded '+
+                        'start')
+                hi,hi_inf = lo + _tdticks(ends,dateclass),lo_inf
+            else:
+                hi,hi_inf = _asticks(ends,dateclass)
+
+            lo,hi = np.broadcast_arrays(lo,hi)
+            lo_inf,hi_inf = np.broadcast_arrays(lo_inf,hi_inf)
+            if lo.ndim != 1:
+                raise ValueError('Bounds must be one dimensional')
+
+            # If both bounds are finite order them chronologically
+            swap = ~lo_inf & ~hi_inf & (lo > hi)
+            lo,hi = np.where(swap,hi,lo),np.where(swap,lo,hi)
+            lo[lo_inf] = _UNBOUNDED_LO
+            hi[hi_inf] = _UNBOUNDED_HI
+
+        self._lo = np.ascontiguousarray(lo,dtype=np.int64)
+        self._hi = np.ascontiguousarray(hi,dtype=np.int64)
+        self._dateclass = dateclass
+
+
+    @classmethod
+    def _fromticks(cls,lo,hi,dateclass):
+        # Build straight from tick columns (sentinels already applied)
+        arr = cls.__new__(cls)
+        arr._lo = lo
+        arr._hi = hi
+        arr._dateclass = dateclass
+        return arr
+
+
+    @classmethod
+    def fromranges(cls,ranges):
+        # DESCRIPTION:
+        #    Build a DateRangeArray from an iterable of DateRanges.
+        #
+        # PARAMS:
+        #    ranges: iterable of DateRange | None
+        #       None entries become empty rows.
+        #
+        # RAISES:
+        #    TypeError: if the DateRanges mix dates and datetimes
+        ranges = list(ranges)
+        dateclass = None
+        lo = np.empty(len(ranges),dtype=np.int64)
+        hi = np.empty(len(ranges),dtype=np.int64)
+
+        for i,dr in enumerate(ranges):
+            if dr is None:
+                lo[i],hi[i] = _UNBOUNDED_HI,_UNBOUNDED_LO
+                continue
+            if dr._dateclass is not None:
+                if dateclass is None:
+                    dateclass = dr._dateclass
+                elif dr._dateclass is not dateclass:
+                    raise TypeError('Cannot mix '+str(dateclass)+' and '+
+                        str(dr._dateclass)+' DateRanges')
+            lo[i] = _UNBOUNDED_LO if dr._lo is None else dr._lo
+            hi[i] = _UNBOUNDED_HI if dr._hi is None else dr._hi
+
+        return cls._fromticks(lo,hi,dateclass)
+
+
+    def toranges(self):
+        # DESCRIPTION:
+        #    Convert to a list of DateRanges. Empty rows become None.
+        dateclass = self._dateclass
+        fromticks = DateRange._fromticks
+        out = []
+        for lo,hi in zip(self._lo.tolist(),self._hi.tolist()):
+            if lo > hi:
+                out.append(None)
+                continue
+            lo = None if lo == _UNBOUNDED_LO else lo
+            hi = None if hi == _UNBOUNDED_HI else hi
+            # As DateRange(None,None), a range unbounded on both sides has
+            # no date class
+            out.append(fromticks(lo,hi,None if lo is None and hi is None else
+                                       dateclass))
+        return out
+
+
+    def _bound(self,ticks,sentinel):
+        # Convert a tick column into datetime64 with NaT where unbounded
+        unit = _UNIT.get(self._dateclass,'us')
+        offset = _OFFSET.get(self._dateclass,0)
+        out = (ticks - offset).view('datetime64['+unit+']')
+        out[ticks == sentinel] = np.datetime64('NaT')
+        return out
+
+
+    def start(self):
+        # DESCRIPTION:
+        #    Get the earliest bound of each range as datetime64 (NaT when
+        #    unbounded). Dates are returned with a unit of days.
+        return self._bound(self._lo,_UNBOUNDED_LO)
+
+
+    def end(self):
+        # DESCRIPTION:
+        #    Get the latest bound of each range as datetime64 (NaT when
+        #    unbounded).
+        return self._bound(self._hi,_UNBOUNDED_HI)
+
+
+    def isempty(self):
+        # DESCRIPTION:
+        #    Boolean mask of rows that hold no range (from intersection).
+        return self._lo > self._hi
+
+
+    def _other_ticks(self,other):
+        # Ticks of a DateRange or DateRangeArray with sentinels applied
+        if other._dateclass is not None and self._dateclass is not None and (
+           other._dateclass is not self._dateclass):
+            raise TypeError('Cannot compare '+str(other._dateclass)+' to '+
+                str(self._dateclass))
+        if isinstance(other,DateRangeArray):
+            return other._lo,other._hi
+        return (_UNBOUNDED_LO if other._lo is None else other._lo,
+                _UNBOUNDED_HI if other._hi is None else other._hi)
+
+
+    def contains(self,other):
+        # DESCRIPTION:
+        #    Vectorized DateRange.__contains__ for every row.
+        #
+        # PARAMS:
+        #    other: datetime.date[time] | None | numpy.datetime64 array |
+        #           sequence of datetime.date[time] | DateRange |
+        #           DateRangeArray
+        #       Arrays are broadcast against the rows, so a column of values
+        #       the same length as this DateRangeArray is tested row by row.
+        #
+        # RETURNS:
+        #    numpy bool array
+        #
+        # NOTES:
+        #    Bounds are inclusive. A DateRange(Array) is only contained if
+        #    it lies fully inside the row. NaT and None are treated like
+        #    `None in dr`, as in DateRange.contains_many: they are inside the
+        #    rows that are unbounded on either side.
+        #
+        # RAISES:
+        #    TypeError: if other is not comparable to the bounds
+        lo,hi = self._lo,self._hi
+        nonempty = lo <= hi
+
+        if other is None:
+            return nonempty & ((lo == _UNBOUNDED_LO) | (hi == _UNBOUNDED_HI))
+
+        if isinstance(other,(DateRange,DateRangeArray)):
+            olo,ohi = self._other_ticks(other)
+            return nonempty & (lo <= olo) & (ohi <= hi)
+
+        if not isinstance(other,(np.ndarray,np.datetime64,datetime.date)):
+            other = list(other)
+
+        if self._dateclass is None:
+            return np.broadcast_to(nonempty,
+                np.broadcast_shapes(lo.shape,np.shape(other))).copy()
+
+        t,nat = _asticks(other,self._dateclass)
+        inside = (lo <= t) & (t <= hi)
+        if nat.any():
+            unbounded = nonempty & ((lo == _UNBOUNDED_LO) |
+                                    (hi == _UNBOUNDED_HI))
+            inside = np.where(nat,unbounded,inside)
+        return inside
+
+
+    def intersection(self,other):
+        # DESCRIPTION:
+        #    Vectorized DateRange.intersection.
+        #
+        # PARAMS:
+        #    other: DateRange | DateRangeArray
+        #
+        # RETURNS:
+        #    DateRangeArray. Rows that do not overlap are empty.
+        #
+        # RAISES:
+        #    TypeError: if other is not a DateRange(Array) of the same type
+        if not isinstance(other,(DateRange,DateRangeArray)):
+            raise TypeError('Can only intersect with a DateRange or '+
+                'DateRangeArray')
+        olo,ohi = self._other_ticks(other)
+        dateclass = self._dateclass or other._dateclass
+        return DateRangeArray._fromticks(np.maximum(self._lo,olo),
+                                         np.minimum(self._hi,ohi),dateclass)
+
+
+    def span(self):
+        # DESCRIPTION:
+        #    Vectorized DateRange.span, including the resolution of the
+        #    date class (a date range of a single day spans one day).
+        #
+        # RETURNS:
+        #    numpy.timedelta64 array, NaT where unbounded or empty.
+        unit = _UNIT.get(self._dateclass,'us')
+        lo,hi = self._lo,self._hi
+        bad = (lo == _UNBOUNDED_LO) | (hi == _UNBOUNDED_HI) | (lo > hi)
+        out = np.where(bad,0,hi - lo + 1).view('timedelta64['+unit+']')
+        out[bad] = np.timedelta64('NaT')
+        return out
+
+
+    def _shift(self,ticks,dt):
+        # DESCRIPTION:
+        #    Shift a tick column by dt, leaving sentinels alone.
+        #
+        # RAISES:
+        #    OverflowError: if a shifted bound is out of the date class' range
+        fixed = (ticks == _UNBOUNDED_LO) | (ticks == _UNBOUNDED_HI)
+        shifted = np.where(fixed,ticks,ticks + dt)
+        if self._dateclass is None:
+            return shifted
+        lo,hi = _MIN_TICKS[self._dateclass],_MAX_TICKS[self._dateclass]
+        if ((~fixed) & ((shifted < lo) | (shifted > hi))).any():
+            raise OverflowError('date value out of range')
+        return shifted
+
+
+    def slide(self,td):
+        # DESCRIPTION:
+        #    Vectorized DateRange.slide.
+        #
+        # PARAMS:
+        #    td: datetime.timedelta | numpy.timedelta64 array
+        #       Dates only move by whole days, as with `date + timedelta`.
+        #
+        # RAISES:
+        #    OverflowError: if a bound moves out of the date class' range
+        if self._dateclass is None:
+            return DateRangeArray._fromticks(self._lo.copy(),self._hi.copy(),
+                                             None)
+        dt = _tdticks(td,self._dateclass)
+        return DateRangeArray._fromticks(
+            self._shift(self._lo,dt),self._shift(self._hi,dt),
+            self._dateclass)
+
+
+    def _rebound(self,lo,hi):
+        # Reorder like DateRange.__init__ (sentinels sort correctly). Empty
+        # rows stay empty.
+        empty = self.isempty()
+        lo,hi = np.broadcast_arrays(lo,hi)
+        return DateRangeArray._fromticks(
+            np.where(empty,self._lo,np.minimum(lo,hi)),
+            np.where(empty,self._hi,np.maximum(lo,hi)),self._dateclass)
+
+
+    def _newbound(self,d):
+        # Ticks for a replacement bound in startat/endat
+        if self._dateclass is None:
+            raise TypeError('Cannot set a bound of an unbounded '+
+                'DateRangeArray')
+        return _castticks(d,self._dateclass)
+
+
+    def startat(self,d):
+        # DESCRIPTION:
+        #    Vectorized DateRange.startat: new ranges from `d` to end().
+        #
+        # PARAMS:
+        #    d: datetime.timedelta | numpy.timedelta64 array |
+        #       datetime.date[time] | None | numpy.datetime64 array
+        #       A timedelta moves each start; anything else replaces it.
+        #
+        # RAISES:
+        #    TypeError: if a timedelta is applied to an unbounded start
+        #    OverflowError: if a moved bound is out of the date class' range
+        if isinstance(d,(datetime.timedelta,np.timedelta64)) or (
+           isinstance(d,np.ndarray) and d.dtype.kind == 'm'):
+            if (self._lo == _UNBOUNDED_LO).any():
+                raise TypeError('Cannot add a timedelta to an unbounded '+
+                    'start')
+            return self._rebound(
+                self._shift(self._lo,_tdticks(d,self._dateclass)),self._hi)
+
+        if d is None:
+            lo = np.full_like(self._lo,_UNBOUNDED_LO)
+        else:
+            t,nat = self._newbound(d)
+            lo = np.where(nat,_UNBOUNDED_LO,t)
+        return self._rebound(lo,self._hi)
+
+
+    def endat(self,d):
+        # DESCRIPTION:
+        #    Vectorized DateRange.endat: new ranges from start() to `d`.
+        #
+        # PARAMS:
+        #    d: datetime.timedelta | numpy.timedelta64 array |
+        #       datetime.date[time] | None | numpy.datetime64 array
+        #       A timedelta moves each end; anything else replaces it.
+        #
+        # RAISES:
+        #    TypeError: if a timedelta is applied to an unbounded end
+        #    OverflowError: if a moved bound is out of the date class' range
+        if isinstance(d,(datetime.timedelta,np.timedelta64)) or (
+           isinstance(d,np.ndarray) and d.dtype.kind == 'm'):
+            if (self._hi == _UNBOUNDED_HI).any():
+                raise TypeError('Cannot add a timedelta to an unbounded end')
+            return self._rebound(
+                self._lo,self._shift(self._hi,_tdticks(d,self._dateclass)))
+
+        if d is None:
+            hi = np.full_like(self._hi,_UNBOUNDED_HI)
+        else:
+            t,nat = self._newbound(d)
+            hi = np.where(nat,_UNBOUNDED_HI,t)
+        return self._rebound(self._lo,hi)
+
+    #----------------------------------------------------------------
+    #|                          Specials                            |
+    #----------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._lo)
+
+
+    def __iter__(self):
+        return iter(self.toranges())
+
+
+    def __getitem__(self,i):
+        if isinstance(i,(int,np.integer)):
+            lo,hi = int(self._lo[i]),int(self._hi[i])
+            if lo > hi:
+                return None
+            return DateRange._fromticks(None if lo == _UNBOUNDED_LO else lo,
+                                        None if hi == _UNBOUNDED_HI else hi,
+                                        self._dateclass)
+        return DateRangeArray._fromticks(self._lo[i],self._hi[i],
+                                         self._dateclass)
+
+
+    def __str__(self):
+        return 'DateRangeArray('+str(len(self))+' ranges)'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    def __reduce__(self):
+        # Pickle as one buffer in the format of eon.serial, which is
+        # unpickled into tick columns without copying them again
+        from eon.serial import dumps,toarray
+        return toarray,(dumps(self),)
+
+
+    def __add__(self,td):
+        return self.slide(td)
+
+
+    def __sub__(self,td):
+        return self.slide(-td)
+
+
+#----------------------------------------------------------------
+#|          Vectorized day of year and pentad conversions        |
+#----------------------------------------------------------------
+# These mirror the scalar functions of the same names in eon, taking and
+# returning numpy arrays (scalars and sequences are converted).
+
+def _ordinals(values):
+    # Day ordinals of dates, datetimes or a datetime64 array, with datetimes
+    # truncated to their day
+    ordinals,nat = _castticks(values,datetime.date)
+    if nat.any():
+        raise TypeError('Cannot convert None/NaT to a day of year')
+    return ordinals
+
+
+def _jan1(year):
+    # Ordinal of January 1st of each year
+    return _ordinal(np.asarray(year,dtype=np.int64),1,1)
+
+
+def _roll_pentad(year,pentad):
+    # Move pentads outside [1,73] into the neighbouring years, as
+    # eon.bound_pentad does
+    pentad = np.asarray(pentad,dtype=np.int64) - 1
+    return (np.asarray(year,dtype=np.int64) + pentad//73,pentad % 73 + 1)
+
+
+def date_to_dayofyear(values):
+    # DESCRIPTION:
+    #    Day of year of each date, in the range [1,366].
+    #
+    # PARAMS:
+    #    values: numpy.datetime64 array | sequence of datetime.date[time]
+    #
+    # RETURNS:
+    #    numpy int64 array
+    #
+    # RAISES:
+    #    TypeError: if the values are not dates, or contain None/NaT
+    days = (_ordinals(values) - _ORDINAL_1970).view('datetime64[D]')
+    return (days - days.astype('datetime64[Y]')).view(np.int64) + 1
+
+
+def dayofyear_to_date(year,doy):
+    # DESCRIPTION:
+    #    Dates from years and days of year, broadcast against each other.
+    #
+    # RETURNS:
+    #    numpy datetime64[D] array
+    ordinals = _jan1(year) + np.asarray(doy,dtype=np.int64) - 1
+    return (ordinals - _ORDINAL_1970).view('datetime64[D]')
+
+
+def dayofyear_to_datetime(year,doy):
+    # DESCRIPTION:
+    #    As dayofyear_to_date, at midnight.
+    #
+    # RETURNS:
+    #    numpy datetime64[us] array
+    return dayofyear_to_date(year,doy).astype('datetime64[us]')
+
+
+def date_to_pentad(values):
+    # DESCRIPTION:
+    #    Yearly pentad of each date, in the range [1,73]. As in
+    #    eon.date_to_pentad, day 366 of a leap year is in pentad 73.
+    #
+    # PARAMS:
+    #    values: numpy.datetime64 array | sequence of datetime.date[time] |
+    #            integer array of days of year
+    #
+    # RETURNS:
+    #    numpy int64 array
+    #
+    # RAISES:
+    #    TypeError: if the values are not dates or integers, or contain
+    #               None/NaT
+    if not isinstance(values,(np.ndarray,np.datetime64,datetime.date)):
+        values = list(values)
+    if np.asarray(values).dtype.kind in 'iu':
+        doy = np.asarray(values,dtype=np.int64)
+    else:
+        doy = date_to_dayofyear(values)
+    return (np.minimum(doy,365) - 1)//5 + 1
+
+
+def pentad_to_dayofyear(pentad):
+    # DESCRIPTION:
+    #    Day of year on which each pentad starts. This is the same in leap
+    #    years.
+    #
+    # RETURNS:
+    #    numpy int64 array
+    #
+    # RAISES:
+    #    ValueError: if a pentad is outside [1,73]
+    pentad = np.asarray(pentad,dtype=np.int64)
+    if ((pentad < 1) | (pentad > 73)).any():
+        raise ValueError('pentad out of range')
+    return (pentad - 1)*5 + 1
+
+
+def pentad_to_date(year,pentad):
+    # DESCRIPTION:
+    #    First day of each pentad, as a numpy datetime64[D] array.
+    #
+    # RAISES:
+    #    ValueError: if a pentad is outside [1,73]
+    return dayofyear_to_date(year,pentad_to_dayofyear(pentad))
+
+
+def pentad_to_datetime(year,pentad):
+    # DESCRIPTION:
+    #    Midnight starting each pentad, as a numpy datetime64[us] array.
+    #    Pentads outside [1,73] roll into the neighbouring years.
+    year,pentad = _roll_pentad(year,pentad)
+    return dayofyear_to_datetime(year,pentad_to_dayofyear(pentad))
+
+
+def pentad_to_daterange(year,pentad):
+    # DESCRIPTION:
+    #    Batched eon.pentad_to_daterange: the datetime range covered by each
+    #    pentad, from its first midnight to the microsecond before the next
+    #    pentad. Pentad 73 runs to the end of the year, so it is six days
+    #    long in leap years. Pentads outside [1,73] roll into the
+    #    neighbouring years.
+    #
+    # PARAMS:
+    #    year: int | integer array
+    #    pentad: int | integer array
+    #       Broadcast against year.
+    #
+    # RETURNS:
+    #    DateRangeArray of datetime ranges
+    year,pentad = _roll_pentad(year,pentad)
+    year,pentad = np.broadcast_arrays(np.atleast_1d(year),pentad)
+    if year.ndim != 1:
+        raise ValueError('Years and pentads must be one dimensional')
+
+    first = _jan1(year) + 5*(pentad - 1)
+    last = np.where(pentad == 73,_jan1(year + 1),first + 5)
+    return DateRangeArray._fromticks(first*_DAY_TICKS,last*_DAY_TICKS - 1,
+                                     datetime.datetime)
@@ -0,0 +1,212 @@
+# eon.binning
+# Assigning arrays of timestamps to the DateRanges of a range cycle
+import collections
+
+import numpy as np
+
+from eon.array import DateRangeArray, _castticks
+from eon.cycles import Cycle, _DAY_UNITS as _UNITS
+
+Aggregate = collections.namedtuple('Aggregate',
+                                   ['index','count','sum','min','max'])
+Aggregate.__doc__ = """Per-timestamp bucket indices and per-bucket statistics.
+
+    index: int64 array, the bucket of each timestamp or -1 if it is in none
+    count: int64 array, the number of timestamps in each bucket
+    sum, min, max: arrays over each bucket of the accompanying values, or
+        None if no values were given. Empty buckets have a sum of 0 and a
+        min and max of NaN (NaT for datetime64 values, which have no sum).
+"""
+
+
+class Binning:
+    """The buckets of a range cycle (rdays, rpentads, rmonths or ryears).
+
+    The buckets are the exact DateRanges the range cycle generator yields
+    for the same snap, reverse and full, and in the same order, but they
+    are computed in closed form and stored as sorted tick edges. Assigning
+    timestamps to them is then a single numpy searchsorted, with no test
+    of each timestamp against each bucket.
+    """
+
+    def __init__(self,dr,unit,snap=False,reverse=False,full=False):
+        """Compute the buckets of a range cycle of a DateRange.
+
+        Args:
+            dr: DateRange
+               Must be bounded on both sides.
+            unit: 'days' | 'pentads' | 'months' | 'years'
+            snap: [False] | bool
+            reverse: [False] | bool
+            full: [False] | bool
+               As for DateRange.rdays() and the other range cycles.
+
+        Raises:
+            ValueError: if unit is unknown or dr is unbounded.
+
+        Examples:
+            >>>b = Binning(DateRange(datetime(2012,1,15),datetime(2012,4,1)),
+            ...            'months',snap=True)
+            >>>b.aggregate(timestamps,values).sum
+        """
+        if unit not in _UNITS:
+            raise ValueError('Unknown cycle unit: '+str(unit))
+        for flag,name in ((snap,'snap'),(reverse,'reverse'),(full,'full')):
+            if not (flag is True or flag is False):
+                raise ValueError(name+' must be True or False.')
+        if dr._lo is None or dr._hi is None:
+            raise ValueError('Cannot bin an unbounded DateRange')
+
+        cycle = Cycle(dr,unit,snap=snap,reverse=reverse)
+        values = cycle._at(np.arange(len(cycle),dtype=np.int64))
+        lo,hi = dr._lo,dr._hi
+
+        # Forward, each value starts a bucket that runs until the tick
+        # before the next value. In reverse, each value ends a bucket that
+        # runs from the tick after the next value. Without full, partial
+        # buckets also cover the stretches between the first and last
+        # values and the bounds of dr (rcycle).
+        if reverse is True:
+            values = values[::-1]
+            if full is True:
+                starts,stops = values[:-1] + 1,values[1:]
+            else:
+                starts = np.concatenate(([lo],values + 1))
+                stops = np.concatenate((values,[hi]))
+        else:
+            if full is True:
+                starts,stops = values[:-1],values[1:] - 1
+            else:
+                edges = values[values != lo]
+                starts = np.concatenate(([lo],edges))
+                stops = np.concatenate((edges - 1,[hi]))
+
+        # Drop the empty bucket left when a reversed cycle starts on hi
+        keep = starts <= stops
+        self._starts = np.ascontiguousarray(starts[keep],dtype=np.int64)
+        self._stops = np.ascontiguousarray(stops[keep],dtype=np.int64)
+        self._reverse = reverse
+        self._dateclass = dr._dateclass
+
+
+    def ranges(self):
+        # DESCRIPTION:
+        #    The buckets, in the order the range cycle generator yields
+        #    them.
+        #
+        # RETURNS:
+        #    eon.array.DateRangeArray
+        starts,stops = self._starts,self._stops
+        if self._reverse is True:
+            starts,stops = starts[::-1].copy(),stops[::-1].copy()
+        return DateRangeArray._fromticks(starts,stops,self._dateclass)
+
+
+    def index(self,timestamps):
+        # DESCRIPTION:
+        #    Find the bucket of each timestamp.
+        #
+        # PARAMS:
+        #    timestamps: numpy.datetime64 array | sequence of
+        #                datetime.date[time]
+        #       Datetimes are truncated to dates when binning a date range,
+        #       as DateRange does.
+        #
+        # RETURNS:
+        #    numpy int64 array of positions in ranges(), -1 for timestamps
+        #    outside every bucket
+        #
+        # RAISES:
+        #    TypeError: if the timestamps are not comparable to the buckets,
+        #               or contain None/NaT
+        t,nat = _castticks(timestamps,self._dateclass)
+        if nat.any():
+            raise TypeError('Cannot bin None/NaT')
+        t = np.atleast_1d(t)
+        if len(self) == 0:
+            return np.full(t.shape,-1,dtype=np.int64)
+        i = np.searchsorted(self._starts,t,side='right') - 1
+        inside = (i >= 0) & (t <= self._stops[np.maximum(i,0)])
+        if self._reverse is True:
+            i = len(self) - 1 - i
+        return np.where(inside,i,-1)
+
+
+    def aggregate(self,timestamps,values=None):
+        # DESCRIPTION:
+        #    Bin timestamps and summarize an accompanying column of values
+        #    per bucket.
+        #
+        # PARAMS:
+        #    timestamps: as for index()
+        #    [values=None]: numpy array
+        #       One value per timestamp, e.g. a measurement. Any dtype that
+        #       numpy can add and compare, including timedelta64.
+        #
+        # RETURNS:
+        #    Aggregate(index, count, sum, min, max)
+        #
+        # NOTES:
+        #    The values are grouped with one stable argsort of the bucket
+        #    indices (skipped when the timestamps are already in bucket
+        #    order) followed by ufunc.reduceat, so every statistic is a
+        #    single vectorized pass. Boolean and integer values are summed
+        #    in int64 (uint64 if unsigned), so sums are exact unless they
+        #    overflow 64 bits.
+        #
+        # RAISES:
+        #    TypeError: as index()
+        #    ValueError: if values does not have one entry per timestamp
+        index = self.index(timestamps)
+        n = len(self)
+        inside = index >= 0
+        count = np.bincount(index[inside],minlength=n)
+        if values is None:
+            return Aggregate(index,count,None,None,None)
+
+        values = np.asarray(values)
+        if values.shape != index.shape:
+            raise ValueError('Expected '+str(len(index))+' values, got '+
+                str(values.shape))
+
+        keys = index[inside]
+        values = values[inside]
+        if len(keys) > 1 and (np.diff(keys) < 0).any():
+            # A stable sort of small integers is a radix sort in numpy
+            if n <= 1 << 16:
+                keys = keys.astype(np.uint16)
+            values = values[np.argsort(keys,kind='stable')]
+
+        nonempty = count > 0
+        offsets = (np.cumsum(count) - count)[nonempty]
+
+        def reduce(ufunc,empty,dtype=None):
+            if empty is not None:
+                out = np.full(n,empty,dtype=np.result_type(values,empty))
+            else:
+                out = np.zeros(n,dtype=dtype or values.dtype)
+            if len(offsets):
+                out[nonempty] = ufunc.reduceat(values,offsets,dtype=dtype)
+            return out
+
+        missing = np.datetime64('NaT') if values.dtype.kind == 'M' else (
+                  np.timedelta64('NaT') if values.dtype.kind == 'm' else
+                  np.nan)
+        # Add booleans and small integers at full width, as numpy's sum() does
+        kind = values.dtype.kind
+        wide = (np.uint64 if kind == 'u' else np.int64) if kind in 'biu' else (
+                None)
+        total = None if kind == 'M' else reduce(np.add,None,wide)
+        return Aggregate(index,count,total,reduce(np.minimum,missing),
+                         reduce(np.maximum,missing))
+
+
+    def __len__(self):
+        return len(self._starts)
+
+
+    def __str__(self):
+        return 'Binning('+str(len(self))+' buckets)'
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,421 @@
+# eon.busdays
+# Business-day calendars and the business-day cycles of a DateRange
+import array
+import datetime
+import itertools
+
+from eon import _DAY_TICKS, _MAX_TICKS, _from_ticks, _to_ticks
+
+_WEEKDAYS = ('Mon','Tue','Wed','Thu','Fri','Sat','Sun')
+_TICKS_PER_DAY = { datetime.date: 1, datetime.datetime: _DAY_TICKS }
+_MAX_ORDINAL = datetime.date.max.toordinal()
+_ROLLS = ('forward','backward','raise')
+
+
+def _weekmask(mask):
+    # DESCRIPTION:
+    #    Read a weekmask the way numpy.busdaycalendar does.
+    #
+    # PARAMS:
+    #    mask: str | sequence
+    #       Seven '1'/'0' characters from Monday to Sunday ('1111100'),
+    #       weekday names ('Mon Tue Wed Thu Fri'), or seven bools or ints.
+    #
+    # RETURNS:
+    #    tuple of 7 ints (1 for business days)
+    #
+    # RAISES:
+    #    ValueError: if mask cannot be read or has no business days
+    if isinstance(mask,str):
+        if len(mask) == 7 and set(mask) <= set('01'):
+            out = tuple(int(c) for c in mask)
+        else:
+            names = mask.split()
+            if not names or any(name not in _WEEKDAYS for name in names):
+                raise ValueError('Cannot read weekmask '+repr(mask))
+            out = tuple(int(day in names) for day in _WEEKDAYS)
+    else:
+        out = tuple(int(bool(day)) for day in mask)
+        if len(out) != 7:
+            raise ValueError('A weekmask needs 7 days, not '+str(len(out)))
+    if not any(out):
+        raise ValueError('A weekmask needs at least one business day')
+    return out
+
+
+def _ordinals(holidays):
+    # Day ordinals of dates, datetimes or a datetime64 array
+    if hasattr(holidays,'dtype'):
+        import numpy as np
+        from eon.array import _ORDINAL_1970
+        days = np.asarray(holidays).astype('datetime64[D]')
+        days = days[~np.isnat(days)]
+        return (days.view(np.int64) + _ORDINAL_1970).tolist()
+    return [d.toordinal() for d in holidays]
+
+
+class BusinessCalendar:
+    """Which days are business days: a weekmask and a list of holidays.
+
+    The calendar is compiled once into a map of the days from its first to
+    its last holiday, with a running count of the business days before
+    each. Outside that stretch only the weekmask applies, and the count is
+    arithmetic on whole weeks. Counting the business days between two dates
+    and finding the n-th business day after a date are then a few lookups,
+    however far apart the dates are.
+    """
+
+    def __init__(self,weekmask='1111100',holidays=()):
+        """Compile a business-day calendar.
+
+        Args:
+            weekmask: ['1111100'] | str | sequence
+               The business days of the week from Monday, as seven '1'/'0'
+               characters, weekday names ('Mon Tue Wed Thu Fri') or seven
+               bools, as for numpy.busdaycalendar.
+            holidays: [()] | iterable of datetime.date[time] |
+                      numpy datetime64 array
+               Days that are not business days. Their order does not matter
+               and NaT values are ignored.
+
+        Raises:
+            ValueError: if weekmask cannot be read or has no business days.
+
+        Examples:
+            >>>cal = BusinessCalendar(holidays=[date(2012,12,25),
+            ...                                 date(2013,1,1)])
+            >>>cal.offset(date(2012,12,24),1)
+            datetime.date(2012, 12, 26)
+        """
+        mask = _weekmask(weekmask)
+        ordinals = sorted(o for o in set(_ordinals(holidays))
+                          if mask[(o - 1) % 7])
+
+        if ordinals:
+            base = ordinals[0]
+            size = ordinals[-1] - base + 1
+        else:
+            base,size = 1,0
+
+        # One byte per day, starting with the weekday of base
+        first = (base - 1) % 7
+        week = bytes(mask[first:] + mask[:first])
+        bitmap = bytearray(week*(size//7 + 1))[:size]
+        for o in ordinals:
+            bitmap[o - base] = 0
+
+        self._mask = mask
+        self._week = sum(mask)
+        self._weekrank = tuple(itertools.accumulate(mask,initial=0))
+        self._weekdays = tuple(i for i in range(7) if mask[i])
+        self._holidays = tuple(ordinals)
+        self._base = base
+        self._size = size
+        self._bitmap = bytes(bitmap)
+        self._rank = array.array('q',itertools.accumulate(bitmap,initial=0))
+        self._days = array.array('q',(base + i for i in range(size)
+                                      if bitmap[i]))
+        self._below = self._weekly(base)
+
+
+    #----------------------------------------------------------------
+    #|                  Ranks of business days                      |
+    #----------------------------------------------------------------
+
+    def _weekly(self,o):
+        # Number of weekmask days before ordinal o, counted from ordinal 1
+        q,r = divmod(o - 1,7)
+        return q*self._week + self._weekrank[r]
+
+
+    def _count(self,o):
+        # DESCRIPTION:
+        #    Number of business days before ordinal o, counted from
+        #    ordinal 1 (it is negative before then, but still increases by
+        #    one at every business day).
+        i = o - self._base
+        if i < 0:
+            return self._weekly(o)
+        if i <= self._size:
+            return self._below + self._rank[i]
+        return self._weekly(o) - len(self._holidays)
+
+
+    def _select(self,k):
+        # DESCRIPTION:
+        #    The inverse of _count: the ordinal of the business day with k
+        #    business days before it.
+        j = k - self._below
+        if j >= 0:
+            if j < len(self._days):
+                return self._days[j]
+            k += len(self._holidays)
+        q,r = divmod(k,self._week)
+        return 1 + 7*q + self._weekdays[r]
+
+
+    def _isbusday(self,o):
+        i = o - self._base
+        if 0 <= i < self._size:
+            return self._bitmap[i] == 1
+        return self._mask[(o - 1) % 7] == 1
+
+
+    def _roll(self,o,roll):
+        # DESCRIPTION:
+        #    The rank of ordinal o, rolled to a business day.
+        #
+        # RAISES:
+        #    ValueError: if o is not a business day and roll is 'raise'
+        k = self._count(o)
+        if self._isbusday(o):
+            return k
+        if roll == 'forward':
+            return k
+        if roll == 'backward':
+            return k - 1
+        raise ValueError(str(datetime.date.fromordinal(o))+
+            ' is not a business day')
+
+
+    def _span(self,dr,snap=False,reverse=False):
+        # DESCRIPTION:
+        #    The days a day cycle of dr visits, i.e. those of
+        #    dr.days(snap=snap,reverse=reverse).
+        #
+        # RETURNS:
+        #    (first, last, offset): the ordinals of the first and last day
+        #    and the time of day, in ticks, of every value
+        #
+        # RAISES:
+        #    ValueError: if the cycle would start at an unbounded side
+        dateclass = dr._dateclass
+        lo,hi = dr._lo,dr._hi
+        if (hi if reverse else lo) is None:
+            raise ValueError('Cannot start at infinity.')
+        if dateclass is datetime.date:
+            return (1 if lo is None else lo,
+                    _MAX_ORDINAL if hi is None else hi,0)
+
+        if snap is True:
+            offset = 0
+        else:
+            offset = (hi if reverse else lo) % _DAY_TICKS
+        if lo is None:
+            first = 1
+        else:
+            first = -((offset - lo)//_DAY_TICKS)
+        if hi is None:
+            last = (_MAX_TICKS[dateclass] - offset)//_DAY_TICKS
+        else:
+            last = (hi - offset)//_DAY_TICKS
+        return first,last,offset
+
+
+    #----------------------------------------------------------------
+    #|                         Public API                           |
+    #----------------------------------------------------------------
+
+    def is_busday(self,d):
+        # DESCRIPTION:
+        #    Whether a date[time] falls on a business day.
+        return self._isbusday(d.toordinal())
+
+
+    def count(self,dr,snap=False,reverse=False):
+        # DESCRIPTION:
+        #    The number of business days in a DateRange, in constant time.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #       Must be bounded on both sides.
+        #    [snap=False]: bool
+        #    [reverse=False]: bool
+        #       As for DateRange.busdays(), whose values are counted. These
+        #       only matter for datetime ranges, where a day counts if the
+        #       cycle visits it.
+        #
+        # RETURNS:
+        #    int
+        #
+        # RAISES:
+        #    ValueError: if dr is unbounded
+        if dr._lo is None or dr._hi is None:
+            raise ValueError('Cannot count the days of an unbounded '+
+                'DateRange')
+        first,last,_ = self._span(dr,snap,reverse)
+        if first > last:
+            return 0
+        return self._count(last + 1) - self._count(first)
+
+
+    def offset(self,d,n=0,roll='forward'):
+        # DESCRIPTION:
+        #    The n-th business day after d (before it if n is negative), in
+        #    constant time. Like numpy.busday_offset, but datetimes keep
+        #    their time of day.
+        #
+        # PARAMS:
+        #    d: datetime.date[time]
+        #    [n=0]: int
+        #    [roll='forward']: 'forward' | 'backward' | 'raise'
+        #       Where to start counting if d is not a business day: at the
+        #       next business day, the previous one, or nowhere.
+        #
+        # RETURNS:
+        #    The same type as d
+        #
+        # RAISES:
+        #    ValueError: if d is not a business day and roll is 'raise', or
+        #                roll is unknown
+        #    OverflowError: if the result is out of the date class' range
+        if roll not in _ROLLS:
+            raise ValueError("roll must be 'forward', 'backward' or 'raise'")
+        dateclass = datetime.datetime if isinstance(
+            d,datetime.datetime) else datetime.date
+        tpd = _TICKS_PER_DAY[dateclass]
+        o,offset = divmod(_to_ticks(d,dateclass),tpd)
+        o = self._select(self._roll(o,roll) + n)
+        if not 1 <= o <= _MAX_ORDINAL:
+            raise OverflowError('date value out of range')
+        return _from_ticks(o*tpd + offset,dateclass)
+
+
+    def offsets(self,values,n=0,roll='forward'):
+        # DESCRIPTION:
+        #    Vectorized offset(): the n-th business day after every value,
+        #    with no loop over the values. Requires numpy.
+        #
+        # PARAMS:
+        #    values: numpy datetime64 array | sequence of datetime.date[time]
+        #    [n=0]: int | int array broadcastable against values
+        #    [roll='forward']: 'forward' | 'backward' | 'raise'
+        #
+        # RETURNS:
+        #    numpy datetime64 array, in days for dates and in microseconds
+        #    otherwise. NaT (or None) stays NaT.
+        #
+        # RAISES:
+        #    ValueError: if a value is not a business day and roll is
+        #                'raise', or roll is unknown
+        #    OverflowError: if a result is out of the years 1-9999
+        import numpy as np
+        from eon.array import _OFFSET, _UNIT, _NAT, _asticks, _dateclass_of
+
+        if roll not in _ROLLS:
+            raise ValueError("roll must be 'forward', 'backward' or 'raise'")
+        dateclass = _dateclass_of(values) or datetime.date
+        tpd = _TICKS_PER_DAY[dateclass]
+        ticks,missing = _asticks(values,dateclass)
+        ticks = np.where(missing,_DAY_TICKS,ticks)
+        o,offset = np.divmod(ticks,tpd)
+
+        busday = self._isbusdays(o)
+        k = self._counts(o)
+        if roll == 'raise':
+            if not (busday | missing).all():
+                bad = o[~(busday | missing)].flat[0]
+                raise ValueError(str(datetime.date.fromordinal(int(bad)))+
+                    ' is not a business day')
+        elif roll == 'backward':
+            k = k - ~busday
+
+        o = self._selects(k + np.asarray(n,dtype=np.int64))
+        if ((o < 1) | (o > _MAX_ORDINAL))[~missing].any():
+            raise OverflowError('date value out of range')
+        out = o*tpd + offset - _OFFSET[dateclass]
+        return np.where(missing,_NAT,out).view('datetime64['+
+            _UNIT[dateclass]+']')
+
+
+    def _isbusdays(self,o):
+        # Vectorized _isbusday
+        import numpy as np
+        mask = np.array(self._mask,dtype=bool)[(o - 1) % 7]
+        i = o - self._base
+        inside = (i >= 0) & (i < self._size)
+        if inside.any():
+            bitmap = np.frombuffer(self._bitmap,dtype=np.uint8).astype(bool)
+            mask[inside] = bitmap[i[inside]]
+        return mask
+
+
+    def _counts(self,o):
+        # Vectorized _count
+        import numpy as np
+        q,r = np.divmod(o - 1,7)
+        k = q*self._week + np.array(self._weekrank,dtype=np.int64)[r]
+        i = o - self._base
+        k[i > self._size] -= len(self._holidays)
+        inside = (i >= 0) & (i <= self._size)
+        if inside.any():
+            rank = np.frombuffer(self._rank,dtype=np.int64)
+            k[inside] = self._below + rank[i[inside]]
+        return k
+
+
+    def _selects(self,k):
+        # Vectorized _select
+        import numpy as np
+        j = k - self._below
+        days = len(self._days)
+        inside = (j >= 0) & (j < days)
+        k = np.where(j >= days,k + len(self._holidays),k)
+        q,r = np.divmod(k,self._week)
+        o = 1 + 7*q + np.array(self._weekdays,dtype=np.int64)[r]
+        if inside.any():
+            o[inside] = np.frombuffer(self._days,dtype=np.int64)[j[inside]]
+        return o
+
+
+    def busdays(self,dr,n=0,snap=False,reverse=False,array=False):
+        # DESCRIPTION:
+        #    The business days of a DateRange. See DateRange.busdays().
+        #
+        # RETURNS:
+        #    generator of date[time], or a numpy datetime64 array if array
+        #    is True
+        first,last,offset = self._span(dr,snap,reverse)
+        a,b = self._count(first),self._count(last + 1)
+        if n != 0:
+            if reverse is True:
+                a = max(a,b - n)
+            else:
+                b = min(b,a + n)
+
+        if array is True:
+            import numpy as np
+            from eon.array import _OFFSET, _UNIT
+            dateclass = dr._dateclass
+            if dr._lo is None or dr._hi is None:
+                if n == 0:
+                    raise ValueError('Cannot make an array of an unbounded '+
+                        'cycle, give a number of values n')
+            k = np.arange(a,b,dtype=np.int64)
+            if reverse is True:
+                k = k[::-1]
+            ticks = self._selects(k)*_TICKS_PER_DAY[dateclass] + offset
+            return (ticks - _OFFSET[dateclass]).view(
+                'datetime64['+_UNIT[dateclass]+']')
+        return self._busdays(dr._dateclass,a,b,offset,reverse)
+
+
+    def _busdays(self,dateclass,a,b,offset,reverse):
+        tpd = _TICKS_PER_DAY[dateclass]
+        select = self._select
+        ks = range(b - 1,a - 1,-1) if reverse is True else range(a,b)
+        for k in ks:
+            yield _from_ticks(select(k)*tpd + offset,dateclass)
+
+
+    def __str__(self):
+        days = ' '.join(day for day,bit in zip(_WEEKDAYS,self._mask) if bit)
+        return ('BusinessCalendar('+days+', '+str(len(self._holidays))+
+                ' holidays)')
+
+    def __repr__(self):
+        return self.__str__()
+
+
+# Monday to Friday, with no holidays
+WEEKDAYS = BusinessCalendar()
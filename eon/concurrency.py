@@ -0,0 +1,216 @@
+# eon.concurrency
+# How many of a collection of DateRanges are active over time
+import bisect
+import datetime
+import sys
+
+from eon import DateRange, _NEG_INF, _POS_INF, _TICK, _to_ticks
+
+
+def _edges(ranges):
+    # DESCRIPTION:
+    #    Sorted start and stop ticks of a collection of DateRanges. A range
+    #    is active on the half-open stretch [start, end + resolution), so
+    #    inclusive bounds that touch count as overlapping and ranges that
+    #    are merely adjacent do not.
+    #
+    # RETURNS:
+    #    (starts, stops, dateclass)
+    #
+    # RAISES:
+    #    TypeError: if the ranges are not DateRanges or mix date classes
+    array = sys.modules.get('eon.array') # Only loaded if numpy is used
+    if array is not None and isinstance(ranges,array.DateRangeArray):
+        return _array_edges(ranges)
+
+    dateclass = None
+    starts = []
+    stops = []
+    for dr in ranges:
+        if dr is None:
+            continue
+        if not isinstance(dr,DateRange):
+            raise TypeError('Expected DateRanges, not '+str(type(dr)))
+        if dr._dateclass is not None:
+            if dateclass is None:
+                dateclass = dr._dateclass
+            elif dr._dateclass is not dateclass:
+                raise TypeError('Cannot mix '+str(dateclass)+' and '+
+                    str(dr._dateclass)+' DateRanges')
+        starts.append(_NEG_INF if dr._lo is None else dr._lo)
+        stops.append(_POS_INF if dr._hi is None else dr._hi + 1)
+    starts.sort()
+    stops.sort()
+    return starts,stops,dateclass
+
+
+def _array_edges(arr):
+    # _edges for a DateRangeArray, sorting the tick columns with numpy
+    import numpy as np
+    from eon.array import _UNBOUNDED_LO,_UNBOUNDED_HI
+
+    keep = arr._lo <= arr._hi # Empty rows are never active
+    lo = np.sort(arr._lo[keep])
+    hi = np.sort(arr._hi[keep])
+    unbounded_lo = int(np.searchsorted(lo,_UNBOUNDED_LO,'right'))
+    unbounded_hi = len(hi) - int(np.searchsorted(hi,_UNBOUNDED_HI,'left'))
+
+    starts = lo[unbounded_lo:].tolist()
+    stops = (hi[:len(hi) - unbounded_hi] + 1).tolist()
+    return ([_NEG_INF]*unbounded_lo + starts,stops + [_POS_INF]*unbounded_hi,
+            arr._dateclass)
+
+
+class ConcurrencyProfile:
+    """The number of DateRanges active at each moment, as a step function.
+
+    The profile is built in one sweep over the sorted starts and ends of
+    the ranges, so it costs O(n log n) however much the ranges overlap.
+    Bounds are inclusive, as everywhere in eon: two ranges are concurrent
+    if one starts on the date (or microsecond) that the other ends, but
+    not if it starts one resolution step later.
+
+    Iterating gives (DateRange, count) for each stretch of constant count,
+    from the first start to the last end, including stretches where no
+    range is active.
+    """
+
+    def __init__(self,ranges):
+        """Build the concurrency profile of a collection of DateRanges.
+
+        Args:
+            ranges: iterable of DateRange | eon.array.DateRangeArray
+               None entries, and empty rows of a DateRangeArray, are
+               ignored.
+
+        Raises:
+            TypeError: if the ranges are not DateRanges or mix dates and
+                datetimes.
+
+        Examples:
+            >>>p = ConcurrencyProfile(job_ranges)
+            >>>p.peak()
+            (12, [DateRange(2012-01-03 04:00:00 to 2012-01-03 04:59:59)])
+        """
+        starts,stops,dateclass = _edges(ranges)
+
+        # Breakpoints where the count changes, and the count from each one
+        # until the next. The count is 0 before the first and after the
+        # last breakpoint.
+        times = []
+        counts = []
+        level = 0
+        i = j = 0
+        n = len(starts)
+        while j < n:
+            if i < n and starts[i] <= stops[j]:
+                t = starts[i]
+            else:
+                t = stops[j]
+            while i < n and starts[i] == t:
+                level += 1
+                i += 1
+            while j < n and stops[j] == t:
+                level -= 1
+                j += 1
+            if counts and counts[-1] == level:
+                continue
+            times.append(t)
+            counts.append(level)
+
+        self._times = times
+        self._counts = counts
+        self._dateclass = dateclass
+
+
+    def _range(self,k):
+        # The DateRange of step k
+        lo = self._times[k]
+        hi = self._times[k+1]
+        return DateRange._fromticks(None if lo == _NEG_INF else lo,
+                                    None if hi == _POS_INF else hi - 1,
+                                    self._dateclass)
+
+
+    def at(self,d):
+        # DESCRIPTION:
+        #    Number of ranges that contain a date[time].
+        #
+        # PARAMS:
+        #    d: datetime.date[time]
+        #
+        # RETURNS:
+        #    int
+        #
+        # RAISES:
+        #    TypeError: if d is not comparable to the ranges
+        if self._dateclass is None:
+            # No ranges, or only DateRange(All Dates)
+            return self._counts[0] if self._counts else 0
+        k = bisect.bisect_right(self._times,_to_ticks(d,self._dateclass))
+        return self._counts[k-1] if k > 0 else 0
+
+
+    def peak(self):
+        # DESCRIPTION:
+        #    Highest number of ranges active at once, and when.
+        #
+        # RETURNS:
+        #    (int, list of DateRange): the peak count and every stretch of
+        #    time at that count, in order. (0, []) if there are no ranges.
+        if not self._counts:
+            return 0,[]
+        top = max(self._counts)
+        return top,[self._range(k) for k,c in enumerate(self._counts)
+                    if c == top]
+
+
+    def durations(self):
+        # DESCRIPTION:
+        #    Total time spent at each count between the first start and the
+        #    last end, counting the resolution of the date class like
+        #    DateRange.span.
+        #
+        # RETURNS:
+        #    dict of int count -> datetime.timedelta, or None for a count
+        #    that lasts forever on an unbounded side
+        ticks = {}
+        times = self._times
+        for k in range(len(times) - 1):
+            c = self._counts[k]
+            step = times[k+1] - times[k]
+            if ticks.get(c,0) is None or step == _POS_INF:
+                ticks[c] = None
+            else:
+                ticks[c] = ticks.get(c,0) + step
+
+        out = {}
+        for c,t in ticks.items():
+            if t is None:
+                out[c] = None
+            elif self._dateclass is datetime.datetime:
+                out[c] = _TICK*t
+            else:
+                out[c] = datetime.timedelta(t)
+        return out
+
+
+    #----------------------------------------------------------------
+    #|                          Specials                            |
+    #----------------------------------------------------------------
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self._range(k),self._counts[k]
+
+
+    def __len__(self):
+        # Number of steps
+        return max(len(self._times) - 1,0)
+
+
+    def __str__(self):
+        return 'ConcurrencyProfile('+str(len(self))+' steps)'
+
+    def __repr__(self):
+        return self.__str__()
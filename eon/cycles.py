@@ -0,0 +1,556 @@
+# eon.cycles
+# Closed-form arithmetic behind the DateRange cycle generators
+import collections.abc
+import copy
+import datetime
+import itertools
+import operator
+
+from eon import _DAY_TICKS, _from_ticks, _to_ticks
+
+_TICKS_PER_DAY = { datetime.date: 1, datetime.datetime: _DAY_TICKS }
+
+# Average length of each calendar unit in days, used to estimate how many
+# cycles fit in a DateRange before correcting the estimate exactly.
+_MEAN_DAYS = { 'days': 1.0,
+               'pentads': 365.2425/73,
+               'months': 365.2425/12,
+               'years': 365.2425 }
+
+
+def _ordinal(y,m,d):
+    # DESCRIPTION:
+    #    Proleptic Gregorian ordinal of y-m-d, i.e. date(y,m,d).toordinal(),
+    #    computed arithmetically so that it also works elementwise on
+    #    integer numpy arrays.
+    y = y - (m <= 2)
+    mp = (m + 9) % 12 # Months counted from March
+    return 365*y + y//4 - y//100 + y//400 + (153*mp + 2)//5 + d - 306
+
+
+#----|  Calendar units  |----
+
+_HOUR_TICKS = 3600000000
+
+# Rank of each unit in the calendar hierarchy. Units of a lower rank are
+# made of whole units of every higher rank; months and pentads do not nest
+# in each other.
+_RANKS = { 'years': 0, 'months': 1, 'pentads': 1, 'days': 2, 'hours': 3 }
+
+# The calendar units, finest first, and those made of whole days
+_UNITS = ('hours','days','pentads','months','years')
+_DAY_UNITS = _UNITS[1:]
+
+
+def _unitindex(unit,ordinal):
+    # Index of the unit holding a day ordinal, as in Cycle._anchor:
+    #    days: ordinal | pentads: year*73 + pentad-1 |
+    #    months: year*12 + month-1 | years: year
+    if unit == 'days':
+        return ordinal
+    day = datetime.date.fromordinal(ordinal)
+    if unit == 'years':
+        return day.year
+    if unit == 'months':
+        return day.year*12 + day.month - 1
+    doy = ordinal - _ordinal(day.year,1,1) + 1
+    return day.year*73 + (min(doy,365) - 1)//5
+
+
+def _unitstart(unit,i):
+    # Day ordinal of the first day of the unit with index i
+    if unit == 'days':
+        return i
+    if unit == 'years':
+        return _ordinal(i,1,1)
+    if unit == 'months':
+        return _ordinal(i//12,i % 12 + 1,1)
+    return _ordinal(i//73,1,1) + 5*(i % 73)
+
+
+def _decompose(lo,hi,dateclass,units):
+    # DESCRIPTION:
+    #    Split the ticks lo to hi (inclusive) into the fewest whole calendar
+    #    units, coarsest first: whole units of units[0] cover as much of
+    #    the middle as they can, and the edges left over are split with the
+    #    next units in turn.
+    #
+    # PARAMS:
+    #    units: sequence of unit names, by increasing rank (see _RANKS)
+    #
+    # RETURNS:
+    #    list of (unit, index, lo, hi) in chronological order. index is as
+    #    in _unitindex (the hour since ordinal 0 for 'hours'). unit and
+    #    index are None for partial edges finer than the last unit.
+    tpd = _TICKS_PER_DAY[dateclass]
+    out = []
+
+    def bounds(unit,t):
+        # (index, first tick) of the unit holding tick t
+        if unit == 'hours':
+            i = t//_HOUR_TICKS
+            return i,i*_HOUR_TICKS
+        i = _unitindex(unit,t//tpd)
+        return i,_unitstart(unit,i)*tpd
+
+    def after(unit,i):
+        # First tick of the unit after the one with index i
+        if unit == 'hours':
+            return (i + 1)*_HOUR_TICKS
+        return _unitstart(unit,i + 1)*tpd
+
+    def split(lo,stop,level):
+        # Cover [lo, stop) with units[level:]
+        if lo >= stop:
+            return
+        if level == len(units):
+            out.append((None,None,lo,stop - 1))
+            return
+        unit = units[level]
+        i,start = bounds(unit,lo)
+        if start < lo:
+            start = after(unit,i)
+            i += 1
+        if after(unit,i) > stop: # No whole unit fits
+            split(lo,stop,level + 1)
+            return
+
+        split(lo,start,level + 1)
+        while True:
+            end = after(unit,i)
+            if end > stop:
+                break
+            out.append((unit,i,start,end - 1))
+            start = end
+            i += 1
+        split(start,stop,level + 1)
+
+    split(lo,hi + 1,0)
+    return out
+
+
+class Cycle(collections.abc.Sequence):
+    """The sequence of date[time]s produced by one DateRange cycle generator.
+
+    Instead of stepping from one value to the next, the k-th value is
+    computed directly from the calendar (an "anchor" such as the k-th month
+    after the first, plus the offset of the starting bound from its own
+    anchor). This gives the same values as DateRange.hours(), days(),
+    pentads(), months(), years() and cycles(), but len(), indexing,
+    slicing, index() and `in` take constant time, and the whole sequence
+    can be built at once with toarray().
+
+    Slices are Cycles too. A cycle running toward an unbounded side has no
+    length; it can still be indexed and iterated, and sliced with a
+    non-negative stop.
+
+    Build these through the `lazy=True` and `array=True` arguments of those
+    methods rather than directly.
+    """
+
+    def __init__(self,dr,unit,n=0,snap=False,reverse=False,step=None):
+        """Describe a cycle generator of `dr` in closed form.
+
+        Args:
+            dr: DateRange
+            unit: 'hours' | 'days' | 'pentads' | 'months' | 'years' | 'cycles'
+            n: [0] | int
+               Maximum number of values; 0 means no limit.
+            snap: [False] | bool
+            reverse: [False] | bool
+            step: [None] | datetime.timedelta
+               The period for unit 'cycles'. Its sign sets the direction.
+
+        Raises:
+            ValueError: if the cycle would start at an unbounded side, or
+                has a period of 0.
+            ValueError: if a non-snapped year cycle starts on February 29,
+                which the years() generator cannot step from either.
+        """
+        dateclass = dr._dateclass
+        lo,hi = dr._lo,dr._hi
+
+        if unit == 'cycles':
+            if step == datetime.timedelta(0):
+                raise ValueError("timedelta cannot be 0.")
+            reverse = step < datetime.timedelta(0)
+        elif unit == 'hours':
+            step = datetime.timedelta(hours=-1 if reverse else 1)
+
+        direction = -1 if reverse else 1
+        bound = hi if reverse else lo
+        if bound is None:
+            raise ValueError('Cannot start at infinity.')
+
+        tpd = _TICKS_PER_DAY[dateclass]
+        self._dateclass = dateclass
+        self._unit = unit
+        self._lo = lo
+        self._hi = hi
+        self._n = n
+        self._dir = direction
+        self._tpd = tpd
+        self._step = None
+
+        if step is not None:
+            # Fixed steps. Dates only move by whole days (date + timedelta).
+            if dateclass is datetime.date:
+                ticks = step.days
+            else:
+                ticks = (step.days*86400 + step.seconds)*1000000 + (
+                        step.microseconds)
+            if ticks == 0:
+                raise ValueError('Period is shorter than the resolution of '+
+                    'the DateRange')
+            self._step = ticks
+            self._first = bound
+            self._ks = self._indices()
+            return
+
+        day = datetime.date.fromordinal(bound//tpd)
+
+        if unit == 'days':
+            first = day.toordinal()
+        elif unit == 'pentads':
+            doy = day.timetuple().tm_yday
+            first = day.year*73 + (min(doy,365) - 1)//5
+        elif unit == 'months':
+            first = day.year*12 + day.month - 1
+        elif unit == 'years':
+            first = day.year
+            if snap is True:
+                self._md = (1,1)
+            else:
+                if (day.month,day.day) == (2,29):
+                    raise ValueError('day is out of range for month')
+                self._md = (day.month,day.day)
+        else:
+            raise ValueError('Unknown cycle unit: '+str(unit))
+
+        self._first = first
+        self._offset = bound - self._anchor(first)
+
+        if snap is True:
+            self._offset = 0
+            t = self._anchor(first)
+            if (lo is not None and t < lo) or (hi is not None and t > hi):
+                self._first = first + direction
+
+        self._ks = self._indices()
+
+
+    def _anchor(self,i):
+        # Ticks of the calendar anchor with index i (an int or numpy array):
+        #    days: day ordinal | pentads: year*73 + pentad-1 |
+        #    months: year*12 + month-1 | years: year
+        unit = self._unit
+        if unit == 'days':
+            ordinal = i
+        elif unit == 'pentads':
+            ordinal = _ordinal(i//73,1,1) + 5*(i % 73)
+        elif unit == 'months':
+            ordinal = _ordinal(i//12,i % 12 + 1,1)
+        else:
+            ordinal = _ordinal(i,self._md[0],self._md[1])
+        return ordinal*self._tpd
+
+
+    def _at(self,k):
+        # Ticks of the k-th value (k may be a numpy array)
+        if self._step is not None:
+            return self._first + k*self._step
+        return self._anchor(self._first + self._dir*k) + self._offset
+
+
+    def _inside(self,t):
+        return ( (self._lo is None or self._lo <= t) and
+                 (self._hi is None or t <= self._hi) )
+
+
+    def _count(self):
+        # DESCRIPTION:
+        #    Number of values the generator yields, ignoring n.
+        #
+        # RETURNS:
+        #    int, or None if the cycle runs toward an unbounded side
+        #
+        # NOTES:
+        #    Values are monotonic in k, so the generator stops at the first
+        #    value outside the DateRange. The count is estimated from the
+        #    mean length of the unit and then corrected by a few steps.
+        if not self._inside(self._at(0)):
+            return 0
+
+        forward = self._dir > 0
+        limit = self._hi if forward else self._lo
+        if limit is None:
+            return None
+
+        if self._step is not None:
+            return (limit - self._first)//self._step + 1
+
+        def beyond(k):
+            t = self._at(k)
+            return t > limit if forward else t < limit
+
+        span = abs(limit - self._at(0))
+        k = int(span/(_MEAN_DAYS[self._unit]*self._tpd))
+        while k > 0 and beyond(k):
+            k -= 1
+        while not beyond(k+1):
+            k += 1
+        return k + 1
+
+
+    def _indices(self):
+        # The range of k the generator yields, after applying n, or None if
+        # it never stops.
+        count = self._count()
+        n = self._n
+        if n < 0:
+            return range(0)
+        if count is None:
+            return None if n == 0 else range(n)
+        return range(count if n == 0 else min(count,n))
+
+
+    def _floor(self,t):
+        # DESCRIPTION:
+        #    Invert _at(): find the last k whose value is at or before t
+        #    ticks in the direction of the cycle.
+        #
+        # RETURNS:
+        #    int, negative if t comes before the first value
+        if self._step is not None:
+            return (t - self._first)//self._step
+
+        dir = self._dir
+        k = int(dir*(t - self._at(0))/(_MEAN_DAYS[self._unit]*self._tpd))
+        while dir*self._at(k) > dir*t:
+            k -= 1
+        while dir*self._at(k+1) <= dir*t:
+            k += 1
+        return k
+
+
+    def _find(self,t):
+        # DESCRIPTION:
+        #    Find the k >= 0 whose value is exactly t ticks.
+        #
+        # RETURNS:
+        #    int, or None if no value of the cycle equals t
+        k = self._floor(t)
+        return k if k >= 0 and self._at(k) == t else None
+
+
+    def __len__(self):
+        if self._ks is None:
+            raise ValueError('Cycle toward an unbounded side has no '+
+                'length unless n is given')
+        return len(self._ks)
+
+
+    def __getitem__(self,i):
+        ks = self._ks
+        if isinstance(i,slice):
+            if ks is None:
+                if ((i.start is not None and i.start < 0) or
+                    i.stop is None or i.stop < 0):
+                    raise ValueError('Cycle toward an unbounded side can '+
+                        'only be sliced with non-negative bounds')
+                ks = range(i.stop)
+            view = copy.copy(self)
+            view._ks = ks[i]
+            return view
+
+        i = operator.index(i)
+        if ks is not None:
+            k = ks[i]
+        elif i >= 0:
+            k = i
+        else:
+            raise IndexError('Cycle toward an unbounded side cannot be '+
+                'indexed from the end')
+        return _from_ticks(self._at(k),self._dateclass)
+
+
+    def __iter__(self):
+        ks = self._ks
+        if ks is None:
+            ks = itertools.count()
+        for k in ks:
+            yield _from_ticks(self._at(k),self._dateclass)
+
+
+    def _bounds(self,full=False):
+        # DESCRIPTION:
+        #    The (lo, hi) ticks of the DateRanges that DateRange.rcycle
+        #    builds from this cycle, in the same order, computed lazily from
+        #    the values alone.
+        #
+        # PARAMS:
+        #    [full=False]: bool
+        #       As for rcycle: if False, partial ranges also cover the
+        #       stretches between the bounds of the DateRange and the first
+        #       and last values.
+        #
+        # RETURNS:
+        #    generator of (int, int)
+        #
+        # NOTES:
+        #    Going forward each value starts a range that runs to the tick
+        #    before the next value; in reverse each value ends a range that
+        #    runs from the tick after the next value.
+        ks = self._ks
+        if ks is None:
+            ks = itertools.count()
+        values = map(self._at,ks)
+        lo,hi = self._lo,self._hi
+
+        if full is True:
+            previous = next(values,None)
+            for v in values:
+                if self._dir > 0:
+                    yield previous,v - 1
+                else:
+                    yield v + 1,previous
+                previous = v
+        elif self._dir > 0:
+            current = lo
+            for v in values:
+                if v > current:
+                    yield current,v - 1
+                    current = v
+            yield current,hi
+        else:
+            current = hi
+            for v in values:
+                if v < current:
+                    yield v + 1,current
+                current = v
+            yield lo,current
+
+
+    def _boundsarrays(self,size,full=False):
+        # DESCRIPTION:
+        #    _bounds() computed a chunk of values at a time with numpy.
+        #
+        # RETURNS:
+        #    generator of (lo, hi) int64 tick arrays, of at most size + 1
+        #    rows, with the _UNBOUNDED_LO and _UNBOUNDED_HI sentinels of
+        #    eon.array on unbounded sides
+        import numpy as np
+        from eon.array import _UNBOUNDED_LO, _UNBOUNDED_HI
+
+        lo = _UNBOUNDED_LO if self._lo is None else self._lo
+        hi = _UNBOUNDED_HI if self._hi is None else self._hi
+        forward = self._dir > 0
+        current = None if full is True else (lo if forward else hi)
+
+        ks = self._ks
+        start = 0
+        while ks is None or start < len(ks):
+            if ks is None:
+                k = np.arange(start,start + size,dtype=np.int64)
+            else:
+                part = ks[start:start + size]
+                k = np.arange(part.start,part.stop,part.step,dtype=np.int64)
+            start += size
+            values = self._at(k)
+            if current is None:
+                current,values = values[0],values[1:]
+            if len(values) == 0:
+                continue
+
+            edges = np.concatenate(([current],values))
+            if forward:
+                rlo,rhi = edges[:-1],edges[1:] - 1
+            else:
+                rlo,rhi = edges[1:] + 1,edges[:-1]
+            if rlo[0] > rhi[0]: # The first value was on the bound itself
+                rlo,rhi = rlo[1:],rhi[1:]
+            yield rlo,rhi
+            current = values[-1]
+
+        if full is False:
+            if forward:
+                yield np.array([current],np.int64),np.array([hi],np.int64)
+            else:
+                yield np.array([lo],np.int64),np.array([current],np.int64)
+
+
+    def index(self,value,start=0,stop=None):
+        # DESCRIPTION:
+        #    Position of a date[time] in the cycle.
+        #
+        # PARAMS:
+        #    value: datetime.date[time]
+        #    [start=0]: int
+        #    [stop=None]: int
+        #       Only search the positions start:stop, like list.index().
+        #
+        # RETURNS:
+        #    int
+        #
+        # RAISES:
+        #    ValueError: if value is not in the cycle
+        #    TypeError: if value is not the date class of the DateRange
+        k = self._find(_to_ticks(value,self._dateclass))
+        ks = self._ks
+        if ks is None:
+            i = k
+        elif k is not None and k in ks:
+            i = ks.index(k)
+        else:
+            i = None
+        if i is None or i < start or (stop is not None and i >= stop):
+            raise ValueError(str(value)+' is not in cycle')
+        return i
+
+
+    def __contains__(self,value):
+        try:
+            self.index(value)
+        except ValueError:
+            return False
+        return True
+
+
+    def count(self,value):
+        return 1 if value in self else 0
+
+
+    def toarray(self):
+        # DESCRIPTION:
+        #    Materialize the whole cycle as a numpy datetime64 array, with a
+        #    unit of days for date ranges and microseconds for datetimes.
+        #
+        # RAISES:
+        #    ValueError: if the cycle is unbounded and n is 0
+        #    OverflowError: if values fall outside the years 1-9999
+        import numpy as np
+        from eon.array import _OFFSET,_UNIT
+
+        dateclass = self._dateclass
+        ks = self._ks
+        if ks is None:
+            len(self) # Raises the ValueError
+        k = np.arange(ks.start,ks.stop,ks.step,dtype=np.int64)
+        ticks = self._at(k)
+
+        if len(ticks) and (
+           ticks.min() < self._tpd or
+           ticks.max() >= (datetime.date.max.toordinal() + 1)*self._tpd):
+            raise OverflowError('date value out of range')
+
+        return (ticks - _OFFSET[dateclass]).view(
+            'datetime64['+_UNIT[dateclass]+']')
+
+
+    def __str__(self):
+        if self._ks is None:
+            return 'Cycle('+self._unit+', unbounded)'
+        return 'Cycle('+self._unit+', '+str(len(self))+' values)'
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,254 @@
+# eon.index
+# Interval tree for finding the DateRanges that contain a date or overlap
+# another DateRange
+import random
+
+from eon import DateRange, _NEG_INF, _POS_INF, _to_ticks
+
+
+class _Node:
+    # A treap node keyed by (start ticks, insertion order) and augmented
+    # with the largest end tick found in its subtree.
+    __slots__ = ('key','lo','hi','max','prio','left','right','range')
+
+    def __init__(self,key,lo,hi,dr):
+        self.key = key
+        self.lo = lo
+        self.hi = hi
+        self.max = hi
+        self.prio = random.random()
+        self.left = None
+        self.right = None
+        self.range = dr
+
+
+def _update(node):
+    m = node.hi
+    if node.left is not None and node.left.max > m:
+        m = node.left.max
+    if node.right is not None and node.right.max > m:
+        m = node.right.max
+    node.max = m
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left = left.right
+    left.right = node
+    _update(node)
+    _update(left)
+    return left
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right = right.left
+    right.left = node
+    _update(node)
+    _update(right)
+    return right
+
+
+def _insert(node,new):
+    if node is None:
+        return new
+    if new.key < node.key:
+        node.left = _insert(node.left,new)
+        if node.left.prio > node.prio:
+            return _rotate_right(node)
+    else:
+        node.right = _insert(node.right,new)
+        if node.right.prio > node.prio:
+            return _rotate_left(node)
+    _update(node)
+    return node
+
+
+def _merge(left,right):
+    # Join two treaps where every key in left is below every key in right
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.prio > right.prio:
+        left.right = _merge(left.right,right)
+        _update(left)
+        return left
+    right.left = _merge(left,right.left)
+    _update(right)
+    return right
+
+
+def _delete(node,key):
+    if node.key == key:
+        return _merge(node.left,node.right)
+    if key < node.key:
+        node.left = _delete(node.left,key)
+    else:
+        node.right = _delete(node.right,key)
+    _update(node)
+    return node
+
+
+def _overlapping(node,lo,hi,out):
+    # Append every range in the subtree with start <= hi and end >= lo, in
+    # order of start.
+    while node is not None:
+        if node.max < lo:
+            return
+        _overlapping(node.left,lo,hi,out)
+        if node.lo > hi:
+            return
+        if node.hi >= lo:
+            out.append(node.range)
+        node = node.right
+
+
+class DateRangeIndex:
+    """A dynamic set of DateRanges indexed for overlap queries.
+
+    Ranges are held in an interval tree (a treap ordered by start and
+    augmented with the latest end in each subtree), so finding the k ranges
+    that contain a date or overlap a DateRange visits O(log n + k) nodes on
+    average instead of scanning every range. Unbounded starts and ends sort
+    before and after every date.
+
+    Ranges are tracked by identity. Their bounds are read when they are
+    inserted, so remove a DateRange before changing its start() or end().
+    """
+
+    def __init__(self,ranges=()):
+        """Build a DateRangeIndex.
+
+        Args:
+            ranges: [()] | iterable of DateRange
+               Initial contents.
+
+        Raises:
+            TypeError: if the ranges mix dates and datetimes.
+        """
+        self._root = None
+        self._keys = {}
+        self._counter = 0
+        self._dateclass = None
+        for dr in ranges:
+            self.insert(dr)
+
+
+    def insert(self,dr):
+        # DESCRIPTION:
+        #    Add a DateRange to the index.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #
+        # RAISES:
+        #    TypeError: if dr is not a DateRange or has a different date
+        #               class than the ranges already indexed
+        #    ValueError: if dr is already in the index
+        if not isinstance(dr,DateRange):
+            raise TypeError('Can only index DateRanges, not '+str(type(dr)))
+        if id(dr) in self._keys:
+            raise ValueError(str(dr)+' is already in the index')
+
+        if dr._dateclass is not None:
+            if self._dateclass is None:
+                self._dateclass = dr._dateclass
+            elif dr._dateclass is not self._dateclass:
+                raise TypeError('Cannot mix '+str(self._dateclass)+' and '+
+                    str(dr._dateclass)+' DateRanges')
+
+        lo = _NEG_INF if dr._lo is None else dr._lo
+        hi = _POS_INF if dr._hi is None else dr._hi
+        key = (lo,self._counter)
+        self._counter += 1
+
+        self._root = _insert(self._root,_Node(key,lo,hi,dr))
+        self._keys[id(dr)] = key
+
+
+    def remove(self,dr):
+        # DESCRIPTION:
+        #    Remove a DateRange from the index.
+        #
+        # RAISES:
+        #    KeyError: if dr is not in the index
+        key = self._keys.pop(id(dr))
+        self._root = _delete(self._root,key)
+
+
+    def containing(self,d):
+        # DESCRIPTION:
+        #    Find the indexed DateRanges that contain a date (a stabbing
+        #    query).
+        #
+        # PARAMS:
+        #    d: datetime.date[time]
+        #
+        # RETURNS:
+        #    list of DateRange ordered by start(). Bounds are inclusive.
+        #
+        # RAISES:
+        #    TypeError: if d is not comparable to the indexed ranges
+        if self._dateclass is None:
+            # Empty, or every indexed range is DateRange(All Dates)
+            return list(self)
+        t = _to_ticks(d,self._dateclass)
+        out = []
+        _overlapping(self._root,t,t,out)
+        return out
+
+
+    def overlapping(self,dr):
+        # DESCRIPTION:
+        #    Find the indexed DateRanges that share at least one date with
+        #    another DateRange, i.e. whose intersection() is not None.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #
+        # RETURNS:
+        #    list of DateRange ordered by start()
+        #
+        # RAISES:
+        #    TypeError: if dr has a different date class than the index
+        if self._root is None:
+            return []
+        if (dr._dateclass is not None and self._dateclass is not None and
+            dr._dateclass is not self._dateclass):
+            raise TypeError('Cannot compare '+str(dr._dateclass)+' to '+
+                str(self._dateclass))
+        lo = _NEG_INF if dr._lo is None else dr._lo
+        hi = _POS_INF if dr._hi is None else dr._hi
+        out = []
+        _overlapping(self._root,lo,hi,out)
+        return out
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def __contains__(self,dr):
+        return id(dr) in self._keys
+
+
+    def __iter__(self):
+        # In order of start()
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.range
+                node = node.right
+
+
+    def __str__(self):
+        return 'DateRangeIndex('+str(len(self))+' ranges)'
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,264 @@
+# eon.instrument
+# Opt-in counting and timing of eon's hot paths, per call site
+import collections
+import contextlib
+import functools
+import os
+import sys
+import time
+
+import eon
+from eon import DateRange
+from eon.cycles import Cycle
+
+Record = collections.namedtuple('Record',['name','site','calls','seconds'])
+Record.__doc__ = """Calls (or generator steps) of one eon method from one site.
+
+    name: str, e.g. 'DateRange.__contains__'
+    site: str, 'file:line (function)' of the nearest caller outside eon
+    calls: int, the number of calls, or of values yielded by generators
+    seconds: float, the time spent in them, including nested eon calls
+"""
+
+# (owner, attribute, kind). 'call' times each call, 'generator' each value
+# yielded, and 'classmethod' each call of a classmethod.
+_TARGETS = (
+    (DateRange,'__init__','call'),
+    (DateRange,'_fromticks','classmethod'),
+    (DateRange,'trusted','classmethod'),
+    (DateRange,'frompairs','classmethod'),
+    (DateRange,'_validate','call'),
+    (DateRange,'_cast','call'),
+    (DateRange,'__contains__','call'),
+    (DateRange,'contains_many','call'),
+    (DateRange,'_cycles','generator'),
+    (DateRange,'_hours','generator'),
+    (DateRange,'_days','generator'),
+    (DateRange,'_pentads','generator'),
+    (DateRange,'_months','generator'),
+    (DateRange,'_years','generator'),
+    (DateRange,'_rcycle','generator'),
+    (DateRange,'rcycle','generator'),
+    (Cycle,'__iter__','generator'),
+)
+
+_PACKAGE = os.path.dirname(os.path.abspath(eon.__file__)) + os.sep
+_counts = {}    # (name, site) -> [calls, seconds]
+_saved = None   # Original class attributes while enabled
+_clock = time.perf_counter
+
+
+def _site(frame):
+    # 'file:line (function)' of the first frame outside eon, from frame up
+    while frame is not None and frame.f_code.co_filename.startswith(_PACKAGE):
+        frame = frame.f_back
+    if frame is None:
+        return '<eon>'
+    code = frame.f_code
+    return code.co_filename+':'+str(frame.f_lineno)+' ('+code.co_name+')'
+
+
+def _record(key,seconds):
+    counter = _counts.get(key)
+    if counter is None:
+        _counts[key] = [1,seconds]
+    else:
+        counter[0] += 1
+        counter[1] += seconds
+
+
+def _timed(name,fn):
+    @functools.wraps(fn)
+    def wrapper(*args,**kwargs):
+        key = (name,_site(sys._getframe(1)))
+        start = _clock()
+        try:
+            return fn(*args,**kwargs)
+        finally:
+            _record(key,_clock() - start)
+    return wrapper
+
+
+def _stepped(name,fn):
+    @functools.wraps(fn)
+    def wrapper(*args,**kwargs):
+        return _steps(name,fn(*args,**kwargs))
+    return wrapper
+
+
+def _steps(name,gen):
+    # Re-yield the values of gen, timing each step where it is consumed.
+    # Exhausting gen is not counted as a step.
+    while True:
+        key = (name,_site(sys._getframe(1)))
+        start = _clock()
+        try:
+            value = next(gen)
+        except StopIteration:
+            return
+        _record(key,_clock() - start)
+        yield value
+
+
+#----------------------------------------------------------------
+#|                       Switching on and off                   |
+#----------------------------------------------------------------
+
+def enable():
+    # DESCRIPTION:
+    #    Swap instrumented versions of eon's hot paths into their classes.
+    #    Counting starts from the current counters; see reset().
+    #
+    # NOTES:
+    #    Nothing is wrapped until this is called, and disable() puts the
+    #    original methods back, so eon runs at full speed when not
+    #    instrumented. While enabled, every call pays for a frame walk and
+    #    two clock reads, so absolute timings are inflated; compare sites
+    #    with each other rather than with uninstrumented runs.
+    global _saved
+    if _saved is not None:
+        return
+    saved = []
+    for owner,attr,kind in _TARGETS:
+        original = owner.__dict__[attr]
+        name = owner.__name__+'.'+attr
+        if kind == 'classmethod':
+            wrapped = classmethod(_timed(name,original.__func__))
+        elif kind == 'generator':
+            wrapped = _stepped(name,original)
+        else:
+            wrapped = _timed(name,original)
+        saved.append((owner,attr,original))
+        setattr(owner,attr,wrapped)
+    _saved = saved
+
+
+def disable():
+    # DESCRIPTION:
+    #    Restore the original methods. Counters are kept.
+    global _saved
+    if _saved is None:
+        return
+    for owner,attr,original in _saved:
+        setattr(owner,attr,original)
+    _saved = None
+
+
+def enabled():
+    return _saved is not None
+
+
+def reset():
+    # Clear all counters
+    _counts.clear()
+
+
+#----------------------------------------------------------------
+#|                         Reading counters                     |
+#----------------------------------------------------------------
+
+def _snapshot():
+    return {key: tuple(counter) for key,counter in _counts.items()}
+
+
+def _records(end,start=None):
+    # Records of the counts in end less those in start, slowest first
+    records = []
+    for (name,site),(calls,seconds) in end.items():
+        if start is not None and (name,site) in start:
+            calls0,seconds0 = start[(name,site)]
+            calls,seconds = calls - calls0,seconds - seconds0
+        if calls > 0:
+            records.append(Record(name,site,calls,seconds))
+    records.sort(key=lambda r: (-r.seconds,r.name,r.site))
+    return records
+
+
+def _report(records,limit):
+    if not records:
+        return 'No instrumented eon calls'
+    lines = ['{:>10} {:>10} {:>9}  {}'.format('calls','seconds','us/call',
+                                              'method @ site')]
+    for r in records[:limit]:
+        lines.append('{:>10} {:>10.4f} {:>9.2f}  {} @ {}'.format(
+            r.calls,r.seconds,1e6*r.seconds/r.calls,r.name,r.site))
+    if len(records) > limit:
+        lines.append('... '+str(len(records) - limit)+' more')
+    return '\n'.join(lines)
+
+
+def records():
+    # DESCRIPTION:
+    #    Every counter since the last reset().
+    #
+    # RETURNS:
+    #    list of Record, the slowest first
+    return _records(_snapshot())
+
+
+def report(limit=20):
+    # DESCRIPTION:
+    #    A table of the `limit` slowest counters since the last reset().
+    #
+    # RETURNS:
+    #    str
+    return _report(records(),limit)
+
+
+class Counters:
+    """The counts taken between entering and leaving instrumented()."""
+
+    def __init__(self):
+        self._start = _snapshot()
+        self._end = None
+
+    def _close(self):
+        self._end = _snapshot()
+
+    def records(self):
+        # DESCRIPTION:
+        #    The counters of the block, so far if it has not ended.
+        #
+        # RETURNS:
+        #    list of Record, the slowest first
+        end = _snapshot() if self._end is None else self._end
+        return _records(end,self._start)
+
+    def report(self,limit=20):
+        return _report(self.records(),limit)
+
+    def __str__(self):
+        return self.report()
+
+    def __repr__(self):
+        return ('Counters('+str(len(self.records()))+' sites'+
+                (')' if self._end is not None else ', running)'))
+
+
+@contextlib.contextmanager
+def instrumented():
+    """Instrument eon for the duration of a block.
+
+    Yields a Counters holding only the calls made inside the block, which
+    stays readable after it. Blocks can be nested; eon is restored when the
+    outermost one that enabled it is left.
+
+    Examples:
+        >>>from eon.instrument import instrumented
+        >>>with instrumented() as counters:
+        ...    run_job()
+        >>>print(counters.report(5))
+             calls    seconds   us/call  method @ site
+            120000     0.2214      1.85  DateRange.__contains__ @ job.py:41 (match)
+              8760     0.0391      4.46  DateRange._hours @ job.py:17 (load)
+        ...
+    """
+    was = enabled()
+    enable()
+    counters = Counters()
+    try:
+        yield counters
+    finally:
+        counters._close()
+        if not was:
+            disable()
@@ -0,0 +1,109 @@
+# eon.join
+# Pairing up the overlapping DateRanges of two collections
+import heapq
+import itertools
+
+from eon import DateRange, _NEG_INF, _POS_INF
+
+
+def _start_key(dr):
+    return _NEG_INF if dr._lo is None else dr._lo
+
+
+def _sorted_stream(ranges,name):
+    # DESCRIPTION:
+    #    Iterate (start, end, DateRange) over ranges that are sorted by
+    #    start, checking the order and types as they stream past.
+    #
+    # RAISES:
+    #    TypeError: if an item is not a DateRange
+    #    ValueError: if the ranges are not sorted by start
+    previous = _NEG_INF
+    for dr in ranges:
+        if dr is None:
+            continue
+        if not isinstance(dr,DateRange):
+            raise TypeError('Expected DateRanges in '+name+', not '+
+                str(type(dr)))
+        lo = _start_key(dr)
+        if lo < previous:
+            raise ValueError(name+' is not sorted by start(): '+str(dr)+
+                ' comes after a later start. Pass sort=True to sort it.')
+        previous = lo
+        yield lo,(_POS_INF if dr._hi is None else dr._hi),dr
+
+
+def overlap_join(a,b,sort=False):
+    # DESCRIPTION:
+    #    Find every pair of DateRanges, one from a and one from b, that
+    #    share at least one date, together with their intersection.
+    #
+    # PARAMS:
+    #    a, b: iterable of DateRange
+    #       Sorted by start(), with unbounded starts first. None entries
+    #       are skipped.
+    #    [sort=False]: bool
+    #       If True, sort a and b by start() first. This reads both into
+    #       memory.
+    #
+    # RETURNS:
+    #    A generator of (DateRange from a, DateRange from b, intersection)
+    #    tuples, ordered by the later of the two starts.
+    #
+    # NOTES:
+    #    Both inputs are consumed in a single merge by start. Ranges that
+    #    have started and not yet ended are kept in a heap ordered by end,
+    #    so the time is O((n + m) log w + k) and the memory O(w), where k
+    #    is the number of pairs and w the largest number of ranges open at
+    #    once. Bounds are inclusive, like DateRange.intersection.
+    #
+    # RAISES:
+    #    TypeError: if the inputs hold anything but DateRanges, or mix
+    #               dates and datetimes
+    #    ValueError: if sort is False and an input is not sorted
+    if sort is True:
+        a = sorted((dr for dr in a if dr is not None),key=_start_key)
+        b = sorted((dr for dr in b if dr is not None),key=_start_key)
+    elif sort is not False:
+        raise ValueError('sort must be True or False.')
+
+    streams = (_sorted_stream(a,'a'),_sorted_stream(b,'b'))
+    heads = [next(s,None) for s in streams]
+    open_ = ([],[]) # Heaps of (end, order, DateRange) for a and b
+    order = itertools.count()
+    dateclass = None
+    fromticks = DateRange._fromticks
+
+    while heads[0] is not None or heads[1] is not None:
+        # Take the earlier start, from a on ties
+        side = 0 if heads[1] is None or (
+            heads[0] is not None and heads[0][0] <= heads[1][0]) else 1
+        lo,hi,dr = heads[side]
+        heads[side] = next(streams[side],None)
+
+        if dr._dateclass is not None:
+            if dateclass is None:
+                dateclass = dr._dateclass
+            elif dr._dateclass is not dateclass:
+                raise TypeError('Cannot join '+str(dateclass)+' with '+
+                    str(dr._dateclass)+' DateRanges')
+
+        # Nothing that follows starts before lo, so ranges that ended
+        # earlier can be dropped from both sides.
+        for heap in open_:
+            while heap and heap[0][0] < lo:
+                heapq.heappop(heap)
+
+        # Every range still open on the other side started no later than
+        # dr and ends no earlier, so it overlaps dr from lo onward.
+        for ohi,_,odr in open_[1-side]:
+            ihi = hi if hi < ohi else ohi
+            cut = fromticks(None if lo == _NEG_INF else lo,
+                            None if ihi == _POS_INF else ihi,
+                            dr._dateclass or odr._dateclass)
+            if side == 0:
+                yield dr,odr,cut
+            else:
+                yield odr,dr,cut
+
+        heapq.heappush(open_[side],(hi,next(order),dr))
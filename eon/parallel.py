@@ -0,0 +1,107 @@
+# eon.parallel
+# Running a function over the calendar chunks of a DateRange in parallel
+import concurrent.futures
+import datetime
+import os
+import pickle
+
+from eon import DateRange
+from eon.cycles import Cycle, _DAY_UNITS as _UNITS
+
+
+def chunks(dr,unit='months',snap=False):
+    # DESCRIPTION:
+    #    Split a DateRange into consecutive, non-overlapping chunks that
+    #    cover it exactly.
+    #
+    # PARAMS:
+    #    dr: DateRange
+    #       Must be bounded on both sides.
+    #    [unit='months']: 'days' | 'pentads' | 'months' | 'years' |
+    #                     datetime.timedelta | int
+    #       Calendar units split dr as rdays(), rpentads(), rmonths() and
+    #       ryears() do (with full=False), a timedelta splits it every
+    #       period from start(), and an int n splits it into n chunks of
+    #       equal span (to the resolution of the date class).
+    #    [snap=False]: bool
+    #       Align calendar chunks to calendar breaks, as in rmonths().
+    #
+    # RETURNS:
+    #    list of DateRange in chronological order
+    #
+    # RAISES:
+    #    ValueError: if dr is unbounded or unit is unknown or not positive
+    if dr._lo is None or dr._hi is None:
+        raise ValueError('Cannot split an unbounded DateRange')
+    lo,hi,dateclass = dr._lo,dr._hi,dr._dateclass
+
+    if isinstance(unit,bool):
+        raise ValueError('Unknown cycle unit: '+str(unit))
+    if isinstance(unit,int):
+        if unit < 1:
+            raise ValueError('Cannot split into '+str(unit)+' chunks')
+        ticks = hi - lo + 1
+        n = min(unit,ticks)
+        edges = [lo + (ticks*i)//n for i in range(n + 1)]
+        bounds = [(edges[i],edges[i+1] - 1) for i in range(n)]
+    elif isinstance(unit,datetime.timedelta):
+        if unit <= datetime.timedelta(0):
+            raise ValueError('Chunks must have a positive length')
+        bounds = Cycle(dr,'cycles',step=unit)._bounds()
+    elif unit in _UNITS:
+        bounds = Cycle(dr,unit,snap=snap)._bounds()
+    else:
+        raise ValueError('Unknown cycle unit: '+str(unit))
+
+    return [DateRange._fromticks(a,b,dateclass) for a,b in bounds]
+
+
+def parallel_map(dr,fn,unit='months',workers=None,snap=False,
+                 executor='process',ordered=True):
+    # DESCRIPTION:
+    #    Call fn(chunk) for every chunk of a DateRange on a pool of
+    #    processes or threads. See DateRange.parallel_map.
+    #
+    # RETURNS:
+    #    generator of (DateRange chunk, result)
+    parts = chunks(dr,unit=unit,snap=snap)
+
+    if executor == 'process':
+        # Fail here rather than from inside the pool, which cannot always
+        # shut down cleanly after failing to send a task
+        pickle.dumps(fn)
+
+    if executor in ('process','thread'):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1,min(workers,len(parts)))
+        pool_class = (concurrent.futures.ProcessPoolExecutor
+                      if executor == 'process' else
+                      concurrent.futures.ThreadPoolExecutor)
+        pool = pool_class(max_workers=workers)
+        owned = True
+    elif isinstance(executor,concurrent.futures.Executor):
+        pool = executor
+        workers = workers or getattr(executor,'_max_workers',1)
+        owned = False
+    else:
+        raise ValueError("executor must be 'process', 'thread' or an "+
+            "Executor")
+
+    try:
+        if ordered is True:
+            # Hand chunks to each process in a few batches, so that the
+            # cost of pickling them is paid per batch rather than per chunk
+            batch = 1
+            if isinstance(pool,concurrent.futures.ProcessPoolExecutor):
+                batch = max(1,len(parts)//(4*workers))
+            for part,result in zip(parts,
+                                   pool.map(fn,parts,chunksize=batch)):
+                yield part,result
+        else:
+            futures = {pool.submit(fn,part): part for part in parts}
+            for future in concurrent.futures.as_completed(futures):
+                yield futures.pop(future),future.result()
+    finally:
+        if owned:
+            pool.shutdown(wait=True,cancel_futures=True)
@@ -0,0 +1,347 @@
+# eon.rangeset
+# Sets of dates held as sorted, disjoint DateRanges
+import bisect
+import datetime
+
+from eon import DateRange, _NEG_INF, _POS_INF, _TICK, _to_ticks
+
+
+def _sweep(a,b,keep):
+    # DESCRIPTION:
+    #    Merge two boundary lists in one pass, keeping the stretches where
+    #    keep(inside a, inside b) is True.
+    #
+    # PARAMS:
+    #    a, b: list of ticks
+    #       Strictly increasing boundaries [lo0, hi0, lo1, hi1, ...] of
+    #       half-open stretches [lo, hi), as held by DateRangeSet.
+    #    keep: callable (bool, bool) -> bool
+    #
+    # RETURNS:
+    #    list of boundaries in the same form
+    out = []
+    i = j = 0
+    na,nb = len(a),len(b)
+    ina = inb = inside = False
+    while i < na or j < nb:
+        if j == nb or (i < na and a[i] < b[j]):
+            x = a[i]
+        else:
+            x = b[j]
+        if i < na and a[i] == x:
+            ina = not ina
+            i += 1
+        if j < nb and b[j] == x:
+            inb = not inb
+            j += 1
+        now = keep(ina,inb)
+        if now is not inside:
+            out.append(x)
+            inside = now
+    return out
+
+
+class DateRangeSet:
+    """A set of dates or datetimes stored as sorted, disjoint DateRanges.
+
+    Overlapping and adjacent ranges (ones that touch with no gap at the
+    resolution of their date class) are coalesced when the set is built,
+    so each date belongs to exactly one range of the set. Internally the
+    ranges are one sorted list of half-open boundaries, which makes
+    membership a bisection and lets union, intersection, difference and
+    symmetric difference run as a single merge of two sorted lists.
+
+    DateRangeSets are immutable; the set operations return new ones. They
+    accept another DateRangeSet, a DateRange or an iterable of DateRanges.
+    """
+
+    def __init__(self,ranges=()):
+        """Build a DateRangeSet.
+
+        Args:
+            ranges: [()] | DateRange | iterable of DateRange
+               The ranges to cover. None entries (as returned by a disjoint
+               DateRange.intersection) are ignored.
+
+        Raises:
+            TypeError: if the ranges are not DateRanges or mix dates and
+                datetimes.
+
+        Examples:
+            >>>DateRangeSet([DateRange(date(2012,1,1),date(2012,1,10)),
+            ...              DateRange(date(2012,1,5),date(2012,1,20))])
+            DateRangeSet(2012-01-01 to 2012-01-20)
+        """
+        if isinstance(ranges,DateRange):
+            ranges = [ranges]
+
+        dateclass = None
+        spans = []
+        for dr in ranges:
+            if dr is None:
+                continue
+            if not isinstance(dr,DateRange):
+                raise TypeError('Expected DateRanges, not '+str(type(dr)))
+            if dr._dateclass is not None:
+                if dateclass is None:
+                    dateclass = dr._dateclass
+                elif dr._dateclass is not dateclass:
+                    raise TypeError('Cannot mix '+str(dateclass)+' and '+
+                        str(dr._dateclass)+' DateRanges')
+            spans.append((_NEG_INF if dr._lo is None else dr._lo,
+                          _POS_INF if dr._hi is None else dr._hi + 1))
+        spans.sort()
+
+        # Coalesce in order of start: O(n log n) for the sort, then O(n)
+        bounds = []
+        for lo,hi in spans:
+            if bounds and lo <= bounds[-1]:
+                if hi > bounds[-1]:
+                    bounds[-1] = hi
+            else:
+                bounds.append(lo)
+                bounds.append(hi)
+
+        self._bounds = bounds
+        self._dateclass = dateclass
+
+
+    @classmethod
+    def _frombounds(cls,bounds,dateclass):
+        # Build straight from a normalized boundary list
+        s = cls.__new__(cls)
+        s._bounds = bounds
+        s._dateclass = dateclass if bounds else None
+        return s
+
+
+    def _coerce(self,other):
+        # DESCRIPTION:
+        #    Turn the argument of a set operation into a DateRangeSet.
+        #
+        # RETURNS:
+        #    (DateRangeSet, date class of the result)
+        #
+        # RAISES:
+        #    TypeError: if other has a different date class
+        if not isinstance(other,DateRangeSet):
+            other = DateRangeSet(other)
+        if self._dateclass is None:
+            return other,other._dateclass
+        if other._dateclass is not None and (
+           other._dateclass is not self._dateclass):
+            raise TypeError('Cannot combine '+str(self._dateclass)+
+                ' with '+str(other._dateclass))
+        return other,self._dateclass
+
+
+    def _combine(self,other,keep):
+        other,dateclass = self._coerce(other)
+        return DateRangeSet._frombounds(
+            _sweep(self._bounds,other._bounds,keep),dateclass)
+
+
+    def union(self,*others):
+        # DESCRIPTION:
+        #    Dates in this set or in any of the others.
+        #
+        # PARAMS:
+        #    others: DateRangeSet | DateRange | iterable of DateRange
+        #
+        # RETURNS:
+        #    DateRangeSet
+        #
+        # RAISES:
+        #    TypeError: if the date classes differ
+        out = self
+        for other in others:
+            out = out._combine(other,lambda a,b: a or b)
+        return out
+
+
+    def intersection(self,other):
+        # DESCRIPTION:
+        #    Dates in both this set and other.
+        #
+        # RETURNS:
+        #    DateRangeSet
+        #
+        # RAISES:
+        #    TypeError: if the date classes differ
+        return self._combine(other,lambda a,b: a and b)
+
+
+    def difference(self,other):
+        # DESCRIPTION:
+        #    Dates in this set that are not in other.
+        #
+        # RETURNS:
+        #    DateRangeSet
+        #
+        # RAISES:
+        #    TypeError: if the date classes differ
+        return self._combine(other,lambda a,b: a and not b)
+
+
+    def symmetric_difference(self,other):
+        # DESCRIPTION:
+        #    Dates in exactly one of this set and other.
+        #
+        # RETURNS:
+        #    DateRangeSet
+        #
+        # RAISES:
+        #    TypeError: if the date classes differ
+        return self._combine(other,lambda a,b: a is not b)
+
+
+    def complement(self,within=None):
+        # DESCRIPTION:
+        #    Dates that are not in this set, e.g. the free time left by a
+        #    set of bookings.
+        #
+        # PARAMS:
+        #    [within=None]: DateRange | DateRangeSet
+        #       Only return dates inside these bounds. By default the
+        #       complement extends to infinity on either side.
+        #
+        # RETURNS:
+        #    DateRangeSet
+        #
+        # RAISES:
+        #    TypeError: if within has a different date class
+        if within is None:
+            within = DateRange(None,None)
+        within,dateclass = self._coerce(within)
+        return DateRangeSet._frombounds(
+            _sweep(self._bounds,within._bounds,lambda a,b: b and not a),
+            dateclass)
+
+
+    def span(self):
+        # DESCRIPTION:
+        #    Total length of time covered by the set, counting the
+        #    resolution of the date class like DateRange.span.
+        #
+        # RETURNS:
+        #    datetime.timedelta, or None if the set is unbounded
+        bounds = self._bounds
+        if bounds and (bounds[0] == _NEG_INF or bounds[-1] == _POS_INF):
+            return None
+        ticks = sum(bounds[1::2]) - sum(bounds[0::2])
+        if self._dateclass is datetime.datetime:
+            return _TICK*ticks
+        return datetime.timedelta(ticks)
+
+
+    def toranges(self):
+        # DESCRIPTION:
+        #    The disjoint DateRanges of the set in chronological order.
+        #
+        # RETURNS:
+        #    list of DateRange
+        return list(self)
+
+
+    #----------------------------------------------------------------
+    #|                          Specials                            |
+    #----------------------------------------------------------------
+
+    def __contains__(self,other):
+        # DESCRIPTION:
+        #    Check if a value or DateRange is fully inside the set. A
+        #    DateRange must lie inside a single range of the set, which is
+        #    the same as lying inside the set since the ranges are
+        #    coalesced.
+        #
+        # PARAMS:
+        #    other: datetime.date[time] | DateRange | None
+        #       None is contained if the set is unbounded, as for DateRange.
+        #
+        # RETURNS:
+        #    bool
+        #
+        # RAISES:
+        #    TypeError: if other is not comparable to the set
+        bounds = self._bounds
+        if not bounds:
+            return False
+
+        if other is None:
+            return bounds[0] == _NEG_INF or bounds[-1] == _POS_INF
+
+        if isinstance(other,DateRange):
+            if (other._dateclass is not None and
+                self._dateclass is not None and
+                other._dateclass is not self._dateclass):
+                raise TypeError('Cannot compare '+str(other._dateclass)+
+                    ' to '+str(self._dateclass))
+            lo = _NEG_INF if other._lo is None else other._lo
+            hi = _POS_INF if other._hi is None else other._hi + 1
+        elif self._dateclass is None:
+            # The set is DateRange(All Dates)
+            return True
+        else:
+            lo = _to_ticks(other,self._dateclass)
+            hi = lo + 1
+
+        i = bisect.bisect_right(bounds,lo)
+        return i % 2 == 1 and hi <= bounds[i]
+
+
+    def __iter__(self):
+        bounds = self._bounds
+        dateclass = self._dateclass
+        for i in range(0,len(bounds),2):
+            lo,hi = bounds[i],bounds[i+1]
+            yield DateRange._fromticks(None if lo == _NEG_INF else lo,
+                                       None if hi == _POS_INF else hi - 1,
+                                       dateclass)
+
+
+    def __len__(self):
+        # Number of disjoint ranges
+        return len(self._bounds)//2
+
+
+    def __eq__(self,other):
+        if not isinstance(other,DateRangeSet):
+            return NotImplemented
+        return (self._bounds == other._bounds and
+                self._dateclass is other._dateclass)
+
+
+    def __ne__(self,other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+
+    __hash__ = None
+
+
+    def __or__(self,other):
+        return self.union(other)
+
+
+    def __and__(self,other):
+        return self.intersection(other)
+
+
+    def __sub__(self,other):
+        return self.difference(other)
+
+
+    def __xor__(self,other):
+        return self.symmetric_difference(other)
+
+
+    def __invert__(self):
+        return self.complement()
+
+
+    def __str__(self):
+        ranges = [str(dr)[len('DateRange('):-1] for dr in self]
+        return 'DateRangeSet('+', '.join(ranges)+')'
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,358 @@
+# eon.rollup
+# Pre-aggregated counts, sums, minima and maxima of timestamped values
+import bisect
+import collections
+import datetime
+
+from eon import DateRange, _DAY_TICKS, _to_ticks
+from eon.cycles import _HOUR_TICKS
+
+Summary = collections.namedtuple('Summary',['count','sum','min','max'])
+Summary.__doc__ = """Aggregates of the values in a DateRange.
+
+    count: int, the number of values
+    sum: the sum of the values (0 if there are none)
+    min, max: the smallest and largest value, or None if there are none
+"""
+
+_WIDTHS = { 'hours': _HOUR_TICKS, 'days': _DAY_TICKS }
+_INF = float('inf')
+
+
+class Rollup:
+    """Timestamped values, pre-aggregated per hour or per day.
+
+    Values are added up into calendar buckets once, as they arrive. Each
+    bucket's count and sum are kept in Fenwick trees, and its minimum and
+    maximum in segment trees, so aggregating any run of whole buckets takes
+    O(log n) in the number of buckets, however many values they hold.
+
+    A DateRange rarely starts and ends on bucket edges. The values of the
+    (at most two) buckets it only partly covers are kept in time order and
+    read directly, so results follow the inclusive bounds of
+    DateRange.__contains__ exactly. Dates are their own buckets and need
+    no such reading.
+    """
+
+    def __init__(self,data=(),resolution='hours'):
+        """Aggregate timestamped values.
+
+        Args:
+            data: [()] | iterable of (timestamp, value)
+               Timestamps are datetime.date[time]s, all of one type, in any
+               order. Values are numbers.
+            resolution: ['hours'] | 'days'
+               Bucket width for datetimes. Coarser buckets take less memory
+               but leave more values to read at the edges of a query.
+               Dates always use days.
+
+        Raises:
+            ValueError: if resolution is unknown.
+            TypeError: if timestamps are not dates or mix dates and
+                datetimes.
+
+        Examples:
+            >>>r = Rollup(zip(timestamps,values))
+            >>>r.summary(DateRange(datetime(2012,3,1,9,30),
+            ...                    datetime(2012,5,2,17)))
+            Summary(count=1504, sum=38017.5, min=0.25, max=93.0)
+        """
+        if resolution not in _WIDTHS:
+            raise ValueError("resolution must be 'hours' or 'days'")
+        self._resolution = resolution
+        self._dateclass = None
+        self._width = None  # Ticks per bucket
+        self._base = 0      # Bucket number of slot 0
+        self._size = 0      # Number of slots, a power of two
+        self._counts = []
+        self._sums = []
+        self._mins = []
+        self._maxs = []
+        self._fcount = [0]  # Fenwick trees over the slots, 1-based
+        self._fsum = [0]
+        self._tmin = []     # Segment trees over the slots, root at 1
+        self._tmax = []
+        self._raw = {}      # Bucket number -> ([ticks], [values]) in order
+        self._n = 0
+        self.extend(data)
+
+
+    #----------------------------------------------------------------
+    #|                       Building the trees                     |
+    #----------------------------------------------------------------
+
+    def _ticks(self,timestamp):
+        # Ticks of a timestamp, fixing the date class on the first one
+        if self._dateclass is None:
+            dateclass = type(timestamp)
+            if dateclass not in (datetime.date,datetime.datetime):
+                raise TypeError('Expected a datetime.date[time], not '+
+                    str(dateclass))
+            self._dateclass = dateclass
+            self._width = (1 if dateclass is datetime.date else
+                           _WIDTHS[self._resolution])
+        return _to_ticks(timestamp,self._dateclass)
+
+
+    def _reserve(self,first,last):
+        # DESCRIPTION:
+        #    Make room for buckets first to last, at least doubling the slots
+        #    (toward the side that ran out) when they do not fit.
+        #
+        # RETURNS:
+        #    bool: whether the slots moved, and the trees must be rebuilt
+        base,size = self._base,self._size
+        if size and base <= first and last < base + size:
+            return False
+
+        lo = first if size == 0 else min(first,base)
+        hi = last if size == 0 else max(last,base + size - 1)
+        new = 1
+        while new < max(hi - lo + 1,2*size):
+            new *= 2
+        # Leave the spare slots where the data is growing
+        new_base = lo if size == 0 or last >= base + size else hi - new + 1
+
+        shift = base - new_base
+        for name,empty in (('_counts',0),('_sums',0),('_mins',_INF),
+                           ('_maxs',-_INF)):
+            column = [empty]*new
+            column[shift:shift + size] = getattr(self,name)
+            setattr(self,name,column)
+        self._base = new_base
+        self._size = new
+        return True
+
+
+    def _rebuild(self):
+        # Build the Fenwick and segment trees from the slots, in O(slots)
+        size = self._size
+        for tree,column in ((self._fcount,self._counts),
+                            (self._fsum,self._sums)):
+            tree[:] = [0] + column
+            for i in range(1,size + 1):
+                j = i + (i & -i)
+                if j <= size:
+                    tree[j] += tree[i]
+        for tree,column,pick in ((self._tmin,self._mins,min),
+                                 (self._tmax,self._maxs,max)):
+            tree[:] = [0]*size + column
+            for i in range(size - 1,0,-1):
+                tree[i] = pick(tree[2*i],tree[2*i + 1])
+
+
+    def _add(self,t,value):
+        # Add one value to its bucket (and raw values), but not the trees
+        b = t//self._width
+        i = b - self._base
+        self._counts[i] += 1
+        self._sums[i] += value
+        if value < self._mins[i]:
+            self._mins[i] = value
+        if value > self._maxs[i]:
+            self._maxs[i] = value
+        if self._width > 1:
+            raw = self._raw.get(b)
+            if raw is None:
+                self._raw[b] = ([t],[value])
+            else:
+                ticks,values = raw
+                if t >= ticks[-1]:
+                    ticks.append(t)
+                    values.append(value)
+                else:
+                    j = bisect.bisect_right(ticks,t)
+                    ticks.insert(j,t)
+                    values.insert(j,value)
+        self._n += 1
+        return i
+
+
+    def _update(self,i,value):
+        # Add a value already in slot i to the trees, in O(log n)
+        size = self._size
+        j = i + 1
+        while j <= size:
+            self._fcount[j] += 1
+            self._fsum[j] += value
+            j += j & -j
+        for tree,column,pick in ((self._tmin,self._mins,min),
+                                 (self._tmax,self._maxs,max)):
+            j = i + size
+            tree[j] = column[i]
+            j //= 2
+            while j:
+                tree[j] = pick(tree[2*j],tree[2*j + 1])
+                j //= 2
+
+
+    def append(self,timestamp,value):
+        # DESCRIPTION:
+        #    Add one value, updating the trees in O(log n).
+        #
+        # RAISES:
+        #    TypeError: if timestamp is not of the store's date class
+        t = self._ticks(timestamp)
+        b = t//self._width
+        if self._reserve(b,b):
+            self._add(t,value)
+            self._rebuild()
+            return
+
+        self._update(self._add(t,value),value)
+
+
+    def extend(self,data):
+        # DESCRIPTION:
+        #    Add many values. Unless there are few of them, the trees are
+        #    rebuilt once, in O(n), rather than updated per value.
+        #
+        # PARAMS:
+        #    data: iterable of (timestamp, value)
+        #
+        # RAISES:
+        #    TypeError: if a timestamp is not of the store's date class.
+        #               Nothing is added then.
+        items = [(self._ticks(timestamp),value) for timestamp,value in data]
+        if not items:
+            return
+        ticks = [t for t,_ in items]
+        moved = self._reserve(min(ticks)//self._width,
+                              max(ticks)//self._width)
+        if not moved and len(items)*self._size.bit_length() < self._size:
+            # Cheaper to update the trees per value than to rebuild them
+            for t,value in items:
+                self._update(self._add(t,value),value)
+            return
+        for t,value in items:
+            self._add(t,value)
+        self._rebuild()
+
+
+    #----------------------------------------------------------------
+    #|                            Queries                           |
+    #----------------------------------------------------------------
+
+    def _prefix(self,tree,i):
+        # Sum of the first i slots
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+
+    def _extremes(self,a,b):
+        # Minimum and maximum of slots a to b - 1
+        lo,hi = _INF,-_INF
+        tmin,tmax = self._tmin,self._tmax
+        a += self._size
+        b += self._size
+        while a < b:
+            if a & 1:
+                lo = min(lo,tmin[a])
+                hi = max(hi,tmax[a])
+                a += 1
+            if b & 1:
+                b -= 1
+                lo = min(lo,tmin[b])
+                hi = max(hi,tmax[b])
+            a //= 2
+            b //= 2
+        return lo,hi
+
+
+    def _partial(self,b,lo,hi):
+        # Count, sum, min and max of the raw values of bucket b in [lo, hi]
+        raw = self._raw.get(b)
+        if raw is None:
+            return 0,0,_INF,-_INF
+        ticks,values = raw
+        part = values[bisect.bisect_left(ticks,lo):
+                      bisect.bisect_right(ticks,hi)]
+        if not part:
+            return 0,0,_INF,-_INF
+        return len(part),sum(part),min(part),max(part)
+
+
+    def summary(self,dr):
+        # DESCRIPTION:
+        #    Count, sum, min and max of the values whose timestamps are in a
+        #    DateRange, in O(log n) plus the values of the two edge buckets.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #       Bounds are inclusive, as in `timestamp in dr`. Unbounded
+        #       sides take in every value on that side.
+        #
+        # RETURNS:
+        #    Summary
+        #
+        # RAISES:
+        #    TypeError: if dr is not a DateRange of the store's date class
+        if not isinstance(dr,DateRange):
+            raise TypeError('Expected a DateRange, not '+str(type(dr)))
+        if self._n == 0:
+            return Summary(0,0,None,None)
+        if dr._dateclass is not None and dr._dateclass is not self._dateclass:
+            raise TypeError('Cannot compare '+str(dr._dateclass)+' to '+
+                str(self._dateclass))
+
+        width,base,size = self._width,self._base,self._size
+        lo = base*width if dr._lo is None else max(dr._lo,base*width)
+        hi = ((base + size)*width - 1 if dr._hi is None else
+              min(dr._hi,(base + size)*width - 1))
+        if lo > hi:
+            return Summary(0,0,None,None)
+
+        parts = []
+        first,last = lo//width,hi//width
+        if first == last and (lo % width or hi % width != width - 1):
+            parts.append(self._partial(first,lo,hi))
+            first,last = 1,0
+        else:
+            if lo % width:
+                parts.append(self._partial(first,lo,hi))
+                first += 1
+            if hi % width != width - 1:
+                parts.append(self._partial(last,lo,hi))
+                last -= 1
+
+        if first <= last:
+            a,b = first - base,last - base + 1
+            count = (self._prefix(self._fcount,b) -
+                     self._prefix(self._fcount,a))
+            if count:
+                total = self._prefix(self._fsum,b) - self._prefix(self._fsum,a)
+                parts.append((count,total) + self._extremes(a,b))
+
+        count = sum(p[0] for p in parts)
+        if count == 0:
+            return Summary(0,0,None,None)
+        return Summary(count,sum(p[1] for p in parts),
+                       min(p[2] for p in parts),max(p[3] for p in parts))
+
+
+    def count(self,dr):
+        return self.summary(dr).count
+
+    def sum(self,dr):
+        return self.summary(dr).sum
+
+    def min(self,dr):
+        return self.summary(dr).min
+
+    def max(self,dr):
+        return self.summary(dr).max
+
+
+    def __len__(self):
+        return self._n
+
+
+    def __str__(self):
+        return ('Rollup('+str(self._n)+' values in '+str(self._size)+' '+
+                ('days' if self._width in (1,_DAY_TICKS) else 'hours')+')')
+
+    def __repr__(self):
+        return self.__str__()
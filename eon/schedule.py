@@ -0,0 +1,459 @@
+# eon.schedule
+# Firing callbacks on the cycles of many DateRanges from one asyncio timer
+import asyncio
+import datetime
+import heapq
+import inspect
+import itertools
+
+from eon import _DAY_TICKS, _from_ticks, _to_ticks
+from eon.cycles import Cycle, _UNITS
+
+_CATCHUPS = ('all','last','skip')
+
+
+def _ticks(d):
+    # Microsecond ticks of a naive datetime, as in eon._to_ticks
+    return _to_ticks(d,datetime.datetime)
+
+
+def _delta(td):
+    return (td.days*86400 + td.seconds)*1000000 + td.microseconds
+
+
+class LoopClock:
+    """The real clock: local naive datetime.now() and asyncio timers.
+
+    Timers are armed with loop.call_later on the running event loop, so a
+    Scheduler using this clock must be started from inside that loop.
+    """
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def call_later(self,delay,callback):
+        loop = asyncio.get_running_loop()
+        return loop.call_later(max(delay.total_seconds(),0),callback)
+
+
+class _FakeTimer:
+    __slots__ = ('_callback','_cancelled')
+
+    def __init__(self,callback):
+        self._callback = callback
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+
+class FakeClock:
+    """A clock that only moves when told to, for testing schedules.
+
+    Timers run synchronously inside advance(), in order of their times,
+    with now() reading each timer's time while it runs. No time passes and
+    no event loop is needed.
+    """
+
+    def __init__(self,start):
+        """Stop the clock at `start`.
+
+        Args:
+            start: datetime.datetime
+               A naive datetime.
+
+        Examples:
+            >>>clock = FakeClock(datetime(2012,1,1))
+            >>>s = Scheduler(clock=clock)
+            >>>s.add(DateRange(datetime(2012,1,1),None),'hours',print)
+            >>>s.start()
+            >>>clock.advance(timedelta(hours=2))
+            2012-01-01 00:00:00
+            2012-01-01 01:00:00
+            2012-01-01 02:00:00
+        """
+        self._now = _ticks(start)
+        self._timers = []
+        self._seq = itertools.count()
+
+    def now(self):
+        return _from_ticks(self._now,datetime.datetime)
+
+    def call_later(self,delay,callback):
+        timer = _FakeTimer(callback)
+        heapq.heappush(self._timers,(self._now + max(_delta(delay),0),
+                                     next(self._seq),timer))
+        return timer
+
+    def advance(self,td):
+        # DESCRIPTION:
+        #    Move the clock forward by td, running every timer that falls due
+        #    on the way (including those they arm themselves).
+        #
+        # RAISES:
+        #    ValueError: if td is negative
+        if td < datetime.timedelta(0):
+            raise ValueError('A clock cannot go back in time')
+        target = self._now + _delta(td)
+        timers = self._timers
+        while timers and timers[0][0] <= target:
+            when,_,timer = heapq.heappop(timers)
+            if timer._cancelled:
+                continue
+            self._now = max(self._now,when)
+            timer._callback()
+        self._now = target
+
+
+class Job:
+    """One periodic job of a Scheduler: a cycle of a DateRange and a
+    callback to fire at each of its values.
+
+    Made by Scheduler.add(). The cycle is held in closed form (see
+    eon.cycles), so the next value after any moment is computed directly,
+    however many values have been missed.
+    """
+
+    __slots__ = ('_cycle','_callback','_catchup','_k','_scale','_seq',
+                 '_scheduler')
+
+    def __init__(self,scheduler,cycle,callback,catchup,k):
+        self._scheduler = scheduler
+        self._cycle = cycle
+        self._callback = callback
+        self._catchup = catchup
+        self._k = k
+        # Job ticks to scheduler (microsecond) ticks
+        self._scale = _DAY_TICKS//cycle._tpd
+        self._seq = None
+
+
+    def _due(self):
+        # Microsecond ticks of the next value, or None if there are none
+        ks = self._cycle._ks
+        if self._seq is None or (ks is not None and self._k >= len(ks)):
+            return None
+        return self._cycle._at(self._k)*self._scale
+
+
+    def _first(self,t):
+        # The first k whose value is at or after t microsecond ticks
+        scale = self._scale
+        k = self._cycle._floor(-(-t//scale) - 1) + 1
+        return max(k,0)
+
+
+    def _take(self,now,grace):
+        # DESCRIPTION:
+        #    Move past every value due at `now` microsecond ticks.
+        #
+        # RETURNS:
+        #    list of the values to fire, as date[time]s, chosen by the
+        #    catch-up policy
+        cycle = self._cycle
+        scale = self._scale
+        k = self._k
+        last = cycle._floor(now//scale)
+        if cycle._ks is not None:
+            last = min(last,len(cycle._ks) - 1)
+        self._k = last + 1
+
+        if self._catchup == 'all':
+            ks = range(k,last + 1)
+        elif self._catchup == 'last':
+            ks = range(last,last + 1)
+        else:
+            j = last
+            while j >= k and now - cycle._at(j)*scale <= grace:
+                j -= 1
+            ks = range(j + 1,last + 1)
+        dateclass = cycle._dateclass
+        return [_from_ticks(cycle._at(i),dateclass) for i in ks]
+
+
+    def next_fire(self):
+        # DESCRIPTION:
+        #    When the callback fires next.
+        #
+        # RETURNS:
+        #    datetime.date[time] (a date fires at its midnight), or None if
+        #    the job is cancelled or has run out of values
+        due = self._due()
+        if due is None:
+            return None
+        return _from_ticks(due//self._scale,self._cycle._dateclass)
+
+
+    def after(self,d):
+        # DESCRIPTION:
+        #    The first value of the job's cycle after d, whether or not the
+        #    job is still scheduled.
+        #
+        # PARAMS:
+        #    d: datetime.date[time]
+        #       Of the date class of the job's DateRange.
+        #
+        # RETURNS:
+        #    datetime.date[time] | None
+        cycle = self._cycle
+        k = max(cycle._floor(_to_ticks(d,cycle._dateclass)) + 1,0)
+        if cycle._ks is not None and k >= len(cycle._ks):
+            return None
+        return _from_ticks(cycle._at(k),cycle._dateclass)
+
+
+    def cancel(self):
+        # DESCRIPTION:
+        #    Stop firing this job. Cancelling twice does nothing.
+        self._scheduler.cancel(self)
+
+
+    def done(self):
+        # DESCRIPTION:
+        #    Whether the job will fire no more: it was cancelled or its
+        #    cycle has run out of values.
+        return self._seq is None
+
+
+    def __str__(self):
+        fire = self.next_fire()
+        return ('Job('+self._cycle._unit+', next '+
+                ('never' if fire is None else str(fire))+')')
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Scheduler:
+    """Fires callbacks at the values of DateRange cycles, cron-style.
+
+    All jobs share one timer: their next firing times are kept in a heap,
+    and a single timer is armed for the earliest. Adding, firing or
+    cancelling a job costs O(log n), so tens of thousands of jobs need no
+    task or timer each.
+
+    When the clock has moved past several values of a job at once (the
+    event loop was blocked, or the machine slept), the job's catch-up
+    policy decides which of them fire:
+        'all': every one, in order
+        'last': only the latest (the default)
+        'skip': only those at most `grace` late
+    """
+
+    def __init__(self,clock=None,catchup='last',
+                 grace=datetime.timedelta(seconds=1)):
+        """Make an empty scheduler.
+
+        Args:
+            clock: [None] | LoopClock | FakeClock
+               Anything with now(), returning a naive datetime, and
+               call_later(timedelta, callback), returning a handle with
+               cancel(). By default the running asyncio event loop.
+            catchup: ['last'] | 'all' | 'skip'
+               The default catch-up policy of jobs.
+            grace: [1 second] | datetime.timedelta
+               How late a value may fire under the 'skip' policy.
+
+        Raises:
+            ValueError: if catchup is unknown.
+
+        Examples:
+            >>>s = Scheduler()
+            >>>s.add(DateRange(datetime(2012,1,1),None),'days',report)
+            >>>await s.run()
+        """
+        if catchup not in _CATCHUPS:
+            raise ValueError("catchup must be 'all', 'last' or 'skip'")
+        self._clock = LoopClock() if clock is None else clock
+        self._catchup = catchup
+        self._grace = _delta(grace)
+        self._heap = []    # (microsecond ticks, sequence number, Job)
+        self._stale = 0    # Heap entries of cancelled jobs
+        self._jobs = 0
+        self._seq = itertools.count()
+        self._timer = None
+        self._armed = None # When the timer is set to go off
+        self._running = False
+        self._stopped = None
+        self._tasks = set()
+
+
+    def _push(self,job):
+        due = job._due()
+        if due is None:
+            job._seq = None
+            self._jobs -= 1
+            return
+        job._seq = next(self._seq)
+        heapq.heappush(self._heap,(due,job._seq,job))
+
+
+    def _arm(self):
+        # Set the timer for the earliest job, if it is not set for it already
+        heap = self._heap
+        while heap and heap[0][2]._seq != heap[0][1]:
+            heapq.heappop(heap)
+            self._stale -= 1
+        if not self._running:
+            return
+        if not heap:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._stopped is not None and not self._stopped.done():
+                self._stopped.set_result(None)
+            return
+
+        due = heap[0][0]
+        if self._timer is not None:
+            if self._armed <= due:
+                return
+            self._timer.cancel()
+        now = _ticks(self._clock.now())
+        self._armed = due
+        self._timer = self._clock.call_later(
+            datetime.timedelta(microseconds=due - now),self._fire)
+
+
+    def _fire(self):
+        # The timer went off: fire every job that is due, then re-arm
+        self._timer = None
+        now = _ticks(self._clock.now())
+        heap = self._heap
+        try:
+            while heap and heap[0][0] <= now:
+                _,seq,job = heapq.heappop(heap)
+                if job._seq != seq:
+                    self._stale -= 1
+                    continue
+                values = job._take(now,self._grace)
+                self._push(job)
+                for value in values:
+                    result = job._callback(value)
+                    if inspect.isawaitable(result):
+                        task = asyncio.ensure_future(result)
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+        finally:
+            self._arm()
+
+
+    def add(self,dr,unit,callback,n=0,snap=False,catchup=None):
+        # DESCRIPTION:
+        #    Fire callback(value) at every value of a cycle of dr from now
+        #    on, as dr.cycles(unit) or dr.<unit>(n,snap) would generate
+        #    them. Values before now are not fired.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #       Must have a start(). Dates fire at their midnight.
+        #    unit: 'hours' | 'days' | 'pentads' | 'months' | 'years' |
+        #          datetime.timedelta
+        #    callback: callable value -> object
+        #       Called on the event loop with the value (a date[time]) that
+        #       fell due. If it returns an awaitable, that is run as a task.
+        #       If it raises, the exception propagates out of the timer
+        #       (asyncio logs it) and the other jobs carry on.
+        #    [n=0]: int
+        #       Maximum number of values of the cycle; 0 means no limit.
+        #    [snap=False]: bool
+        #       Fire on calendar breaks, as in days(snap=True).
+        #    [catchup=None]: 'all' | 'last' | 'skip'
+        #       By default the scheduler's policy.
+        #
+        # RETURNS:
+        #    Job
+        #
+        # RAISES:
+        #    ValueError: if dr has no start, or unit, catchup or the period
+        #                is invalid
+        if catchup is None:
+            catchup = self._catchup
+        elif catchup not in _CATCHUPS:
+            raise ValueError("catchup must be 'all', 'last' or 'skip'")
+        if isinstance(unit,datetime.timedelta):
+            if unit <= datetime.timedelta(0):
+                raise ValueError('Jobs must have a positive period')
+            cycle = Cycle(dr,'cycles',n=n,step=unit)
+        elif unit in _UNITS:
+            cycle = Cycle(dr,unit,n=n,snap=snap)
+        else:
+            raise ValueError('Unknown cycle unit: '+str(unit))
+
+        job = Job(self,cycle,callback,catchup,0)
+        job._k = job._first(_ticks(self._clock.now()))
+        job._seq = 0
+        self._jobs += 1
+        self._push(job)
+        self._arm()
+        return job
+
+
+    def cancel(self,job):
+        # DESCRIPTION:
+        #    Stop firing a job. Its heap entry is dropped lazily, and the
+        #    heap is rebuilt once most of it is cancelled jobs.
+        if job._scheduler is not self:
+            raise ValueError('Job belongs to another scheduler')
+        if job._seq is None:
+            return
+        job._seq = None
+        self._jobs -= 1
+        self._stale += 1
+        if self._stale > len(self._heap)//2:
+            self._heap = [e for e in self._heap if e[2]._seq == e[1]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+        self._arm()
+
+
+    def next_fire(self):
+        # DESCRIPTION:
+        #    When the next callback of any job fires.
+        #
+        # RETURNS:
+        #    datetime.datetime | None
+        self._arm()
+        if not self._heap:
+            return None
+        return _from_ticks(self._heap[0][0],datetime.datetime)
+
+
+    def start(self):
+        # DESCRIPTION:
+        #    Arm the timer. With the default clock this must be called from
+        #    inside the running event loop.
+        self._running = True
+        self._arm()
+
+
+    def stop(self):
+        # DESCRIPTION:
+        #    Disarm the timer. Jobs keep their places, and fire (following
+        #    their catch-up policies) if the scheduler is started again.
+        self._running = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._stopped is not None and not self._stopped.done():
+            self._stopped.set_result(None)
+
+
+    async def run(self):
+        # DESCRIPTION:
+        #    Start the scheduler and wait until it is stopped or has no jobs
+        #    left.
+        self._stopped = asyncio.get_running_loop().create_future()
+        self.start()
+        await self._stopped
+
+
+    def __len__(self):
+        return self._jobs
+
+
+    def __str__(self):
+        return 'Scheduler('+str(self._jobs)+' jobs)'
+
+    def __repr__(self):
+        return self.__str__()
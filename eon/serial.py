@@ -0,0 +1,237 @@
+# eon.serial
+# A compact binary format for collections of DateRanges
+#
+# Layout (all integers little-endian):
+#    header  16 bytes   b'EONR', format version (uint8), date class (uint8:
+#                       0 none, 1 date, 2 datetime), 2 bytes of padding,
+#                       number of ranges n (uint64)
+#    lo      8*n bytes  int64 start ticks
+#    hi      8*n bytes  int64 end ticks
+#    mask    ceil(n/4)  2 bits per range: bit 2i is set if range i has no
+#                       start, bit 2i+1 if it has no end
+#
+# Ticks are those used inside DateRange (see eon._to_ticks). Unbounded
+# sides also hold the int64 min (start) and max (end) sentinels of
+# eon.array, and a missing range (None) is stored as an empty row whose
+# start is after its end, so the two tick columns are exactly the columns of
+# an eon.array.DateRangeArray and can be used in place with
+# numpy.frombuffer:
+#
+#    n = struct.unpack_from('<Q',data,8)[0]
+#    lo = numpy.frombuffer(data,'<i8',n,16)
+#    hi = numpy.frombuffer(data,'<i8',n,16 + 8*n)
+import array
+import datetime
+import struct
+import sys
+
+from eon import DateRange
+
+_MAGIC = b'EONR'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBBxxQ')
+_CODES = { None: 0, datetime.date: 1, datetime.datetime: 2 }
+_CLASSES = { 0: None, 1: datetime.date, 2: datetime.datetime }
+_UNBOUNDED_LO = -(1 << 63)
+_UNBOUNDED_HI = (1 << 63) - 1
+_SWAP = sys.byteorder == 'big'
+
+
+def _layout(n):
+    # Offsets of the lo, hi and mask sections and the total size
+    lo = _HEADER.size
+    hi = lo + 8*n
+    mask = hi + 8*n
+    return lo,hi,mask,mask + (n + 3)//4
+
+
+def _header(data):
+    # DESCRIPTION:
+    #    Read and check the header of serialized ranges.
+    #
+    # RETURNS:
+    #    (n, dateclass)
+    #
+    # RAISES:
+    #    ValueError: if data is not in this format or is truncated
+    if len(data) < _HEADER.size:
+        raise ValueError('Data is too short to hold DateRanges')
+    magic,version,code,n = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError('Data does not hold serialized DateRanges')
+    if version != _VERSION:
+        raise ValueError('Unsupported DateRange format version '+
+            str(version))
+    if code not in _CLASSES:
+        raise ValueError('Unknown date class code '+str(code))
+    if len(data) < _layout(n)[3]:
+        raise ValueError('Data is truncated: expected '+
+            str(_layout(n)[3])+' bytes, got '+str(len(data)))
+    return n,_CLASSES[code]
+
+
+def dumps(ranges):
+    # DESCRIPTION:
+    #    Serialize DateRanges to the compact binary format.
+    #
+    # PARAMS:
+    #    ranges: iterable of DateRange | None | eon.array.DateRangeArray
+    #       None entries are kept, as empty rows.
+    #
+    # RETURNS:
+    #    bytes
+    #
+    # NOTES:
+    #    The tick columns of a DateRangeArray are copied straight into the
+    #    output. Other iterables are packed into two array('q') columns.
+    #    Either way a range takes about 16 bytes, against ~100 for a
+    #    pickled DateRange before DateRange.__reduce__.
+    #
+    # RAISES:
+    #    TypeError: if the ranges are not DateRanges or mix date classes
+    array_module = sys.modules.get('eon.array') # Only loaded if numpy is used
+    if array_module is not None and isinstance(ranges,
+                                               array_module.DateRangeArray):
+        return _dumps_array(ranges)
+
+    lo = array.array('q')
+    hi = array.array('q')
+    dateclass = None
+    for dr in ranges:
+        if dr is None:
+            lo.append(_UNBOUNDED_HI)
+            hi.append(_UNBOUNDED_LO)
+            continue
+        if not isinstance(dr,DateRange):
+            raise TypeError('Expected DateRanges, not '+str(type(dr)))
+        if dr._dateclass is not None:
+            if dateclass is None:
+                dateclass = dr._dateclass
+            elif dr._dateclass is not dateclass:
+                raise TypeError('Cannot mix '+str(dateclass)+' and '+
+                    str(dr._dateclass)+' DateRanges')
+        lo.append(_UNBOUNDED_LO if dr._lo is None else dr._lo)
+        hi.append(_UNBOUNDED_HI if dr._hi is None else dr._hi)
+
+    n = len(lo)
+    mask = bytearray((n + 3)//4)
+    for i in range(n):
+        if lo[i] == _UNBOUNDED_LO:
+            mask[i >> 2] |= 1 << ((i & 3)*2)
+        if hi[i] == _UNBOUNDED_HI:
+            mask[i >> 2] |= 2 << ((i & 3)*2)
+
+    if _SWAP:
+        lo.byteswap()
+        hi.byteswap()
+    return b''.join((_HEADER.pack(_MAGIC,_VERSION,_CODES[dateclass],n),
+                     lo.tobytes(),hi.tobytes(),bytes(mask)))
+
+
+def _dumps_array(arr):
+    # dumps for a DateRangeArray, filling the columns of a single buffer
+    import numpy as np
+    n = len(arr)
+    start,middle,end,size = _layout(n)
+    out = bytearray(size)
+    _HEADER.pack_into(out,0,_MAGIC,_VERSION,_CODES[arr._dateclass],n)
+    np.frombuffer(out,'<i8',n,start)[:] = arr._lo
+    np.frombuffer(out,'<i8',n,middle)[:] = arr._hi
+    bits = np.empty(2*n,dtype=bool)
+    bits[0::2] = arr._lo == _UNBOUNDED_LO
+    bits[1::2] = arr._hi == _UNBOUNDED_HI
+    np.frombuffer(out,np.uint8,size - end,end)[:] = np.packbits(
+        bits,bitorder='little')
+    return bytes(out)
+
+
+def ticks(data):
+    # DESCRIPTION:
+    #    View the tick columns of serialized ranges without copying them.
+    #
+    # PARAMS:
+    #    data: bytes | bytearray | memoryview | mmap.mmap
+    #       Anything supporting the buffer protocol.
+    #
+    # RETURNS:
+    #    (lo, hi, dateclass): lo and hi are int64 memoryviews into data
+    #    (writable if data is), with the sentinels described above on
+    #    unbounded sides
+    #
+    # RAISES:
+    #    ValueError: if data is not in this format, or on a big-endian
+    #                machine (where the columns would need byte swapping)
+    if _SWAP:
+        raise ValueError('Cannot view little-endian ticks in place on a '+
+            'big-endian machine, use loads()')
+    view = memoryview(data).cast('B')
+    n,dateclass = _header(view)
+    lo,hi,mask,_ = _layout(n)
+    return view[lo:hi].cast('q'),view[hi:mask].cast('q'),dateclass
+
+
+def loads(data):
+    # DESCRIPTION:
+    #    Read DateRanges back from the compact binary format.
+    #
+    # PARAMS:
+    #    data: bytes | bytearray | memoryview | mmap.mmap
+    #
+    # RETURNS:
+    #    list of DateRange, with None for empty rows
+    #
+    # RAISES:
+    #    ValueError: if data is not in this format
+    view = memoryview(data).cast('B')
+    n,dateclass = _header(view)
+    start,middle,end,size = _layout(n)
+    lo = array.array('q')
+    lo.frombytes(view[start:middle])
+    hi = array.array('q')
+    hi.frombytes(view[middle:end])
+    mask = view[end:size]
+    if _SWAP:
+        lo.byteswap()
+        hi.byteswap()
+
+    fromticks = DateRange._fromticks
+    out = []
+    for i in range(n):
+        bits = mask[i >> 2] >> ((i & 3)*2)
+        a = None if bits & 1 else lo[i]
+        b = None if bits & 2 else hi[i]
+        if a is not None and b is not None and a > b:
+            out.append(None)
+            continue
+        out.append(fromticks(a,b,None if a is None and b is None else
+                                 dateclass))
+    return out
+
+
+def toarray(data,copy=False):
+    # DESCRIPTION:
+    #    Read serialized ranges as a DateRangeArray. Requires numpy.
+    #
+    # PARAMS:
+    #    data: bytes | bytearray | memoryview | mmap.mmap
+    #    [copy=False]: bool
+    #       By default the array's tick columns are views into data (read
+    #       only if data is), so nothing is copied and data must be kept
+    #       alive and unchanged. If True, they are copied out.
+    #
+    # RETURNS:
+    #    eon.array.DateRangeArray
+    #
+    # RAISES:
+    #    ValueError: if data is not in this format
+    import numpy as np
+    from eon.array import DateRangeArray
+
+    n,dateclass = _header(memoryview(data).cast('B'))
+    start,middle,_,_ = _layout(n)
+    lo = np.frombuffer(data,dtype='<i8',count=n,offset=start)
+    hi = np.frombuffer(data,dtype='<i8',count=n,offset=middle)
+    if copy is True or _SWAP:
+        lo = lo.astype(np.int64)
+        hi = hi.astype(np.int64)
+    return DateRangeArray._fromticks(lo,hi,dateclass)
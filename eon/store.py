@@ -0,0 +1,538 @@
+# eon.store
+# A file-backed store of DateRanges, queried through mmap
+import array
+import bisect
+import heapq
+import mmap
+import os
+import struct
+
+from eon import DateRange, _to_ticks
+from eon.serial import (_CLASSES, _CODES, _HEADER, _MAGIC, _SWAP,
+                        _UNBOUNDED_HI, _UNBOUNDED_LO, _VERSION, _layout,
+                        ticks)
+
+# Sidecar files next to the main file:
+#    <path>.idx  the sparse block index: a header (magic, version, block
+#                size, number of ranges it describes) and, for each block
+#                of `block` ranges, the start of its first range and the
+#                latest end of any of its ranges, as int64 pairs
+#    <path>.log  ranges appended since the last compaction, unsorted: a
+#                header (magic, version, date class) and int64 (start, end)
+#                pairs
+_INDEX_MAGIC = b'EONI'
+_INDEX_HEADER = struct.Struct('<4sBxxxQQ')
+_LOG_MAGIC = b'EONL'
+_LOG_HEADER = struct.Struct('<4sBBxx')
+_PAIR = struct.Struct('<qq')
+
+
+def _range(fromticks,lo,hi,dateclass):
+    # A DateRange from stored ticks. As DateRange(None,None), one unbounded
+    # on both sides has no date class.
+    if lo == _UNBOUNDED_LO:
+        if hi == _UNBOUNDED_HI:
+            return fromticks(None,None,None)
+        return fromticks(None,hi,dateclass)
+    return fromticks(lo,None if hi == _UNBOUNDED_HI else hi,dateclass)
+
+
+class RangeStore:
+    """DateRanges kept on disk, sorted by start, and queried through mmap.
+
+    The main file is in the format of eon.serial, sorted by start and then
+    end, with a sparse index holding the first start and the latest end of
+    every block of ranges. A query binary searches the index, which is
+    small enough to stay in memory, and then reads only the blocks that can
+    hold a match, so the operating system only pages in those parts of the
+    file. Stores can be much larger than memory.
+
+    New ranges are appended, unsorted, to a log that every query also
+    scans. compact() merges the log into the main file; it runs
+    automatically once the log holds `log_limit` ranges.
+    """
+
+    def __init__(self,path,block=512,log_limit=65536):
+        """Open a range store, creating it if needed.
+
+        Args:
+            path: str
+               The main file. The index and the log are kept next to it as
+               path + '.idx' and path + '.log'.
+            block: [512] | int
+               Number of ranges per index block. 512 ranges fill one 4 KiB
+               page of each tick column.
+            log_limit: [65536] | int
+               Compact when the log reaches this many ranges. 0 never
+               compacts automatically.
+
+        Raises:
+            ValueError: if the files are not a range store.
+            TypeError: if the main file and the log hold different date
+                classes.
+
+        Examples:
+            >>>with RangeStore('outages.eon') as store:
+            ...    store.extend(outages)
+            ...    store.overlapping(DateRange(date(2012,1,1),date(2012,2,1)))
+        """
+        if block < 1:
+            raise ValueError('block must be positive')
+        self._path = path
+        self._block = block
+        self._log_limit = log_limit
+
+        if not os.path.exists(path):
+            _write_empty(path,None)
+        self._open_main()
+        self._open_log()
+
+
+    #----------------------------------------------------------------
+    #|                          Files                               |
+    #----------------------------------------------------------------
+
+    def _open_main(self):
+        # Map the main file and load (or rebuild) its block index
+        with open(self._path,'rb') as fh:
+            self._map = mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+        self._lo,self._hi,dateclass = ticks(self._map)
+        self._n = len(self._lo)
+        self._dateclass = dateclass
+        self._load_index()
+
+
+    def _close_main(self):
+        # The memoryviews must be released before the map can be closed
+        self._lo.release()
+        self._hi.release()
+        self._map.close()
+
+
+    def _load_index(self):
+        # DESCRIPTION:
+        #    Read the block index, rebuilding it with one pass over the main
+        #    file if it is missing or describes another version of it.
+        path = self._path + '.idx'
+        try:
+            with open(path,'rb') as fh:
+                data = fh.read()
+            magic,version,block,n = _INDEX_HEADER.unpack_from(data)
+            if (magic,version,block,n) != (_INDEX_MAGIC,_VERSION,self._block,
+                                           self._n):
+                raise ValueError('Stale index')
+            pairs = array.array('q')
+            pairs.frombytes(data[_INDEX_HEADER.size:])
+            if _SWAP:
+                pairs.byteswap()
+        except (OSError,struct.error,ValueError):
+            pairs = self._build_index()
+            self._write_index(pairs)
+
+        self._firsts = pairs[0::2]
+        self._maxends = pairs[1::2]
+        self._build_tree()
+
+
+    def _build_tree(self):
+        # A max segment tree over the latest ends of the blocks (leaves at
+        # _leaves + k, root at 1), so that the blocks reaching a time are
+        # found without looking at every block
+        leaves = 1
+        while leaves < len(self._maxends):
+            leaves *= 2
+        tree = array.array('q',[_UNBOUNDED_LO])*(2*leaves)
+        tree[leaves:leaves + len(self._maxends)] = self._maxends
+        for i in range(leaves - 1,0,-1):
+            tree[i] = max(tree[2*i],tree[2*i + 1])
+        self._tree = tree
+        self._leaves = leaves
+
+
+    def _build_index(self):
+        # Index pairs of the main file, in one sequential pass
+        pairs = array.array('q')
+        lo,hi,block = self._lo,self._hi,self._block
+        for b in range(0,self._n,block):
+            pairs.append(lo[b])
+            pairs.append(max(hi[b:b+block]))
+        return pairs
+
+
+    def _write_index(self,pairs):
+        if _SWAP:
+            pairs = array.array('q',pairs)
+            pairs.byteswap()
+        tmp = self._path + '.idx.tmp'
+        with open(tmp,'wb') as fh:
+            fh.write(_INDEX_HEADER.pack(_INDEX_MAGIC,_VERSION,self._block,
+                                        self._n))
+            fh.write(pairs.tobytes())
+        os.replace(tmp,self._path + '.idx')
+
+
+    def _open_log(self):
+        # DESCRIPTION:
+        #    Load the log into memory and open it for appending, creating it
+        #    if needed.
+        #
+        # RAISES:
+        #    ValueError: if the log is not a range store log
+        #    TypeError: if its date class does not match the main file
+        path = self._path + '.log'
+        self._log_lo = array.array('q')
+        self._log_hi = array.array('q')
+        if os.path.exists(path):
+            with open(path,'rb') as fh:
+                data = fh.read()
+            magic,version,code = _LOG_HEADER.unpack_from(data)
+            if magic != _LOG_MAGIC or version != _VERSION or (
+               code not in _CLASSES):
+                raise ValueError(path+' is not a range store log')
+            self._set_dateclass(_CLASSES[code])
+
+            # Ignore a pair cut short by a crash
+            end = _LOG_HEADER.size + (len(data) - _LOG_HEADER.size)//16*16
+            for lo,hi in _PAIR.iter_unpack(data[_LOG_HEADER.size:end]):
+                self._log_lo.append(lo)
+                self._log_hi.append(hi)
+        else:
+            with open(path,'wb') as fh:
+                fh.write(_LOG_HEADER.pack(_LOG_MAGIC,_VERSION,
+                                          _CODES[self._dateclass]))
+        self._log = open(path,'r+b')
+        self._log.seek(0,os.SEEK_END)
+
+
+    def _set_dateclass(self,dateclass):
+        # DESCRIPTION:
+        #    Fix the date class of the store on the first bounded range.
+        #
+        # RAISES:
+        #    TypeError: if it is already another date class
+        if dateclass is None or dateclass is self._dateclass:
+            return
+        if self._dateclass is not None:
+            raise TypeError('Cannot store '+str(dateclass)+' ranges in a '+
+                'store of '+str(self._dateclass)+' ranges')
+        self._dateclass = dateclass
+        if getattr(self,'_log',None) is not None:
+            self._log.seek(5)
+            self._log.write(bytes((_CODES[dateclass],)))
+            self._log.seek(0,os.SEEK_END)
+
+
+    #----------------------------------------------------------------
+    #|                         Ingestion                            |
+    #----------------------------------------------------------------
+
+    def append(self,dr):
+        # DESCRIPTION:
+        #    Add a DateRange to the store.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #
+        # RAISES:
+        #    TypeError: if dr is not a DateRange of the store's date class
+        self.extend((dr,))
+
+
+    def extend(self,ranges):
+        # DESCRIPTION:
+        #    Add many DateRanges to the store. They are written to the log
+        #    at once and are visible to queries straight away.
+        #
+        # PARAMS:
+        #    ranges: iterable of DateRange | eon.array.DateRangeArray
+        #       Empty rows of a DateRangeArray are skipped.
+        #
+        # RAISES:
+        #    TypeError: if the ranges are not DateRanges of the store's
+        #               date class
+        out = array.array('q')
+        for dr in ranges:
+            if dr is None:
+                continue
+            if not isinstance(dr,DateRange):
+                raise TypeError('Expected DateRanges, not '+str(type(dr)))
+            self._set_dateclass(dr._dateclass)
+            out.append(_UNBOUNDED_LO if dr._lo is None else dr._lo)
+            out.append(_UNBOUNDED_HI if dr._hi is None else dr._hi)
+
+        # Only keep the ranges once all of them have been checked
+        self._log_lo.extend(out[0::2])
+        self._log_hi.extend(out[1::2])
+        if _SWAP:
+            out.byteswap()
+        self._log.write(out.tobytes())
+        if self._log_limit and len(self._log_lo) >= self._log_limit:
+            self.compact()
+
+
+    def flush(self):
+        # Push appended ranges to the operating system
+        self._log.flush()
+
+
+    def compact(self):
+        # DESCRIPTION:
+        #    Merge the log into the main file, keeping it sorted by start
+        #    and then end, and rewrite the index.
+        #
+        # NOTES:
+        #    The main file is streamed through in order and merged with the
+        #    sorted log straight into a mapped new file, so memory use is
+        #    that of the log. The new files replace the old ones with
+        #    os.replace; a crash before the log is emptied can leave the
+        #    log's ranges in both.
+        if not self._log_lo:
+            return
+        self._log.flush()
+
+        logged = sorted(zip(self._log_lo,self._log_hi))
+        stored = zip(self._lo,self._hi)
+        n = self._n + len(logged)
+
+        tmp = self._path + '.tmp'
+        _write_empty(tmp,self._dateclass,n)
+        block = self._block
+        index = array.array('q')
+        with open(tmp,'r+b') as fh:
+            out = mmap.mmap(fh.fileno(),0)
+            lo_col,hi_col,_ = ticks(out)
+            start,middle,end,size = _layout(n)
+            mask = memoryview(out)[end:size]
+            for i,(lo,hi) in enumerate(heapq.merge(stored,logged)):
+                lo_col[i] = lo
+                hi_col[i] = hi
+                if lo == _UNBOUNDED_LO:
+                    mask[i >> 2] |= 1 << ((i & 3)*2)
+                if hi == _UNBOUNDED_HI:
+                    mask[i >> 2] |= 2 << ((i & 3)*2)
+                if i % block == 0:
+                    index.append(lo)
+                    index.append(hi)
+                elif hi > index[-1]:
+                    index[-1] = hi
+            lo_col.release()
+            hi_col.release()
+            mask.release()
+            out.flush()
+            out.close()
+
+        self._close_main()
+        os.replace(tmp,self._path)
+        self._n = n
+        self._write_index(index)
+        self._open_main()
+
+        self._log.seek(_LOG_HEADER.size)
+        self._log.truncate()
+        self._log.flush()
+        self._log_lo = array.array('q')
+        self._log_hi = array.array('q')
+
+
+    def close(self):
+        # Release the mapped file and close the log
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+            self._close_main()
+
+
+    #----------------------------------------------------------------
+    #|                           Queries                            |
+    #----------------------------------------------------------------
+
+    def _query_ticks(self,dr):
+        # DESCRIPTION:
+        #    The (lo, hi) ticks of a query DateRange, sentinels included.
+        #
+        # RAISES:
+        #    TypeError: if dr is not a DateRange of the store's date class
+        if not isinstance(dr,DateRange):
+            raise TypeError('Expected a DateRange, not '+str(type(dr)))
+        if dr._dateclass is not None and self._dateclass is not None and (
+           dr._dateclass is not self._dateclass):
+            raise TypeError('Cannot compare '+str(dr._dateclass)+' to '+
+                str(self._dateclass))
+        return (_UNBOUNDED_LO if dr._lo is None else dr._lo,
+                _UNBOUNDED_HI if dr._hi is None else dr._hi)
+
+
+    def _results(self,rows,array):
+        # Sort (lo, hi) tick pairs and turn them into DateRanges
+        rows.sort()
+        if array is True:
+            import numpy as np
+            from eon.array import DateRangeArray
+            pairs = np.array(rows,dtype=np.int64).reshape(-1,2)
+            return DateRangeArray._fromticks(pairs[:,0].copy(),
+                                             pairs[:,1].copy(),
+                                             self._dateclass)
+        fromticks = DateRange._fromticks
+        dateclass = self._dateclass
+        return [_range(fromticks,lo,hi,dateclass) for lo,hi in rows]
+
+
+    def _stop(self,t):
+        # Number of stored ranges that start no later than t
+        k = bisect.bisect_right(self._firsts,t)
+        if k == 0:
+            return 0
+        b = (k - 1)*self._block
+        return bisect.bisect_right(self._lo,t,b,min(b + self._block,self._n))
+
+
+    def _start(self,t):
+        # Number of stored ranges that start before t
+        k = bisect.bisect_left(self._firsts,t)
+        if k == 0:
+            return 0
+        b = (k - 1)*self._block
+        return bisect.bisect_left(self._lo,t,b,min(b + self._block,self._n))
+
+
+    def _blocks(self,t,count):
+        # DESCRIPTION:
+        #    The blocks among the first `count` whose latest end is at least
+        #    t, in order, by descending the max tree into the subtrees that
+        #    reach t. Each block found costs O(log n) and the rest nothing.
+        tree = self._tree
+        stack = [(1,0,self._leaves)]
+        while stack:
+            node,first,stop = stack.pop()
+            if first >= count or tree[node] < t:
+                continue
+            if stop - first == 1:
+                yield first
+                continue
+            middle = (first + stop)//2
+            stack.append((2*node + 1,middle,stop))
+            stack.append((2*node,first,middle))
+
+
+    def overlapping(self,dr,array=False):
+        # DESCRIPTION:
+        #    Find the stored DateRanges that share at least one date[time]
+        #    with dr.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #    [array=False]: bool
+        #       If True, return a DateRangeArray (requires numpy).
+        #
+        # RETURNS:
+        #    list of DateRange sorted by start and then end
+        #
+        # NOTES:
+        #    Ranges starting after dr ends are cut off by binary search, and
+        #    blocks whose latest end is before dr starts are skipped without
+        #    being read or visited, through a max tree of the index.
+        #
+        # RAISES:
+        #    TypeError: if dr is not a DateRange of the store's date class
+        qlo,qhi = self._query_ticks(dr)
+        stop = self._stop(qhi)
+        lo,hi,block = self._lo,self._hi,self._block
+        rows = []
+        for k in self._blocks(qlo,(stop + block - 1)//block):
+            for i in range(k*block,min((k + 1)*block,stop)):
+                if hi[i] >= qlo:
+                    rows.append((lo[i],hi[i]))
+
+        for lo,hi in zip(self._log_lo,self._log_hi):
+            if lo <= qhi and hi >= qlo:
+                rows.append((lo,hi))
+        return self._results(rows,array)
+
+
+    def contains(self,d,array=False):
+        # DESCRIPTION:
+        #    Find the stored DateRanges that contain a date[time].
+        #
+        # PARAMS:
+        #    d: datetime.date[time]
+        #    [array=False]: bool
+        #       If True, return a DateRangeArray (requires numpy).
+        #
+        # RETURNS:
+        #    list of DateRange sorted by start and then end
+        #
+        # RAISES:
+        #    TypeError: if d is not the store's date class
+        if self._dateclass is None:
+            t = _to_ticks(d,type(d))
+            return self.overlapping(DateRange._fromticks(t,t,type(d)),
+                                    array=array)
+        t = _to_ticks(d,self._dateclass)
+        return self.overlapping(DateRange._fromticks(t,t,self._dateclass),
+                                array=array)
+
+
+    def scan(self,dr,array=False):
+        # DESCRIPTION:
+        #    Find the stored DateRanges that start inside a window.
+        #
+        # PARAMS:
+        #    dr: DateRange
+        #    [array=False]: bool
+        #       If True, return a DateRangeArray (requires numpy).
+        #
+        # RETURNS:
+        #    list of DateRange sorted by start and then end. Only the pages
+        #    holding those ranges are read.
+        #
+        # RAISES:
+        #    TypeError: if dr is not a DateRange of the store's date class
+        qlo,qhi = self._query_ticks(dr)
+        lo,hi = self._lo,self._hi
+        rows = [(lo[i],hi[i]) for i in range(self._start(qlo),
+                                             self._stop(qhi))]
+        for lo,hi in zip(self._log_lo,self._log_hi):
+            if qlo <= lo <= qhi:
+                rows.append((lo,hi))
+        return self._results(rows,array)
+
+
+    #----------------------------------------------------------------
+    #|                          Specials                            |
+    #----------------------------------------------------------------
+
+    def __len__(self):
+        return self._n + len(self._log_lo)
+
+
+    def __iter__(self):
+        # Every stored DateRange, sorted by start and then end, streamed
+        # from the main file
+        fromticks = DateRange._fromticks
+        dateclass = self._dateclass
+        logged = sorted(zip(self._log_lo,self._log_hi))
+        for lo,hi in heapq.merge(zip(self._lo,self._hi),logged):
+            yield _range(fromticks,lo,hi,dateclass)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+    def __str__(self):
+        return 'RangeStore('+str(len(self))+' ranges)'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def _write_empty(path,dateclass,n=0):
+    # Create a main file for n ranges, zeroed after the header
+    start,middle,end,size = _layout(n)
+    with open(path,'wb') as fh:
+        fh.write(_HEADER.pack(_MAGIC,_VERSION,_CODES[dateclass],n))
+        fh.truncate(size)
@@ -0,0 +1,175 @@
+# eon.stream
+# Aggregating endless, time-ordered event streams into calendar windows
+import datetime
+
+from eon import DateRange, _to_ticks
+from eon.cycles import Cycle, _UNITS
+
+
+def _count(acc,value):
+    return acc + 1
+
+
+def _windows(dr,unit,snap):
+    # DESCRIPTION:
+    #    The window arithmetic of a stream.
+    #
+    # RETURNS:
+    #    (floor, bounds): floor(t) is the index of the window holding tick
+    #    t and bounds(k) the (lo, hi) ticks of window k. With snap, window
+    #    -1 is the partial window from start() to the first calendar break.
+    if isinstance(unit,datetime.timedelta):
+        if unit <= datetime.timedelta(0):
+            raise ValueError('Windows must have a positive length')
+        cycle = Cycle(dr,'cycles',step=unit)
+    elif unit in _UNITS:
+        cycle = Cycle(dr,unit,snap=snap)
+    else:
+        raise ValueError('Unknown cycle unit: '+str(unit))
+
+    lo,hi = dr._lo,dr._hi
+    at = cycle._at
+
+    def bounds(k):
+        wlo = at(k)
+        whi = at(k+1) - 1
+        if wlo < lo:
+            wlo = lo
+        if hi is not None and whi > hi:
+            whi = hi
+        return wlo,whi
+
+    return cycle._floor,bounds
+
+
+def tumbling(events,dr,unit,fold=None,initial=0,snap=False,lateness=None,
+             late='drop',empty=False,timestamp=None):
+    # DESCRIPTION:
+    #    Aggregate a time-ordered stream of events into consecutive,
+    #    non-overlapping calendar windows (tumbling windows), yielding each
+    #    window as soon as it closes.
+    #
+    # PARAMS:
+    #    events: iterable
+    #       (timestamp, value) pairs, or any objects if `timestamp` is
+    #       given. May be endless.
+    #    dr: DateRange
+    #       Events outside it are ignored. It must have a start() but may be
+    #       open-ended, e.g. DateRange(start,None).
+    #    unit: 'hours' | 'days' | 'pentads' | 'months' | 'years' |
+    #          datetime.timedelta
+    #       Window length. Windows start at start() and follow the same
+    #       calendar arithmetic as the cycle generators (e.g. months()).
+    #    [fold=None]: callable (accumulator, value) -> accumulator
+    #       Adds one value to a window's aggregate. By default events are
+    #       counted.
+    #    [initial=0]: object | callable
+    #       The aggregate of a window with no events. A callable is called
+    #       for every window, so mutable aggregates (a list or a dict) are
+    #       not shared between windows.
+    #    [snap=False]: bool
+    #       If True, windows are aligned to calendar breaks (midnight, the
+    #       first of the month...), with a partial first window from
+    #       start() to the first break, as rmonths(snap=True) does.
+    #    [lateness=None]: datetime.timedelta
+    #       How long to keep a window open after the latest timestamp seen
+    #       has passed its end, to accept events that arrive out of order.
+    #    [late='drop']: 'drop' | 'raise' | callable
+    #       What to do with an event for a window that has already been
+    #       yielded: ignore it, raise ValueError, or call late(event).
+    #    [empty=False]: bool
+    #       If True, also yield the windows that received no events (with
+    #       `initial` as their aggregate) between the first and the last
+    #       window yielded.
+    #    [timestamp=None]: callable event -> datetime.date[time]
+    #       Extracts the timestamp of an event, whose value is then the
+    #       event itself.
+    #
+    # RETURNS:
+    #    A generator of (DateRange, aggregate) tuples in chronological
+    #    order. Open windows are flushed when the events run out, or as
+    #    soon as an event shows that the stream has passed end().
+    #
+    # NOTES:
+    #    Only the open windows are held in memory: one window when events
+    #    arrive in order, and at most the windows spanned by `lateness`
+    #    otherwise. Each window is found in constant time from the calendar
+    #    (see eon.cycles), so nothing grows with the length of the stream.
+    #
+    # RAISES:
+    #    ValueError: if dr has no start, unit is unknown, or an event is
+    #                late and late is 'raise'
+    #    TypeError: if a timestamp is not the date class of dr
+    if dr._lo is None:
+        raise ValueError('Cannot start windows at infinity.')
+    if not (late in ('drop','raise') or callable(late)):
+        raise ValueError("late must be 'drop', 'raise' or a callable")
+    if fold is None:
+        fold = _count
+    fresh = initial if callable(initial) else (lambda: initial)
+
+    dateclass = dr._dateclass
+    floor,bounds = _windows(dr,unit,snap)
+    lo,hi = dr._lo,dr._hi
+    if lateness is None:
+        wait = 0
+    elif dateclass is datetime.date:
+        wait = lateness.days
+    else:
+        wait = (lateness.days*86400 + lateness.seconds)*1000000 + (
+                lateness.microseconds)
+
+    def window(k,acc):
+        wlo,whi = bounds(k)
+        return DateRange._fromticks(wlo,whi,dateclass),acc
+
+    opened = {}    # Window index -> aggregate, for windows not yet yielded
+    done = None    # Index of the last window yielded
+    closed = None  # Windows below this index accept no more events
+    watermark = None
+
+    def close(limit):
+        # Yield the open windows with an index below limit, in order,
+        # filling gaps with empty windows if asked to
+        nonlocal done
+        for k in sorted(k for k in opened if k < limit):
+            if empty is True and done is not None:
+                for j in range(done + 1,k):
+                    yield window(j,fresh())
+            yield window(k,opened.pop(k))
+            done = k
+
+    for event in events:
+        if timestamp is None:
+            when,value = event
+        else:
+            when,value = timestamp(event),event
+        t = _to_ticks(when,dateclass)
+
+        if watermark is None or t > watermark:
+            watermark = t
+            # Close every window that ended more than `wait` ago
+            if watermark - wait >= lo:
+                closed = floor(watermark - wait)
+                for item in close(closed):
+                    yield item
+
+        if hi is not None and watermark - wait > hi:
+            break
+        if t < lo or (hi is not None and t > hi):
+            continue
+
+        k = floor(t)
+        if closed is not None and k < closed:
+            if late == 'raise':
+                raise ValueError('Event at '+str(when)+' arrived after '+
+                    'its window was closed')
+            if late != 'drop':
+                late(event)
+            continue
+
+        acc = opened[k] if k in opened else fresh()
+        opened[k] = fold(acc,value)
+
+    for item in close(float('inf')):
+        yield item
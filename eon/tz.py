@@ -0,0 +1,459 @@
+# eon.tz
+# Timezone-aware DateRanges and cycles that follow daylight saving time
+import bisect
+import datetime
+import zoneinfo
+
+from eon import (DateRange, _DAY_TICKS, _MAX_TICKS, _MIN_TICKS, _NEG_INF,
+                 _POS_INF, _TICK, _from_ticks, _to_ticks)
+from eon.cycles import Cycle
+
+_UTC = datetime.timezone.utc
+_SECOND = 1000000
+# The zone is sampled this often when looking for transitions. Real zones
+# never change offset twice within a week.
+_SAMPLE = 7*_DAY_TICKS
+
+
+def _td_ticks(td):
+    return (td.days*86400 + td.seconds)*_SECOND + td.microseconds
+
+
+def _utc_ticks(d,zone):
+    # DESCRIPTION:
+    #    Naive UTC ticks of the instant d. A naive d is a wall time in zone
+    #    (with d.fold picking between the two readings of an ambiguous
+    #    time, as in PEP 495).
+    #
+    # RAISES:
+    #    TypeError: if d is not a datetime.datetime
+    if type(d) is not datetime.datetime:
+        raise TypeError('Expected a datetime.datetime, not '+str(type(d)))
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=zone)
+    return _to_ticks(d.replace(tzinfo=None) - d.utcoffset(),
+                     datetime.datetime)
+
+
+class _Transitions:
+    """The UTC offsets of a zone over a stretch of time, as a lookup table.
+
+    The zone is only asked for its offset when the table is built, a few
+    times per transition. Converting between UTC and wall time afterwards
+    is a bisect in the table.
+    """
+
+    def __init__(self,zone,lo,hi):
+        # Cover the local readings of lo and hi, whatever the offset
+        lo = max(lo - 2*_DAY_TICKS,_MIN_TICKS[datetime.datetime] + _DAY_TICKS)
+        hi = min(hi + 2*_DAY_TICKS,_MAX_TICKS[datetime.datetime] - _DAY_TICKS)
+
+        def offset(t):
+            d = _from_ticks(t,datetime.datetime).replace(tzinfo=_UTC)
+            return _td_ticks(d.astimezone(zone).utcoffset())
+
+        edges = []        # UTC ticks at which the offset changes
+        offsets = [offset(lo)] # offsets[i] holds before edges[i]
+        t = lo
+        while t < hi:
+            u = min(t + _SAMPLE,hi)
+            after = offset(u)
+            if after != offsets[-1]:
+                # Transitions fall on whole seconds
+                a,b = t//_SECOND,-(-u//_SECOND)
+                while b - a > 1:
+                    m = (a + b)//2
+                    if offset(m*_SECOND) == offsets[-1]:
+                        a = m
+                    else:
+                        b = m
+                edges.append(b*_SECOND)
+                offsets.append(after)
+            t = u
+
+        self._zone = zone
+        self._edges = edges
+        self._offsets = offsets
+        # Wall times from which each offset applies, for fold=0: in a gap
+        # or an overlap, the offset before the transition is used
+        self._walls = [e + max(offsets[i],offsets[i+1])
+                       for i,e in enumerate(edges)]
+
+
+    def local(self,u):
+        # Wall time ticks of UTC ticks u
+        return u + self._offsets[bisect.bisect_right(self._edges,u)]
+
+
+    def utc(self,w):
+        # UTC ticks of wall time ticks w (fold=0)
+        return w - self._offsets[bisect.bisect_right(self._walls,w)]
+
+
+    def aware(self,u):
+        # DESCRIPTION:
+        #    The aware datetime in the zone for UTC ticks u, with fold set
+        #    on the second reading of an ambiguous wall time.
+        k = bisect.bisect_right(self._edges,u)
+        offset = self._offsets[k]
+        w = u + offset
+        fold = 0
+        if k > 0 and self._offsets[k-1] > offset and (
+           w < self._edges[k-1] + self._offsets[k-1]):
+            fold = 1
+        return _from_ticks(w,datetime.datetime).replace(tzinfo=self._zone,
+                                                        fold=fold)
+
+
+    def awares(self,values):
+        # DESCRIPTION:
+        #    aware() over an iterable of UTC ticks. Between transitions the
+        #    offset is constant, so each value is the previous one plus the
+        #    elapsed time and only the first value after a transition is
+        #    looked up.
+        edges,offsets = self._edges,self._offsets
+        first = last = 0 # Stretch [first, last) of the current base
+        base = based = None
+        for u in values:
+            if first <= u < last:
+                yield based + _TICK*(u - base)
+                continue
+            d = self.aware(u)
+            yield d
+            k = bisect.bisect_right(edges,u)
+            first = _NEG_INF if k == 0 else edges[k-1] + max(
+                    offsets[k-1] - offsets[k],0) # Skip the fold=1 stretch
+            last = _POS_INF if k == len(edges) else edges[k]
+            base,based = u,d
+
+
+def _pieces(values,lo,hi,forward,full):
+    # The (lo, hi) ticks of the ranges between successive values, as in
+    # Cycle._bounds
+    if full is True:
+        previous = next(values,None)
+        for v in values:
+            if forward:
+                yield previous,v - 1
+            else:
+                yield v + 1,previous
+            previous = v
+    elif forward:
+        current = lo
+        for v in values:
+            if v > current:
+                yield current,v - 1
+                current = v
+        yield current,hi
+    else:
+        current = hi
+        for v in values:
+            if v < current:
+                yield v + 1,current
+            current = v
+        yield lo,current
+
+
+"""A DateRange of instants, read and cycled in a timezone."""
+class ZonedDateRange:
+
+    __slots__ = ('_utc','_zone','_table')
+
+    def __init__(self,date1,date2=None,zone=None):
+        """Build a ZonedDateRange.
+
+        Args:
+            date1: datetime.datetime | None
+               One bound. Aware datetimes may be in any timezone; naive
+               ones are wall times in `zone`.
+            date2: [None] | datetime.datetime | None | datetime.timedelta
+               The other bound, or an elapsed (absolute) time from date1.
+            zone: [None] | datetime.tzinfo | str
+               The timezone to read the range in, e.g. a zoneinfo.ZoneInfo
+               or its key. By default the tzinfo of date1 (or date2).
+
+        Notes:
+            The bounds are held as instants (naive UTC ticks), so the range
+            covers the same stretch of time whichever zone it is read in.
+            As with DateRange, the bounds are reordered chronologically and
+            `None` is unbounded.
+
+        Raises:
+            TypeError: if the bounds are not datetimes, or are naive and no
+                zone is given.
+
+        Examples:
+            >>>ny = zoneinfo.ZoneInfo('America/New_York')
+            >>>r = ZonedDateRange(datetime(2012,3,1,tzinfo=ny),
+            ...                   datetime(2012,4,1,tzinfo=ny))
+            >>>list(r.days())[10]
+            datetime.datetime(2012, 3, 11, 0, 0, tzinfo=zoneinfo.ZoneInfo(key='America/New_York'))
+        """
+        if isinstance(zone,str):
+            zone = zoneinfo.ZoneInfo(zone)
+        if zone is None:
+            for d in (date1,date2):
+                if isinstance(d,datetime.datetime) and d.tzinfo is not None:
+                    zone = d.tzinfo
+                    break
+            else:
+                raise TypeError('Naive bounds need a zone')
+
+        lo = None if date1 is None else _utc_ticks(date1,zone)
+        if isinstance(date2,datetime.timedelta):
+            if lo is None:
+                raise TypeError('Cannot add a timedelta to an unbounded '+
+                    'bound')
+            hi = lo + _td_ticks(date2)
+        else:
+            hi = None if date2 is None else _utc_ticks(date2,zone)
+
+        if lo is not None and hi is not None and lo > hi:
+            lo,hi = hi,lo
+
+        self._utc = DateRange._fromticks(lo,hi,datetime.datetime)
+        self._zone = zone
+        self._table = None
+
+
+    @classmethod
+    def _fromticks(cls,lo,hi,zone,table=None):
+        # Build straight from ordered UTC ticks, sharing a transition table
+        zr = cls.__new__(cls)
+        zr._utc = DateRange._fromticks(lo,hi,datetime.datetime)
+        zr._zone = zone
+        zr._table = table
+        return zr
+
+
+    def _transitions(self):
+        # DESCRIPTION:
+        #    The zone's transition table over this range, built once.
+        #
+        # RAISES:
+        #    ValueError: if the range is unbounded
+        if self._table is None:
+            if self._utc._lo is None or self._utc._hi is None:
+                raise ValueError('Cannot cycle over an unbounded '+
+                    'ZonedDateRange')
+            self._table = _Transitions(self._zone,self._utc._lo,
+                                       self._utc._hi)
+        return self._table
+
+
+    def _aware(self,t):
+        # Aware datetime in the zone for UTC ticks t (None passes through)
+        if t is None:
+            return None
+        if self._table is not None:
+            return self._table.aware(t)
+        d = _from_ticks(t,datetime.datetime).replace(tzinfo=_UTC)
+        return d.astimezone(self._zone)
+
+
+    def start(self):
+        # DESCRIPTION:
+        #    Get the earliest bound as an aware datetime in the zone, or
+        #    None if unbounded.
+        return self._aware(self._utc._lo)
+
+
+    def end(self):
+        # DESCRIPTION:
+        #    Get the latest bound as an aware datetime in the zone, or None
+        #    if unbounded.
+        return self._aware(self._utc._hi)
+
+
+    def zone(self):
+        return self._zone
+
+
+    def utc(self):
+        # DESCRIPTION:
+        #    The same stretch of time as a DateRange of naive UTC datetimes.
+        return DateRange(self._utc)
+
+
+    def span(self):
+        # DESCRIPTION:
+        #    Elapsed time between start() and end(), counting the
+        #    resolution like DateRange.span. A day that loses an hour to
+        #    daylight saving time spans 23 hours.
+        return self._utc.span()
+
+
+    def __contains__(self,other):
+        # DESCRIPTION:
+        #    Check if an instant or ZonedDateRange is inside this one.
+        #
+        # PARAMS:
+        #    other: aware datetime.datetime | ZonedDateRange | None
+        #
+        # RAISES:
+        #    TypeError: if other is a naive datetime or another type
+        if isinstance(other,ZonedDateRange):
+            return other._utc in self._utc
+        if isinstance(other,datetime.datetime):
+            if other.tzinfo is None:
+                raise TypeError('Cannot compare a naive datetime to a '+
+                    'ZonedDateRange')
+            t = _utc_ticks(other,None)
+            lo,hi = self._utc._lo,self._utc._hi
+            return (lo is None or lo <= t) and (hi is None or t <= hi)
+        if other is None:
+            return self._utc._lo is None or self._utc._hi is None
+        raise TypeError('Cannot compare '+str(type(other))+
+            ' to a ZonedDateRange')
+
+
+    def contains(self,date):
+        return self.__contains__(date)
+
+
+    #----------------------------------------------------------------
+    #|                          Specials                            |
+    #----------------------------------------------------------------
+
+    def __str__(self):
+        start = self.start()
+        end = self.end()
+        if start is not None and end is not None:
+            return 'ZonedDateRange('+str(start)+' to '+str(end)+')'
+        elif start is not None:
+            return 'ZonedDateRange(Beginning on '+str(start)+')'
+        elif end is not None:
+            return 'ZonedDateRange(Ending on '+str(end)+')'
+        else:
+            return 'ZonedDateRange(All Dates, '+str(self._zone)+')'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    #----------------------------------------------------------------
+    #|        Generators for cycles inside of the DateRange         |
+    #----------------------------------------------------------------
+
+    def _instants(self,unit,n=0,snap=False,reverse=False,wall=True):
+        # DESCRIPTION:
+        #    UTC ticks of the values of a cycle.
+        #
+        # PARAMS:
+        #    unit: 'hours' | 'days' | 'months' | 'years'
+        #    [wall=True]: bool
+        #       If True, the cycle steps in wall time: the values are those
+        #       of the same cycle over a naive DateRange of the zone's wall
+        #       time, so days start at the same time of day whatever the
+        #       offset. A wall time skipped by a transition moves forward
+        #       to the same instant as the wall time before it plus the
+        #       step, and a repeated one is only yielded once. If False,
+        #       the cycle steps in absolute (UTC) time.
+        #
+        # RETURNS:
+        #    generator of int
+        #
+        # RAISES:
+        #    ValueError: if the range is unbounded or the flags are not
+        #                True or False
+        for flag,name in ((snap,'snap'),(reverse,'reverse'),(wall,'wall')):
+            if not (flag is True or flag is False):
+                raise ValueError(name+' must be True or False.')
+        table = self._transitions()
+        lo,hi = self._utc._lo,self._utc._hi
+
+        if wall is False:
+            cycle = Cycle(self._utc,unit,n=n,snap=snap,reverse=reverse)
+            for k in cycle._ks:
+                yield cycle._at(k)
+            return
+
+        local = DateRange._fromticks(table.local(lo),table.local(hi),
+                                     datetime.datetime)
+        cycle = Cycle(local,unit,snap=snap,reverse=reverse)
+        previous = None
+        count = 0
+        for k in cycle._ks:
+            u = table.utc(cycle._at(k))
+            if u < lo or u > hi:
+                continue
+            if previous is not None and (u >= previous if reverse else
+                                         u <= previous):
+                continue
+            yield u
+            previous = u
+            count += 1
+            if count == n:
+                return
+
+
+    def _cycle(self,unit,n,snap,reverse,wall):
+        # Aware datetimes of a cycle
+        return self._transitions().awares(
+            self._instants(unit,n=n,snap=snap,reverse=reverse,wall=wall))
+
+
+    def _rcycle(self,unit,n,snap,reverse,full,wall):
+        # ZonedDateRanges between successive values of a cycle, as in
+        # DateRange.rcycle
+        if not (full is False or full is True):
+            raise ValueError('full must be True or False.')
+        if n != 0:
+            n += 1
+        values = self._instants(unit,n=n,snap=snap,reverse=reverse,
+                                wall=wall)
+        table = self._table
+        for lo,hi in _pieces(values,self._utc._lo,self._utc._hi,
+                             not reverse,full):
+            yield ZonedDateRange._fromticks(lo,hi,self._zone,table)
+
+
+    def hours(self,n=0,reverse=False,wall=False):
+        # DESCRIPTION:
+        #    Generate aware datetimes one hour apart from start() (or end()
+        #    if reverse is True). By default hours are elapsed time, so a
+        #    day with a transition has 23 or 25 of them; with wall=True
+        #    they follow the clock. See _instants.
+        return self._cycle('hours',n,False,reverse,wall)
+
+
+    def days(self,n=0,snap=False,reverse=False,wall=True):
+        # DESCRIPTION:
+        #    Generate aware datetimes one day apart. By default they keep
+        #    the wall time of start() (or local midnight with snap) across
+        #    transitions. See _instants.
+        return self._cycle('days',n,snap,reverse,wall)
+
+
+    def months(self,n=0,snap=False,reverse=False,wall=True):
+        # DESCRIPTION:
+        #    Generate aware datetimes one calendar month apart, as
+        #    DateRange.months does in wall time. See _instants.
+        return self._cycle('months',n,snap,reverse,wall)
+
+
+    def years(self,n=0,snap=False,reverse=False,wall=True):
+        # DESCRIPTION:
+        #    Generate aware datetimes one calendar year apart, as
+        #    DateRange.years does in wall time. See _instants.
+        return self._cycle('years',n,snap,reverse,wall)
+
+
+    def rhours(self,n=0,reverse=False,full=False,wall=False):
+        return self._rcycle('hours',n,False,reverse,full,wall)
+
+
+    def rdays(self,n=0,snap=False,reverse=False,full=False,wall=True):
+        # DESCRIPTION:
+        #    Generate the ZonedDateRanges between successive days(), as
+        #    DateRange.rdays does. In wall time, a day with a transition
+        #    spans 23 or 25 hours.
+        return self._rcycle('days',n,snap,reverse,full,wall)
+
+
+    def rmonths(self,n=0,snap=False,reverse=False,full=False,wall=True):
+        return self._rcycle('months',n,snap,reverse,full,wall)
+
+
+    def ryears(self,n=0,snap=False,reverse=False,full=False,wall=True):
+        return self._rcycle('years',n,snap,reverse,full,wall)
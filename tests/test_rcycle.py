@@ -0,0 +1,127 @@
+# tests.test_rcycle
+# Range cycles and their output modes against a plain rcycle over date objects
+import datetime
+import random
+
+import numpy as np
+import pytest
+
+from eon import DateRange
+
+_UNITS = ('days','pentads','months','years')
+
+
+def _reference(dr,gen,reverse=False,full=False):
+    # The (start, end) pairs of dr.rcycle(gen,...), worked out with date
+    # objects and `in`, the way rcycle did before it used ticks
+    step = dr._resolution if reverse else -dr._resolution
+    first,last = (dr.end(),dr.start()) if reverse else (dr.start(),dr.end())
+    values = iter(gen)
+
+    value = next(values,None)
+    if value is None:
+        return [] if full else [(first,last)]
+    if full:
+        start,following = value,next(values,None)
+        if following is None:
+            return []
+    elif value == first:
+        start,following = first,next(values,None)
+        if following is None:
+            return [(start,last)]
+    else:
+        start,following = first,value
+
+    end = following + step
+    if end not in dr:
+        return [] if full else [(first,last)]
+    pairs = []
+    while end in dr:
+        pairs.append((start,end))
+        start,following = following,next(values,None)
+        if following is None:
+            if not full and start in dr:
+                pairs.append((start,last))
+            break
+        end = following + step
+    return pairs
+
+
+def _ordered(pairs):
+    # DateRange sorts its bounds, so compare pairs the same way
+    return [(a,b) if a is None or b is None or a <= b else (b,a)
+            for a,b in pairs]
+
+
+def _ranges(seed,count):
+    # Random bounded ranges of dates and datetimes a few days to a few
+    # years long
+    rng = random.Random(seed)
+    out = []
+    for _ in range(count):
+        start = datetime.datetime(2000,1,1) + datetime.timedelta(
+            days=rng.randrange(20*365),
+            seconds=rng.choice((0,rng.randrange(86400))))
+        length = datetime.timedelta(days=rng.choice((3,40,400,1500)),
+                                    seconds=rng.randrange(86400))
+        if rng.random() < 0.5:
+            out.append(DateRange(start.date(),(start + length).date()))
+        else:
+            out.append(DateRange(start,start + length))
+    return out
+
+
+def _cases(seed=20121,count=60):
+    rng = random.Random(seed)
+    for dr in _ranges(seed,count):
+        unit = rng.choice(_UNITS)
+        if unit == 'days' and dr.end() - dr.start() > datetime.timedelta(400):
+            unit = 'months'
+        snap,reverse,full = (rng.random() < 0.5 for _ in range(3))
+        yield dr,unit,snap,reverse,full
+
+
+def _expected(dr,unit,snap,reverse,full):
+    gen = getattr(dr,unit)(snap=snap,reverse=reverse)
+    return _ordered(_reference(dr,gen,reverse,full))
+
+
+@pytest.mark.parametrize('dr,unit,snap,reverse,full',list(_cases()))
+def test_ranges_match_reference(dr,unit,snap,reverse,full):
+    got = getattr(dr,'r'+unit)(snap=snap,reverse=reverse,full=full)
+    expected = _expected(dr,unit,snap,reverse,full)
+    assert [(r.start(),r.end()) for r in got] == expected
+    gen = getattr(dr,unit)(snap=snap,reverse=reverse)
+    got = dr.rcycle(gen,snap=snap,reverse=reverse,full=full)
+    assert [(r.start(),r.end()) for r in got] == expected
+
+
+@pytest.mark.parametrize('dr,unit,snap,reverse,full',list(_cases()))
+def test_bounds_match_reference(dr,unit,snap,reverse,full):
+    got = getattr(dr,'r'+unit)(snap=snap,reverse=reverse,full=full,
+                               bounds=True)
+    assert _ordered(got) == _expected(dr,unit,snap,reverse,full)
+
+
+@pytest.mark.parametrize('size',[1,7,1000])
+@pytest.mark.parametrize('dr,unit,snap,reverse,full',list(_cases(count=20)))
+def test_out_matches_reference(dr,unit,snap,reverse,full,size):
+    dtype = ('datetime64[us]' if dr._dateclass is datetime.datetime else
+             'datetime64[D]')
+    starts,ends = np.empty(size,dtype),np.empty(size,dtype)
+    got = []
+    for rows in getattr(dr,'r'+unit)(snap=snap,reverse=reverse,full=full,
+                                     out=(starts,ends)):
+        assert 0 < rows <= size
+        got.extend(zip(starts[:rows].tolist(),ends[:rows].tolist()))
+    assert _ordered(got) == _expected(dr,unit,snap,reverse,full)
+
+
+def test_out_rcycle_of_a_generator():
+    dr = DateRange(datetime.date(2012,1,3),datetime.date(2012,3,20))
+    starts = np.empty(4,'datetime64[D]')
+    ends = np.empty(4,'datetime64[D]')
+    got = []
+    for rows in dr.rcycle(dr.days(snap=True),out=(starts,ends)):
+        got.extend(zip(starts[:rows].tolist(),ends[:rows].tolist()))
+    assert got == [(r.start(),r.end()) for r in dr.rdays()]
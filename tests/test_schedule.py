@@ -0,0 +1,201 @@
+# tests.test_schedule
+# Scheduler jobs driven by a FakeClock
+import datetime
+
+import pytest
+
+from eon import DateRange
+from eon.schedule import FakeClock, Scheduler
+
+_HOUR = datetime.timedelta(hours=1)
+_START = datetime.datetime(2012,1,1)
+
+
+def _scheduler(**kwargs):
+    clock = FakeClock(_START)
+    return clock,Scheduler(clock=clock,**kwargs)
+
+
+def test_jobs_fire_in_time_order():
+    clock,s = _scheduler()
+    fired = []
+    s.add(DateRange(_START,None),'hours',lambda v: fired.append(('a',v)))
+    s.add(DateRange(_START + datetime.timedelta(minutes=30),None),
+          datetime.timedelta(minutes=45),lambda v: fired.append(('b',v)))
+    s.start()
+    clock.advance(2*_HOUR)
+
+    expected = ([('a',v) for v in DateRange(_START,_START + 2*_HOUR).hours()]+
+                [('b',v) for v in DateRange(_START + datetime.timedelta(
+                    minutes=30),_START + 2*_HOUR).cycles(
+                        datetime.timedelta(minutes=45))])
+    # Values due at the same moment fire in the order their jobs were added
+    expected.sort(key=lambda e: (e[1],e[0]))
+    assert fired == expected
+    assert len(s) == 2
+
+
+def test_nothing_fires_before_start():
+    clock,s = _scheduler()
+    fired = []
+    s.add(DateRange(_START,None),'hours',fired.append)
+    clock.advance(3*_HOUR)
+    assert fired == []
+
+
+def test_next_fire_and_after():
+    clock,s = _scheduler()
+    hourly = s.add(DateRange(_START,None),'hours',print)
+    later = s.add(DateRange(_START + datetime.timedelta(minutes=30),None),
+                  datetime.timedelta(minutes=45),print)
+    assert hourly.next_fire() == _START
+    assert later.next_fire() == _START + datetime.timedelta(minutes=30)
+    assert s.next_fire() == _START
+    assert hourly.after(datetime.datetime(2012,1,1,5,10)) == \
+        datetime.datetime(2012,1,1,6)
+    assert hourly.after(datetime.datetime(2012,1,1,5)) == \
+        datetime.datetime(2012,1,1,6)
+    assert later.after(_START) == _START + datetime.timedelta(minutes=30)
+
+    s.start()
+    clock.advance(datetime.timedelta(minutes=20))
+    assert hourly.next_fire() == _START + _HOUR
+    assert s.next_fire() == _START + datetime.timedelta(minutes=30)
+
+
+@pytest.mark.parametrize('catchup,expected',[
+    ('all',[0,1,2,3,4]),
+    ('last',[0,4]),
+    ('skip',[0,3,4]),
+])
+def test_catchup(catchup,expected):
+    clock,s = _scheduler(catchup=catchup,grace=datetime.timedelta(minutes=90))
+    fired = []
+    s.add(DateRange(_START,None),'hours',fired.append)
+    s.start()
+    clock.advance(datetime.timedelta(minutes=10))
+    # Miss the values at 1:00 to 4:00 while stopped
+    s.stop()
+    clock.advance(4*_HOUR)
+    s.start()
+    clock.advance(datetime.timedelta(0))
+    assert fired == [_START + h*_HOUR for h in expected]
+
+
+def test_catchup_per_job():
+    clock,s = _scheduler(catchup='last')
+    fired = []
+    s.add(DateRange(_START,None),'hours',fired.append,catchup='all')
+    s.stop()
+    clock.advance(3*_HOUR)
+    s.start()
+    clock.advance(datetime.timedelta(0))
+    assert fired == [_START + h*_HOUR for h in range(4)]
+
+
+def test_catchup_invalid():
+    with pytest.raises(ValueError):
+        _scheduler(catchup='some')
+    clock,s = _scheduler()
+    with pytest.raises(ValueError):
+        s.add(DateRange(_START,None),'hours',print,catchup='some')
+
+
+def test_cancel():
+    clock,s = _scheduler()
+    fired = []
+    kept = s.add(DateRange(_START,None),'hours',lambda v: fired.append(1))
+    gone = s.add(DateRange(_START,None),'hours',lambda v: fired.append(2))
+    s.start()
+    clock.advance(datetime.timedelta(0))
+    gone.cancel()
+    gone.cancel()
+    clock.advance(2*_HOUR)
+    assert fired == [1,2,1,1]
+    assert gone.done() and gone.next_fire() is None
+    assert not kept.done()
+    assert len(s) == 1
+
+
+def test_cancel_rebuilds_heap_lazily():
+    clock,s = _scheduler()
+    fired = []
+    jobs = [s.add(DateRange(_START + h*_HOUR,None),'days',fired.append)
+            for h in range(10)]
+    # Cancel from the back, so the stale entries stay below the top of
+    # the heap until most of it is stale
+    for job in jobs[:4:-1]:
+        job.cancel()
+    assert len(s) == 5
+    assert len(s._heap) == 10
+    jobs[4].cancel()
+    assert len(s) == 4
+    assert len(s._heap) == 4
+
+    s.start()
+    clock.advance(datetime.timedelta(days=1))
+    assert fired == [_START + h*_HOUR for h in range(4)]+[
+                     _START + datetime.timedelta(days=1)]
+
+
+def test_cancel_from_another_scheduler():
+    clock,s = _scheduler()
+    job = s.add(DateRange(_START,None),'hours',print)
+    with pytest.raises(ValueError):
+        Scheduler(clock=clock).cancel(job)
+
+
+def test_n_limits_fires():
+    clock,s = _scheduler()
+    fired = []
+    dr = DateRange(_START + _HOUR,None)
+    job = s.add(dr,'hours',fired.append,n=3)
+    s.start()
+    clock.advance(datetime.timedelta(days=1))
+    assert fired == list(dr.hours(n=3))
+    assert job.done() and job.next_fire() is None
+    assert len(s) == 0 and s.next_fire() is None
+
+
+def test_bounded_range_runs_out():
+    clock,s = _scheduler()
+    fired = []
+    dr = DateRange(_START,_START + 3*_HOUR)
+    job = s.add(dr,'hours',fired.append)
+    s.start()
+    clock.advance(datetime.timedelta(days=1))
+    assert fired == list(dr.hours())
+    assert job.done()
+    assert job.after(_START + 3*_HOUR) is None
+
+
+def test_snapped_months_of_dates():
+    clock,s = _scheduler()
+    fired = []
+    dr = DateRange(datetime.date(2012,1,15),datetime.date(2012,6,1))
+    job = s.add(dr,'months',fired.append,snap=True)
+    # Dates fire at their midnight
+    assert job.next_fire() == datetime.date(2012,2,1)
+    assert job.after(datetime.date(2012,3,3)) == datetime.date(2012,4,1)
+    s.start()
+    clock.advance(datetime.timedelta(days=200))
+    expected = list(dr.months(snap=True))
+    assert fired == [d for d in expected if d >= _START.date()]
+    assert fired[0] == datetime.date(2012,2,1)
+    assert all(d.day == 1 for d in fired)
+
+
+def test_values_before_now_do_not_fire():
+    clock,s = _scheduler()
+    clock.advance(datetime.timedelta(minutes=150))
+    fired = []
+    s.add(DateRange(_START,None),'hours',fired.append)
+    s.start()
+    clock.advance(_HOUR)
+    assert fired == [datetime.datetime(2012,1,1,3)]
+
+
+def test_fake_clock_cannot_go_back():
+    clock = FakeClock(_START)
+    with pytest.raises(ValueError):
+        clock.advance(-_HOUR)